@@ -2,6 +2,10 @@
 ASGI config for flowmotion project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The /api/events/ Server-Sent Events stream needs it, e.g.
+``gunicorn flowmotion.asgi:application -k uvicorn.workers.UvicornWorker``
+(uvicorn is in requirements.txt), or ``uvicorn flowmotion.asgi:application``
+on its own.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'services.ai_client.ai_deadline_middleware',
 ]
 
 ROOT_URLCONF = 'flowmotion.urls'
@@ -90,6 +91,59 @@ DATABASES = {
     }
 }
 
+# File-based so every gunicorn worker on the host sees the same entries. The file
+# cache culls 1/CULL_FREQUENCY of its files at random once it holds MAX_ENTRIES, so
+# 'default' (sessions, per-user data versions and reminder schedules, about five
+# entries per active user) is sized from CACHE_USERS, and the fast-churning cached
+# API responses live in their own 'api' cache where culling cannot evict the others.
+CACHE_DIR = os.environ.get('CACHE_DIR', str(BASE_DIR / '.django_cache'))
+CACHE_USERS = int(os.environ.get('CACHE_USERS', 2000))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': CACHE_USERS * 5, 'CULL_FREQUENCY': 10},
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'api'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': CACHE_USERS * 10, 'CULL_FREQUENCY': 3},
+    },
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Where reminders are delivered; see habits/dispatcher.py for the available sinks.
+# Other sinks: habits.dispatcher.LogFileSink (PATH), habits.dispatcher.WebhookSink (URL)
+NOTIFICATION_SINKS = [
+    {'BACKEND': 'habits.dispatcher.NotifySendSink', 'TIMEOUT': 5, 'WORKERS': 2},
+    {'BACKEND': 'habits.dispatcher.InboxSink', 'BATCH_SIZE': 100},
+]
+# Reminders of one user firing together are merged into a single digest
+# notification from this many upwards; 0 disables digests
+NOTIFICATION_DIGEST_THRESHOLD = int(os.environ.get('NOTIFICATION_DIGEST_THRESHOLD', 3))
+# AI-written reminder texts are cached in the database (habits/message_cache.py),
+# bounded to this many habit-days (today's and tomorrow's are always kept); the next
+# day's texts are generated at this hour
+NOTIFICATION_MESSAGE_CACHE_SIZE = int(os.environ.get('NOTIFICATION_MESSAGE_CACHE_SIZE', 10000))
+NOTIFICATION_PREWARM_HOUR = int(os.environ.get('NOTIFICATION_PREWARM_HOUR', 3))
+
+# AI provider calls (services/ai_client.py): at most AI_MAX_CONCURRENCY at once and
+# AI_REQUEST_BUDGET seconds in total per web request; an endpoint falls back for
+# AI_RESET_TIMEOUT seconds after AI_FAILURE_THRESHOLD failed or slow calls (taking more
+# than AI_SLOW_CALL_FRACTION of their timeout)
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 8))
+AI_REQUEST_BUDGET = float(os.environ.get('AI_REQUEST_BUDGET', 8))
+AI_FAILURE_THRESHOLD = 3
+AI_RESET_TIMEOUT = 30
+AI_SLOW_CALL_FRACTION = 0.8
+# Suggestions and tool recommendations are shared between users with the same
+# (normalized) habit name for AI_CACHE_TTL seconds, up to AI_CACHE_SIZE responses
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 30 * 24 * 60 * 60))
+AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', 5000))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -0,0 +1,180 @@
+"""
+Cross-user cache of AI suggestions and tool recommendations.
+Many users create habits with the same name ("Drink water", "Gym"), and the
+prompts built from them only differ in wording details. Responses are stored
+in the AIResponseCache table under a hash of the kind of call, the model and
+the normalized habit name (case, punctuation, whitespace and simple plural or
+verb endings removed), so every user and process shares them. Rows expire
+after settings.AI_CACHE_TTL seconds and the table is bounded to
+settings.AI_CACHE_SIZE rows, least recently used first out. Reads do not
+write: a row's last_used and hit count are only updated every TOUCH_INTERVAL.
+Hits, misses and the provider time saved are summed in memory and added to
+the AICacheCounter rows with atomic updates at most every
+STATS_FLUSH_INTERVAL seconds per process.
+"""
+import hashlib
+import re
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import AICacheCounter, AIResponseCache
+
+CACHE_TTL = 30 * 24 * 60 * 60
+CACHE_SIZE = 5000
+STATS = ('hits', 'misses', 'saved_ms')
+# A hit only rewrites last_used (and adds the hits since the last write) when
+# it is older than this, so hot rows do not cost a write per read
+TOUCH_INTERVAL = timedelta(minutes=10)
+STATS_FLUSH_INTERVAL = 60
+
+_pending_lock = threading.Lock()
+_pending_stats = dict.fromkeys(STATS, 0)
+# AIResponseCache id -> hits not written to the row yet
+_pending_hits = {}
+_last_flush = time.monotonic()
+
+
+def delete_least_recent(queryset, keep):
+    """Delete all but the `keep` most recently used rows of `queryset`. Returns how many were deleted."""
+    # The newest row that falls outside the bound; it and everything older goes
+    rows = queryset.order_by('-last_used', '-id').values_list('last_used', 'id')
+    cutoff = next(iter(rows[keep:keep + 1]), None)
+    if cutoff is None:
+        return 0
+    last_used, row_id = cutoff
+    deleted, _ = queryset.filter(Q(last_used__lt=last_used) | Q(last_used=last_used, id__lte=row_id)).delete()
+    return deleted
+
+
+def _stem(word):
+    for suffix, replacement in (('ies', 'y'), ('ing', ''), ('ed', ''), ('es', ''), ('s', '')):
+        if word.endswith(suffix) and not word.endswith('ss') and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def normalize_prompt(text):
+    """'  Drinking Water! ' and 'drink waters' both become 'drink water'."""
+    return ' '.join(_stem(word) for word in re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+
+def prompt_key(kind, model, text):
+    return hashlib.sha256(f"{kind}\n{model}\n{normalize_prompt(text)}".encode()).hexdigest()
+
+
+def _count(name, amount=1):
+    with _pending_lock:
+        _pending_stats[name] += amount
+        due = time.monotonic() - _last_flush >= STATS_FLUSH_INTERVAL
+    if due:
+        flush_ai_cache_stats()
+
+
+def flush_ai_cache_stats():
+    """Add the counts this process has not written yet to the shared counters."""
+    global _last_flush
+    with _pending_lock:
+        pending = {name: amount for name, amount in _pending_stats.items() if amount}
+        _pending_stats.update(dict.fromkeys(STATS, 0))
+        _last_flush = time.monotonic()
+    for name, amount in pending.items():
+        if not AICacheCounter.objects.filter(name=name).update(value=F('value') + amount):
+            _, created = AICacheCounter.objects.get_or_create(name=name, defaults={'value': amount})
+            if not created:
+                AICacheCounter.objects.filter(name=name).update(value=F('value') + amount)
+
+
+def lookup(key, now=None):
+    """Cached response for `key`, or None when missing or expired."""
+    if now is None:
+        now = timezone.now()
+    entry = AIResponseCache.objects.filter(key=key, expires_at__gt=now).only('id', 'response', 'latency_ms', 'last_used').first()
+    if entry is None:
+        return None
+    with _pending_lock:
+        hits = _pending_hits.pop(entry.pk, 0) + 1
+        if now - entry.last_used <= TOUCH_INTERVAL:
+            if len(_pending_hits) >= getattr(settings, 'AI_CACHE_SIZE', CACHE_SIZE):
+                # Mostly rows deleted since; their counts are lost either way
+                _pending_hits.clear()
+            _pending_hits[entry.pk] = hits
+            hits = 0
+    if hits:
+        AIResponseCache.objects.filter(pk=entry.pk).update(last_used=now, hits=F('hits') + hits)
+    _count('hits')
+    _count('saved_ms', entry.latency_ms)
+    return entry.response
+
+
+def store(key, kind, model, text, response, latency_ms, now=None):
+    if now is None:
+        now = timezone.now()
+    ttl = getattr(settings, 'AI_CACHE_TTL', CACHE_TTL)
+    try:
+        AIResponseCache.objects.update_or_create(key=key, defaults={
+            'kind': kind, 'model': model, 'prompt': normalize_prompt(text)[:200], 'response': response,
+            'latency_ms': latency_ms, 'hits': 0, 'expires_at': now + timedelta(seconds=ttl), 'last_used': now,
+        })
+    except IntegrityError:
+        # Another process stored the same prompt first
+        return
+    AIResponseCache.objects.filter(expires_at__lte=now).delete()
+    delete_least_recent(AIResponseCache.objects.all(), getattr(settings, 'AI_CACHE_SIZE', CACHE_SIZE))
+
+
+def cached_ai_response(kind, model, fallback=None):
+    """
+    Serve a function of (habit_name, ...) from the shared cache, keyed by
+    `kind`, `model` and the normalized first argument. Results equal to
+    `fallback(*args)` (what the function returns when the provider fails)
+    and empty results are not stored.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(text, *args, **kwargs):
+            key = prompt_key(kind, model, text)
+            cached = lookup(key)
+            if cached is not None:
+                return cached
+
+            _count('misses')
+            started = time.monotonic()
+            result = func(text, *args, **kwargs)
+            latency_ms = int((time.monotonic() - started) * 1000)
+            if result and (fallback is None or result != fallback(text, *args, **kwargs)):
+                store(key, kind, model, text, result, latency_ms)
+            return result
+        return wrapper
+    return decorator
+
+
+def ai_cache_stats():
+    """
+    Hit rate and provider time saved since the counters were last reset,
+    plus the current table size. Other processes' latest counts show up
+    within STATS_FLUSH_INTERVAL.
+    """
+    flush_ai_cache_stats()
+    values = dict(AICacheCounter.objects.filter(name__in=STATS).values_list('name', 'value'))
+    hits, misses, saved_ms = (values.get(name, 0) for name in STATS)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0,
+        'saved_seconds': round(saved_ms / 1000, 1),
+        'entries': AIResponseCache.objects.filter(expires_at__gt=timezone.now()).count(),
+    }
+
+
+def reset_ai_cache_stats():
+    global _last_flush
+    with _pending_lock:
+        _pending_stats.update(dict.fromkeys(STATS, 0))
+        _last_flush = time.monotonic()
+    AICacheCounter.objects.filter(name__in=STATS).delete()
@@ -1,11 +1,17 @@
 import os
 import json
-import requests
+from services.ai_client import AIUnavailable, post_json
+from .ai_cache import cached_ai_response
 
 # Use a pure-python request based approach to avoid complex binary dependency issues (grpcio/pydantic-core)
 # in this environment. This ensures the app stays running while still providing AI features.
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+# Overridable so a local stub server can stand in for Gemini
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+# Habit names packed into one generate_notification_messages_batch() prompt
+NOTIFICATION_BATCH_SIZE = 25
+NOTIFICATION_LABELS = {"PreReminder": "pre_reminder", "OnTime": "on_time", "Overdue": "overdue"}
 
 def get_emotional_feedback(habit_name, completed, streak_count):
     """
@@ -17,7 +23,7 @@ def get_emotional_feedback(habit_name, completed, streak_count):
         return f"Don't worry, you'll get {habit_name} next time. Stay focused! 🎯"
 
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
+        url = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
         
         status = "just completed" if completed else "missed"
         prompt = f"""
@@ -37,8 +43,7 @@ def get_emotional_feedback(habit_name, completed, streak_count):
             }]
         }
         
-        response = requests.post(url, json=payload, timeout=5)
-        data = response.json()
+        data = post_json('gemini', url, payload)
         
         feedback = data['candidates'][0]['content']['parts'][0]['text'].strip()
         
@@ -51,6 +56,7 @@ def get_emotional_feedback(habit_name, completed, streak_count):
             return f"Excellent work on {habit_name}! You're doing great. 🌟"
         return f"Tomorrow is a new day to conquer {habit_name}. You've got this! 💪"
 
+@cached_ai_response('recommendations', 'gemini-2.0-flash', fallback=lambda task_text: get_fallback_recommendations(task_text))
 def get_ai_recommendations(task_text):
     """
     Based on the user's task, recommend 3 relevant AI tools using Gemini.
@@ -61,7 +67,7 @@ def get_ai_recommendations(task_text):
 
     print(f"DEBUG: get_ai_recommendations called for task: {task_text}")
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
+        url = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
         
         prompt = f"""
 You are an AI tool recommendation engine.
@@ -93,9 +99,8 @@ Format:
         }
         
         try:
-            print("DEBUG: Calling Gemini API (Attempt 1)...")
-            response = requests.post(url, json=payload, timeout=10)
-            data = response.json()
+            print("DEBUG: Calling Gemini API...")
+            data = post_json('gemini', url, payload, retries=1)
             
             if 'candidates' not in data or not data['candidates']:
                 print(f"DEBUG: No candidates in Gemini response: {data}")
@@ -103,14 +108,8 @@ Format:
 
             text = data['candidates'][0]['content']['parts'][0]['text'].strip()
         except Exception as e:
-            print(f"DEBUG: Gemini API Attempt 1 failed: {e}. Retrying once...")
-            try:
-                response = requests.post(url, json=payload, timeout=10)
-                data = response.json()
-                text = data['candidates'][0]['content']['parts'][0]['text'].strip()
-            except Exception as retry_e:
-                print(f"DEBUG: Gemini API Retry failed: {retry_e}")
-                return get_fallback_recommendations(task_text)
+            print(f"DEBUG: Gemini API call failed: {e}")
+            return get_fallback_recommendations(task_text)
 
         print(f"DEBUG: Raw Gemini response: {text}")
 
@@ -178,16 +177,21 @@ def get_fallback_recommendations(task_text):
         {"name": "Claude", "description": "Advanced AI assistant for writing and analysis", "url": "https://claude.ai/"}
     ]
 
+def get_fallback_suggestions():
+    return {
+        "category": "General",
+        "suggested_tools": [],
+        "estimated_time": "30 minutes"
+    }
+
+# Keyed by the habit name alone: the description rarely changes the category, tools or time
+@cached_ai_response('suggestions', 'gemini-2.5-flash', fallback=lambda habit_name, habit_description: get_fallback_suggestions())
 def get_habit_suggestions(habit_name, habit_description):
     if not GOOGLE_API_KEY:
-        return {
-            "category": "General",
-            "suggested_tools": [],
-            "estimated_time": "30 minutes"
-        }
+        return get_fallback_suggestions()
 
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
+        url = f"{GEMINI_API_BASE}/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
         
         prompt = f"""
         Analyze this habit/task:
@@ -208,8 +212,7 @@ def get_habit_suggestions(habit_name, habit_description):
             }]
         }
         
-        response = requests.post(url, json=payload, timeout=10)
-        data = response.json()
+        data = post_json('gemini', url, payload)
         
         text = data['candidates'][0]['content']['parts'][0]['text']
         # Remove any potential markdown formatting
@@ -218,11 +221,14 @@ def get_habit_suggestions(habit_name, habit_description):
         return json.loads(text)
     except Exception as e:
         print(f"AI Suggestion Error: {e}")
-        return {
-            "category": "General",
-            "suggested_tools": [],
-            "estimated_time": "30 minutes"
-        }
+        return get_fallback_suggestions()
+
+def notification_fallbacks(habit_name):
+    return {
+        "pre_reminder": f"Ready for {habit_name}? It starts in five minutes.",
+        "on_time": f"It is time for {habit_name}. Let us get started!",
+        "overdue": f"Your {habit_name} is waiting for you. You can still complete it!"
+    }
 
 def generate_notification_messages(habit_name):
     """
@@ -230,17 +236,13 @@ def generate_notification_messages(habit_name):
     for a habit using Gemini AI.
     """
     # Fallback messages if API key is missing or call fails
-    fallbacks = {
-        "pre_reminder": f"Ready for {habit_name}? It starts in five minutes.",
-        "on_time": f"It is time for {habit_name}. Let us get started!",
-        "overdue": f"Your {habit_name} is waiting for you. You can still complete it!"
-    }
+    fallbacks = notification_fallbacks(habit_name)
 
     if not GOOGLE_API_KEY:
         return fallbacks
 
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
+        url = f"{GEMINI_API_BASE}/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
         
         prompt = f"""
         Generate three dynamic, emotionally resonant notification messages for the habit "{habit_name}" following the Duolingo style (varied, slightly persistent, but motivating).
@@ -269,8 +271,7 @@ def generate_notification_messages(habit_name):
             }]
         }
         
-        response = requests.post(url, json=payload, timeout=10)
-        data = response.json()
+        data = post_json('gemini', url, payload)
         
         text = data['candidates'][0]['content']['parts'][0]['text'].strip()
         
@@ -292,3 +293,91 @@ def generate_notification_messages(habit_name):
     except Exception as e:
         print(f"AI Notification Gen Error: {e}")
         return fallbacks
+
+def generate_notification_messages_batch(habit_names, batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Same messages as generate_notification_messages() for many habits, asking
+    for up to `batch_size` habits per Gemini call. Returns {habit_name: messages}.
+    Habits missing from an otherwise valid reply get the fallback messages; a
+    batch whose reply fails or cannot be parsed is split in half and retried,
+    down to single habits. While Gemini is unavailable (breaker open, no
+    budget left) the remaining habits get the fallback messages at once.
+    """
+    names = list(dict.fromkeys(habit_names))
+    if not GOOGLE_API_KEY:
+        return {name: notification_fallbacks(name) for name in names}
+
+    results = {}
+    for start in range(0, len(names), batch_size):
+        _generate_notification_batch(names[start:start + batch_size], results)
+    return results
+
+def _generate_notification_batch(names, results):
+    try:
+        replies = _request_notification_batch(names)
+    except AIUnavailable as e:
+        # Splitting would only pile more calls onto a provider that is down
+        print(f"AI Notification Batch Skipped ({len(names)} habits): {e}")
+        for name in names:
+            results[name] = notification_fallbacks(name)
+        return
+    except Exception as e:
+        print(f"AI Notification Batch Error ({len(names)} habits): {e}")
+        if len(names) == 1:
+            results[names[0]] = notification_fallbacks(names[0])
+            return
+        middle = len(names) // 2
+        _generate_notification_batch(names[:middle], results)
+        _generate_notification_batch(names[middle:], results)
+        return
+
+    for number, name in enumerate(names, start=1):
+        reply = replies.get(str(number))
+        messages = notification_fallbacks(name)
+        if isinstance(reply, dict):
+            for label, key in NOTIFICATION_LABELS.items():
+                if isinstance(reply.get(label), str) and reply[label].strip():
+                    messages[key] = reply[label].strip()
+        results[name] = messages
+
+def _request_notification_batch(names):
+    """One Gemini call for several habits; returns the parsed {"1": {...}, ...} reply."""
+    url = f"{GEMINI_API_BASE}/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
+    habits = "\n".join(f"{number}. {name}" for number, name in enumerate(names, start=1))
+    prompt = f"""
+    Generate three dynamic, emotionally resonant notification messages for each of these habits, following the Duolingo style (varied, slightly persistent, but motivating).
+
+    Habits:
+    {habits}
+
+    Return ONLY a JSON object keyed by the habit number, in this format:
+    {{"1": {{"PreReminder": "<message>", "OnTime": "<message>", "Overdue": "<message>"}}}}
+
+    Scenarios:
+    1. PreReminder (5m before): Gently prepare the user. Friendly and motivating.
+    2. OnTime (Exact time): Direct call to action. Clear and encouraging.
+    3. Overdue (5m after, if not done): Nudge without shaming. Supportive and slightly urgent.
+
+    Rules:
+    - No emojis. No markdown. Plain text only.
+    - Naturally include the habit name in its messages.
+    - Under 15 words each.
+    - Use dynamic emotional text.
+    """
+
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {"responseMimeType": "application/json"}
+    }
+
+    # Own breaker: long batch calls must not trip the one guarding interactive calls
+    data = post_json('gemini-batch', url, payload, timeout=10 + len(names))
+    text = data['candidates'][0]['content']['parts'][0]['text'].strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    replies = json.loads(text)
+    if not isinstance(replies, dict):
+        raise ValueError("batch reply is not a JSON object")
+    return replies
@@ -0,0 +1,153 @@
+"""
+Per-user response cache for the JSON API.
+Every user has a data version stored in the cache. Cached responses are keyed
+by that version, so bumping it on any write (see signals.py) invalidates all
+of the user's cached API responses at once without tracking individual keys.
+Writes bump the version once their transaction commits (bump_after_commit),
+so a request running in between cannot cache pre-write data under the new
+version.
+The same version doubles as the ETag source for conditional GETs, so an
+unchanged poll is answered with a 304 before the view runs at all.
+Responses are stored in the 'api' cache, apart from the versions in the
+default one, so response churn never culls a version.
+"""
+import hashlib
+import time
+import uuid
+from datetime import date, datetime, time as dt_time
+from functools import wraps
+from django.contrib import messages
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+VERSION_KEY = 'flowmotion:data-version:{user_id}'
+MODIFIED_KEY = 'flowmotion:data-modified:{user_id}'
+RESPONSE_KEY = 'flowmotion:api:{user_id}:{version}:{day}:{path}'
+RESPONSE_TIMEOUT = 300
+
+
+def get_data_version(user_id):
+    """Current data version for a user, initialised on first use."""
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    """Invalidate every cached API response for a user."""
+    cache.set(MODIFIED_KEY.format(user_id=user_id), timezone.now(), timeout=None)
+    # A fresh random version instead of cache.incr(), which is not atomic on
+    # the file cache: concurrent bumps may overwrite each other, but every
+    # one of them moves the user off the old version.
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY.format(user_id=user_id), version, timeout=None)
+    return version
+
+
+def bump_after_commit(user_ids):
+    """
+    Bump the data versions of `user_ids` once the current transaction
+    commits (right away outside one), when every write in it is final.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def bump():
+        for user_id in user_ids:
+            bump_data_version(user_id)
+    transaction.on_commit(bump)
+
+
+def cached_api(view):
+    """
+    Serve successful GET responses of a login_required JSON view from the
+    cache until the user's data version changes.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+
+        key = RESPONSE_KEY.format(
+            user_id=request.user.pk,
+            version=get_data_version(request.user.pk),
+            day=date.today().isoformat(),
+            path=hashlib.md5(request.get_full_path().encode()).hexdigest(),
+        )
+        cached = caches['api'].get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            caches['api'].set(key, (response.content, response['Content-Type']), RESPONSE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def get_last_modified(user_id):
+    """
+    When the user's data last changed, never earlier than today's midnight
+    since day-dependent responses change when the date does.
+    """
+    midnight = timezone.make_aware(datetime.combine(date.today(), dt_time.min))
+    modified = cache.get(MODIFIED_KEY.format(user_id=user_id))
+    return max(modified, midnight) if modified else midnight
+
+
+def _has_messages(request):
+    # len() loads the pending messages without marking them as seen
+    return bool(len(messages.get_messages(request)))
+
+
+def make_etag(*parts):
+    """Strong ETag value from a sequence of change markers."""
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def user_data_etag(request, bucket=None, page=False):
+    """
+    ETag for a response that depends only on the user's habit data, the date,
+    the full path and, when `bucket` is given, the current `bucket`-second
+    slot. For HTML pages returns None (no conditional handling) while flash
+    messages are pending so they are not swallowed by a 304.
+    """
+    if page and _has_messages(request):
+        return None
+    parts = [
+        request.user.pk,
+        get_data_version(request.user.pk),
+        date.today().isoformat(),
+        request.get_full_path(),
+        # Pages embed the CSRF token, which rotates on login
+        request.META.get('CSRF_COOKIE', ''),
+    ]
+    if bucket:
+        parts.append(int(time.time() // bucket))
+    return make_etag(*parts)
+
+
+def conditional_user_data(bucket=None, page=False):
+    """
+    Conditional GET for a login_required view whose output is derived from
+    the user's habit data. Time-dependent views pass `bucket` (seconds) so
+    their ETag also rolls over with the clock; they do not send
+    Last-Modified, which cannot express that. Template views pass `page`.
+    """
+    def etag_func(request, *args, **kwargs):
+        return user_data_etag(request, bucket, page)
+
+    def last_modified_func(request, *args, **kwargs):
+        if bucket or (page and _has_messages(request)):
+            return None
+        return get_last_modified(request.user.pk)
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
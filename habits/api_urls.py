@@ -7,6 +7,8 @@ urlpatterns = [
     path('habits/<uuid:habit_id>/', api_views.habit_detail_api, name='api_habit_detail'),
     path('habits/<uuid:habit_id>/responses/', api_views.habit_responses_api, name='api_habit_responses'),
     path('stats/', api_views.stats_api, name='api_stats'),
+    path('history/', api_views.history_api, name='api_history'),
     path('reminders/', notifications_api.habit_reminders_api, name='api_reminders'),
+    path('events/', api_views.events_api, name='api_events'),
 ]
 
@@ -1,17 +1,31 @@
-from django.http import JsonResponse
+import json
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 from datetime import date, timedelta
+from .api_cache import cached_api, conditional_user_data
+from .events import event_stream
 from .models import Habit, HabitResponse, StreakData
-from .statistics import get_weekly_data, get_habit_weekly_data, get_habit_statistics, get_user_statistics
+from .statistics import (
+    get_weekly_data, get_habit_weekly_data, get_habit_statistics,
+    get_bulk_habit_statistics, get_user_statistics, get_history_rows,
+)
+
+HISTORY_MAX_DAYS = 366 * 3
+HISTORY_MAX_PAGE_SIZE = 200
 
 
 @login_required
+@conditional_user_data()
+@cached_api
 def habit_list_api(request):
-    habits = Habit.objects.filter(user=request.user)
+    habits = list(Habit.objects.filter(user=request.user))
+    all_stats = get_bulk_habit_statistics(habits)
     data = []
     for habit in habits:
-        stats = get_habit_statistics(habit)
+        stats = all_stats[habit.id]
         data.append({
             'id': str(habit.id),
             'name': habit.name,
@@ -27,6 +41,8 @@ def habit_list_api(request):
 
 
 @login_required
+@conditional_user_data()
+@cached_api
 def habit_detail_api(request, habit_id):
     habit = get_object_or_404(Habit, id=habit_id, user=request.user)
     stats = get_habit_statistics(habit)
@@ -50,6 +66,8 @@ def habit_detail_api(request, habit_id):
 
 
 @login_required
+@conditional_user_data()
+@cached_api
 def habit_responses_api(request, habit_id):
     habit = get_object_or_404(Habit, id=habit_id, user=request.user)
     
@@ -79,6 +97,8 @@ def habit_responses_api(request, habit_id):
 
 
 @login_required
+@conditional_user_data()
+@cached_api
 def stats_api(request):
     user_stats = get_user_statistics(request.user)
     weekly = get_weekly_data(request.user)
@@ -97,3 +117,71 @@ def stats_api(request):
             for i in range(7)
         ],
     })
+
+
+@login_required
+def history_api(request):
+    """
+    Streams the habit x day history grid as JSON for client-side rendering.
+    Query parameters: start / end (YYYY-MM-DD) or days, page and page_size.
+    Each habit row carries a `cells` string, one character per day.
+    """
+    try:
+        end_date = parse_date(request.GET.get('end', '')) or date.today()
+        days = int(request.GET.get('days', 30))
+        start_date = parse_date(request.GET.get('start', '')) or end_date - timedelta(days=days - 1)
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 50)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date range or paging parameters.'}, status=400)
+
+    span = (end_date - start_date).days + 1
+    if span < 1 or span > HISTORY_MAX_DAYS:
+        return JsonResponse({'error': f'Date range must cover 1 to {HISTORY_MAX_DAYS} days.'}, status=400)
+
+    habits = Habit.objects.filter(user=request.user).order_by('created_at', 'name')
+    total_habits = habits.count()
+    page_habits = list(habits[(page - 1) * page_size:page * page_size])
+    rows = get_history_rows(page_habits, start_date, end_date)
+
+    def stream():
+        header = json.dumps({
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'days': span,
+            'page': page,
+            'page_size': page_size,
+            'total_habits': total_habits,
+            'has_next': page * page_size < total_habits,
+            'codes': {'completed': '2', 'missed': '1', 'none': '0'},
+        })
+        # Re-open the header object so habit rows can be streamed into it
+        yield header[:-1] + ', "habits": ['
+        for index, habit in enumerate(page_habits):
+            row = json.dumps({
+                'id': str(habit.id),
+                'name': habit.name,
+                'color': habit.color,
+                'cells': rows[habit.id],
+            })
+            yield ('' if index == 0 else ', ') + row
+        yield ']}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+@login_required
+async def events_api(request):
+    """
+    Server-Sent Events stream of reminder, completion and streak changes for
+    the current user (see events.py). Needs an ASGI server; under WSGI it
+    answers 204 so EventSource stops reconnecting and pages keep polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    response = StreamingHttpResponse(event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,179 @@
+"""
+Per-habit completion bitmaps.
+Each HabitYearBitmap row stores one bit per day of a year. Loading a habit's
+rows yields a CompletionBitmap whose streaks, windowed completion rates and
+heatmaps are computed with integer bit operations instead of row scans.
+"""
+from datetime import date, timedelta
+from django.db import transaction
+from .api_cache import bump_after_commit
+from .models import Habit, HabitResponse, HabitYearBitmap
+
+YEAR_BYTES = 46  # 366 bits, rounded up
+
+
+def _year_start(year):
+    return date(year, 1, 1)
+
+
+def _to_int(blob):
+    return int.from_bytes(bytes(blob), 'little') if blob else 0
+
+
+def _to_blob(value):
+    return value.to_bytes(YEAR_BYTES, 'little')
+
+
+class CompletionBitmap:
+    """Completion history of one habit as a single integer; bit i = origin + i days."""
+
+    def __init__(self, origin, bits=0):
+        self.origin = origin
+        self.bits = bits
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (year, blob) pairs."""
+        rows = sorted(rows)
+        if not rows:
+            return cls(_year_start(date.today().year))
+        origin = _year_start(rows[0][0])
+        bits = 0
+        for year, blob in rows:
+            bits |= _to_int(blob) << (_year_start(year) - origin).days
+        return cls(origin, bits)
+
+    def _index(self, day):
+        return (day - self.origin).days
+
+    def _range_mask(self, start, end):
+        """Mask of bits for start..end (inclusive), clipped to the origin."""
+        lo = max(self._index(start), 0)
+        hi = self._index(end)
+        if hi < lo:
+            return 0, lo
+        return ((1 << (hi - lo + 1)) - 1) << lo, lo
+
+    def is_completed(self, day):
+        index = self._index(day)
+        return index >= 0 and bool(self.bits >> index & 1)
+
+    def count(self, start, end):
+        mask, _ = self._range_mask(start, end)
+        return (self.bits & mask).bit_count()
+
+    def completion_rate(self, start, end):
+        days = (end - start).days + 1
+        if days <= 0:
+            return 0
+        return round(self.count(start, end) / days * 100, 1)
+
+    def window(self, start, end):
+        """The bits for start..end as an integer; bit 0 = start."""
+        days = (end - start).days + 1
+        if days <= 0:
+            return 0
+        offset = self._index(start)
+        if offset >= 0:
+            window = self.bits >> offset
+        else:
+            window = self.bits << -offset
+        return window & ((1 << days) - 1)
+
+    def heatmap(self, start, end):
+        """List of 0/1 values, one per day from start to end."""
+        days = (end - start).days + 1
+        window = self.window(start, end)
+        return [window >> i & 1 for i in range(max(days, 0))]
+
+    def to_string(self, start, end):
+        """'1'/'0' per day from start to end, oldest first."""
+        days = (end - start).days + 1
+        if days <= 0:
+            return ''
+        return format(self.window(start, end), f'0{days}b')[::-1]
+
+    def current_streak(self, today=None):
+        """Consecutive completed days ending today (or yesterday if today is still open)."""
+        if today is None:
+            today = date.today()
+        if not self.is_completed(today):
+            today -= timedelta(days=1)
+        end = self._index(today)
+        if end < 0:
+            return 0
+        mask = (1 << (end + 1)) - 1
+        gaps = ~self.bits & mask
+        if not gaps:
+            return end + 1
+        return end - gaps.bit_length() + 1
+
+    def best_streak(self):
+        """Length of the longest run of completed days."""
+        bits = self.bits
+        length = 0
+        while bits:
+            bits &= bits >> 1
+            length += 1
+        return length
+
+
+def load_bitmap(habit):
+    rows = HabitYearBitmap.objects.filter(habit=habit).values_list('year', 'bits')
+    return CompletionBitmap.from_rows(rows)
+
+
+def load_bitmaps(habit_ids):
+    """Load bitmaps for many habits in one query, keyed by habit id."""
+    grouped = {habit_id: [] for habit_id in habit_ids}
+    rows = HabitYearBitmap.objects.filter(habit_id__in=habit_ids).values_list('habit_id', 'year', 'bits')
+    for habit_id, year, blob in rows:
+        grouped[habit_id].append((year, blob))
+    return {habit_id: CompletionBitmap.from_rows(rows) for habit_id, rows in grouped.items()}
+
+
+def set_day(habit_id, day, completed):
+    """Set or clear the bit for `day` in the habit's bitmap."""
+    index = (day - _year_start(day.year)).days
+    with transaction.atomic():
+        row, _ = HabitYearBitmap.objects.select_for_update().get_or_create(
+            habit_id=habit_id, year=day.year, defaults={'bits': _to_blob(0)}
+        )
+        bits = _to_int(row.bits)
+        bits = bits | (1 << index) if completed else bits & ~(1 << index)
+        row.bits = _to_blob(bits)
+        row.save(update_fields=['bits'])
+
+
+def rebuild_bitmaps(habit_ids=None, batch_size=500):
+    """
+    Recompute bitmaps from completed HabitResponse rows, `batch_size` habits
+    at a time. Rebuilds every habit when `habit_ids` is None. Returns the
+    number of bitmap rows written.
+    """
+    if habit_ids is None:
+        habit_ids = list(Habit.objects.values_list('id', flat=True))
+    else:
+        habit_ids = list(habit_ids)
+
+    written = 0
+    for start in range(0, len(habit_ids), batch_size):
+        chunk = habit_ids[start:start + batch_size]
+        years = {}
+        completed = HabitResponse.objects.filter(habit_id__in=chunk, completed=True).values_list('habit_id', 'date')
+        for habit_id, day in completed.iterator(chunk_size=5000):
+            key = (habit_id, day.year)
+            years[key] = years.get(key, 0) | 1 << (day - _year_start(day.year)).days
+
+        with transaction.atomic():
+            HabitYearBitmap.objects.filter(habit_id__in=chunk).delete()
+            HabitYearBitmap.objects.bulk_create(
+                [
+                    HabitYearBitmap(habit_id=habit_id, year=year, bits=_to_blob(bits))
+                    for (habit_id, year), bits in years.items()
+                ],
+                batch_size=1000,
+            )
+            bump_after_commit(Habit.objects.filter(id__in=chunk).values_list('user_id', flat=True).distinct())
+        written += len(years)
+    return written
@@ -0,0 +1,283 @@
+"""
+Concurrent notification dispatcher.
+Callers hand notifications to submit(), which never blocks: each configured
+sink (settings.NOTIFICATION_SINKS) has its own bounded queue and worker
+threads, so a slow or hung sink only backs up its own queue. When a queue is
+full the notification is dropped for that sink and counted, rather than
+stalling the scheduler tick. Workers drain up to `batch_size` queued
+notifications per call so sinks can write them in one go. Notifications a
+sink does not accept (see Sink.accepts) are counted as skipped, and sinks
+report failures per notification. Once a sink has delivered a reminder its
+ledger rows (the notification's `deliveries`) are marked delivered; see
+notification_service.claim_deliveries.
+"""
+import atexit
+import json
+import logging
+import queue
+import subprocess
+import threading
+import time
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import InboxNotification, NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SINKS = [{'BACKEND': 'habits.dispatcher.NotifySendSink'}]
+_STOP = object()
+
+
+def make_notification(title, message, user_id=None, habit_id=None, url='', icon=None, deliveries=()):
+    return {
+        'title': title, 'message': message or '', 'user_id': user_id, 'habit_id': habit_id, 'url': url, 'icon': icon,
+        'deliveries': list(deliveries),
+    }
+
+
+def confirm_deliveries(notifications):
+    """Mark the ledger rows of delivered notifications as delivered. Returns how many rows changed."""
+    ids = [pk for notification in notifications for pk in notification.get('deliveries', ())]
+    if not ids:
+        return 0
+    return NotificationDelivery.objects.filter(pk__in=ids, delivered_at__isnull=True).update(delivered_at=timezone.now())
+
+
+class Sink:
+    """
+    Base class; subclasses implement send_batch(), which returns the
+    notifications it could not deliver (nothing when all went out). Raising
+    fails the whole batch.
+    """
+    name = 'sink'
+
+    def __init__(self, timeout=5, batch_size=20, workers=1, queue_size=1000, **options):
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.workers = workers
+        self.queue_size = queue_size
+
+    def accepts(self, notification):
+        """Whether the notification is meant for this sink at all; the rest are skipped without queueing."""
+        return True
+
+    def send_batch(self, notifications):
+        raise NotImplementedError
+
+
+class NotifySendSink(Sink):
+    """Linux desktop notifications through notify-send, one process per notification."""
+    name = 'notify-send'
+
+    def send_batch(self, notifications):
+        failed = []
+        for notification in notifications:
+            command = ['notify-send', '-a', 'FlowMotion']
+            if notification.get('icon'):
+                command += ['-i', notification['icon']]
+            try:
+                subprocess.run(command + [notification['title'], notification['message']], check=True, timeout=self.timeout)
+            except FileNotFoundError:
+                print(f"[FlowMotion] notify-send not found. Notification: {notification['title']} - {notification['message']}")
+            except (subprocess.SubprocessError, OSError) as e:
+                # A hung or failing notify-send only costs this notification, not the rest of the batch
+                logger.warning(f"notify-send failed for {notification['title']!r}: {e}")
+                failed.append(notification)
+        return failed
+
+
+class LogFileSink(Sink):
+    """Appends one JSON line per notification to a file."""
+    name = 'log'
+
+    def __init__(self, path='notifications.log', **options):
+        super().__init__(**options)
+        self.path = path
+
+    def send_batch(self, notifications):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(n, default=str) + '\n' for n in notifications))
+
+
+class InboxSink(Sink):
+    """Stores notifications in the in-app inbox table with one bulk insert per batch. Skips those without a user."""
+    name = 'inbox'
+
+    def accepts(self, notification):
+        return notification['user_id'] is not None
+
+    def send_batch(self, notifications):
+        InboxNotification.objects.bulk_create([
+            InboxNotification(
+                user_id=n['user_id'], habit_id=n['habit_id'], title=n['title'][:200], message=n['message'], url=n['url'],
+            )
+            for n in notifications
+        ])
+        close_old_connections()
+
+
+class WebhookSink(Sink):
+    """POSTs each batch as a JSON list to a URL (e.g. a local relay)."""
+    name = 'webhook'
+
+    def __init__(self, url='http://127.0.0.1:8765/notify', **options):
+        super().__init__(**options)
+        self.url = url
+        self.session = requests.Session()
+
+    def send_batch(self, notifications):
+        response = self.session.post(self.url, data=json.dumps(notifications, default=str),
+                                     headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class SinkMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = self.failed = self.dropped = self.skipped = self.batches = 0
+        self.seconds = self.max_seconds = 0.0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'sent': self.sent, 'failed': self.failed, 'dropped': self.dropped, 'skipped': self.skipped,
+                'batches': self.batches,
+                'avg_batch_seconds': round(self.seconds / self.batches, 4) if self.batches else 0,
+                'max_batch_seconds': round(self.max_seconds, 4),
+            }
+
+
+class Dispatcher:
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.queues = {sink.name: queue.Queue(maxsize=sink.queue_size) for sink in self.sinks}
+        self.stats = {sink.name: SinkMetrics() for sink in self.sinks}
+        self.threads = []
+        for sink in self.sinks:
+            for i in range(sink.workers):
+                thread = threading.Thread(target=self._work, args=(sink,), name=f'notify-{sink.name}-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, notification):
+        """Queue a notification for every sink without blocking. Returns how many sinks accepted it."""
+        accepted = 0
+        for sink in self.sinks:
+            if not sink.accepts(notification):
+                with self.stats[sink.name].lock:
+                    self.stats[sink.name].skipped += 1
+                continue
+            try:
+                self.queues[sink.name].put_nowait(notification)
+                accepted += 1
+            except queue.Full:
+                with self.stats[sink.name].lock:
+                    self.stats[sink.name].dropped += 1
+        return accepted
+
+    def _work(self, sink):
+        jobs = self.queues[sink.name]
+        metrics = self.stats[sink.name]
+        while True:
+            item = jobs.get()
+            if item is _STOP:
+                jobs.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < sink.batch_size:
+                try:
+                    item = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            started = time.monotonic()
+            try:
+                failed = sink.send_batch(batch) or []
+            except Exception as e:
+                logger.error(f"Notification sink {sink.name} failed: {e}")
+                failed = batch
+            elapsed = time.monotonic() - started
+            failed_ids = {id(notification) for notification in failed}
+            self._confirm([notification for notification in batch if id(notification) not in failed_ids])
+            with metrics.lock:
+                metrics.batches += 1
+                metrics.sent += len(batch) - len(failed)
+                metrics.failed += len(failed)
+                metrics.seconds += elapsed
+                metrics.max_seconds = max(metrics.max_seconds, elapsed)
+            for _ in range(len(batch) + stop):
+                jobs.task_done()
+            if stop:
+                return
+
+    def _confirm(self, delivered):
+        if not any(notification.get('deliveries') for notification in delivered):
+            return
+        try:
+            confirm_deliveries(delivered)
+        except Exception as e:
+            # The claims expire and the reminders are sent again
+            logger.error(f"Could not confirm notification deliveries: {e}")
+        finally:
+            close_old_connections()
+
+    def metrics(self):
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def flush(self, timeout=None):
+        """Wait until every queued notification has been handled. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for jobs in self.queues.values():
+            while jobs.unfinished_tasks:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+        return True
+
+    def close(self, timeout=5):
+        """Let the workers finish what is queued (up to `timeout` seconds) and stop them."""
+        for sink in self.sinks:
+            for _ in range(sink.workers):
+                try:
+                    self.queues[sink.name].put(_STOP, timeout=timeout)
+                except queue.Full:
+                    pass
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+
+def build_sinks(config):
+    sinks = []
+    for entry in config:
+        options = {key.lower(): value for key, value in entry.items() if key != 'BACKEND'}
+        sinks.append(import_string(entry['BACKEND'])(**options))
+    return sinks
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The process-wide dispatcher, started on first use from settings.NOTIFICATION_SINKS."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(build_sinks(getattr(settings, 'NOTIFICATION_SINKS', DEFAULT_SINKS)))
+            # Short-lived commands (send_reminders from cron) must not exit with notifications queued
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+def dispatcher_metrics():
+    """Per-sink delivery metrics of this process's dispatcher, or {} if it has not started."""
+    return _dispatcher.metrics() if _dispatcher is not None else {}
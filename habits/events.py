@@ -0,0 +1,136 @@
+"""
+In-process event broker behind the /api/events/ Server-Sent Events stream.
+Each connected client is an asyncio queue on the ASGI event loop, so an idle
+connection costs a queue and a suspended coroutine, not a thread. Writes made
+in this process (see signals.py) are pushed straight to the owner's queues.
+Writes made by other processes are picked up by one watcher task per process
+that compares the users' data versions (api_cache.py) in a single
+cache.get_many() call every WATCH_INTERVAL seconds.
+"""
+import asyncio
+import json
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from .api_cache import VERSION_KEY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+WATCH_INTERVAL = 5
+HEARTBEAT_INTERVAL = 25
+STREAM_LIFETIME = 30 * 60
+
+
+def format_event(event, data):
+    """Serialise one SSE message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # A client this far behind resyncs on reconnect
+        logger.warning("Dropping event for a slow SSE client")
+
+
+class EventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> {queue: loop}
+        self._versions = {}  # user_id -> last data version seen by the watcher
+        self._published = set()  # user ids with a local event since the last watch
+        self._watcher = None
+
+    def subscribe(self, user_id):
+        """Register a queue for `user_id`; must be called on the event loop."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = loop
+            if self._watcher is None or self._watcher.done():
+                self._watcher = loop.create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+                self._versions.pop(user_id, None)
+
+    def publish(self, user_id, event, data):
+        """Push an event to every connection of `user_id`. Safe to call from any thread."""
+        message = format_event(event, data)
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, {}).items())
+            if targets:
+                self._published.add(user_id)
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # The loop owning this connection has shut down
+                pass
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            with self._lock:
+                user_ids = list(self._subscribers)
+                published, self._published = self._published, set()
+            if not user_ids:
+                self._watcher = None
+                return
+
+            keys = {VERSION_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+            try:
+                versions = await sync_to_async(cache.get_many)(list(keys))
+            except Exception as e:
+                logger.error(f"Event watcher could not read data versions: {e}")
+                continue
+
+            for key, user_id in keys.items():
+                version = versions.get(key)
+                previous = self._versions.get(user_id)
+                self._versions[user_id] = version
+                # Only tell clients about changes that were not already pushed locally
+                if previous is not None and version != previous and user_id not in published:
+                    self.publish(user_id, 'sync', {})
+
+
+broker = EventBroker()
+
+
+async def event_stream(user_id, lifetime=STREAM_LIFETIME):
+    """
+    Async generator of SSE messages for one connection. Sends a heartbeat
+    comment while idle and closes after `lifetime` seconds so the browser
+    reconnects (and re-authenticates) on its own.
+    """
+    queue = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    try:
+        yield f"retry: {WATCH_INTERVAL * 1000}\n\n"
+        yield format_event('ready', {})
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=min(HEARTBEAT_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(user_id, queue)
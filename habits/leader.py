@@ -0,0 +1,36 @@
+"""
+Leader election for background workers through a lease row in the database.
+Every candidate periodically tries to take or renew the named lease with a
+single conditional UPDATE; it succeeds only for the current holder or once
+the lease has expired, so exactly one process across all hosts holds it.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+from .models import SchedulerLease
+
+LEASE_TTL = 15
+
+
+class LeaderLease:
+    def __init__(self, name, ttl=LEASE_TTL, holder=None):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl)
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self, now=None):
+        """Take or renew the lease. Returns True while this process is the leader."""
+        if now is None:
+            now = timezone.now()
+        SchedulerLease.objects.get_or_create(name=self.name, defaults={'expires_at': now})
+        won = SchedulerLease.objects.filter(name=self.name).filter(
+            Q(holder=self.holder) | Q(expires_at__lte=now)
+        ).update(holder=self.holder, expires_at=now + self.ttl)
+        return won == 1
+
+    def release(self):
+        """Give the lease up so a standby can take over on its next attempt."""
+        SchedulerLease.objects.filter(name=self.name, holder=self.holder).update(holder='', expires_at=timezone.now())
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from habits.ai_cache import ai_cache_stats, reset_ai_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Reports the hit rate and provider time saved by the shared AI response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the hit, miss and saved-time counters after reporting')
+
+    def handle(self, *args, **options):
+        stats = ai_cache_stats()
+        self.stdout.write(
+            f"{stats['entries']} cached responses; {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.1%} hit rate), {stats['saved_seconds']}s of provider time saved."
+        )
+        if options['reset']:
+            reset_ai_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
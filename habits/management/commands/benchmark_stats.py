@@ -0,0 +1,77 @@
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from habits.bitmaps import rebuild_bitmaps
+from habits.models import Habit, YesNoHabit, HabitResponse
+from habits.rollups import rebuild_rollups, reconcile_habit_counters
+from habits.statistics import get_weekly_data, get_user_statistics
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measures statistics latency against synthetic response tables of increasing size (nothing is saved).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Number of HabitResponse rows to benchmark against')
+        parser.add_argument('--habits', type=int, default=20, help='Number of habits to spread responses over')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per function (best is reported)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rows':>10} {'function':<22} {'queries':>8} {'best ms':>10}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    user = self._seed(size, options['habits'])
+                    for func in (get_weekly_data, get_user_statistics):
+                        queries, best = self._measure(func, user, options['repeat'])
+                        self.stdout.write(f"{size:>10} {func.__name__:<22} {queries:>8} {best * 1000:>10.2f}")
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _seed(self, size, habit_count):
+        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        habits = [
+            YesNoHabit.objects.create(user=user, name=f'Benchmark {i}', question='?')
+            for i in range(habit_count)
+        ]
+        days = -(-size // habit_count)
+        today = date.today()
+        responses = []
+        for habit in habits:
+            for offset in range(days):
+                if len(responses) >= size:
+                    break
+                responses.append(HabitResponse(
+                    habit=habit,
+                    date=today - timedelta(days=offset),
+                    completed=offset % 3 != 0,
+                ))
+        # bulk_create skips the response signals, so backfill everything they maintain
+        first_day = today - timedelta(days=days - 1)
+        Habit.objects.filter(user=user).update(
+            created_at=timezone.make_aware(datetime.combine(first_day, dt_time.min))
+        )
+        HabitResponse.objects.bulk_create(responses, batch_size=5000)
+        rebuild_rollups([user.id])
+        rebuild_bitmaps([habit.id for habit in habits])
+        reconcile_habit_counters()
+        return user
+
+    def _measure(self, func, user, repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            func(user)
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(user)
+            best = min(best, time.perf_counter() - start)
+        return len(ctx.captured_queries), best
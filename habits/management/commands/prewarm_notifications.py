@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from habits.message_cache import prewarm_messages
+
+
+class Command(BaseCommand):
+    help = "Generates and caches the AI notification messages of every habit with reminders (tomorrow's by default)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to generate messages for, as YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        count = prewarm_messages(day)
+        self.stdout.write(self.style.SUCCESS(f'Generated notification messages for {count} habits.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from habits.bitmaps import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-habit completion bitmaps from HabitResponse rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of habits rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        count = rebuild_bitmaps(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} habit-year bitmaps.'))
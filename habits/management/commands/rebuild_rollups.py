@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from habits.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the DailyRollup table from HabitResponse rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help='Only rebuild rollups for this username (can be repeated)')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('id', flat=True))
+            if len(user_ids) != len(set(options['usernames'])):
+                raise CommandError('One or more users do not exist.')
+
+        count = rebuild_rollups(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily rollup rows.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from habits.triggers import rebuild_triggers
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the minute-of-day reminder trigger rows from the habits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written per insert')
+
+    def handle(self, *args, **options):
+        count = rebuild_triggers(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} reminder triggers.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from habits.streaks import recompute_streaks
+
+
+class Command(BaseCommand):
+    help = 'Recomputes current and best streaks for every habit from its response history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of habits processed per batch')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f"Processed {done}/{total} habits")
+
+        count = recompute_streaks(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed streaks for {count} habits.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from habits.rollups import reconcile_habit_counters
+
+
+class Command(BaseCommand):
+    help = 'Detects and repairs drift in Habit.total_responses / completed_responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted habits, do not repair them')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_habit_counters(fix=not options['dry_run'])
+
+        for habit_id, stored, actual in drifted:
+            self.stdout.write(
+                f"{habit_id}: stored {stored[1]}/{stored[0]}, actual {actual[1]}/{actual[0]}"
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All habit counters are consistent.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} habits have drifted counters.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired counters on {len(drifted)} habits.'))
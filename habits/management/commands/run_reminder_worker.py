@@ -0,0 +1,102 @@
+import multiprocessing
+import signal
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connections
+from habits.dispatcher import dispatcher_metrics
+from habits.leader import LEASE_TTL, LeaderLease
+from habits.reminder_scheduler import start_background_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the reminder scheduler; start one per host, only the elected leader of each shard sends reminders. '
+        "With --shards N habits are split by a hash of their user id, so each user's reminders stay together, "
+        'and each shard elects its own leader.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lease-ttl', type=int, default=LEASE_TTL, help='Seconds a leader may go without renewing before a standby takes over')
+        parser.add_argument('--lease-name', default='reminders', help='Lease shared by the workers that compete for leadership')
+        parser.add_argument('--shards', type=int, default=1, help='Number of slices the habits are partitioned into')
+        parser.add_argument('--shard', type=int, help='Serve only this slice; by default one process is started per slice')
+        parser.add_argument('--report-interval', type=int, default=60, help='Seconds between progress reports')
+
+    def handle(self, *args, **options):
+        shards = options['shards']
+        if shards < 1:
+            raise CommandError('--shards must be at least 1')
+        if options['shard'] is not None:
+            if not 0 <= options['shard'] < shards:
+                raise CommandError(f'--shard must be between 0 and {shards - 1}')
+            return self.run_shard(options['shard'], options)
+        if shards == 1:
+            return self.run_shard(0, options)
+
+        # Children must open their own database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self.run_shard, args=(shard, options), name=f'reminder-shard-{shard}')
+            for shard in range(shards)
+        ]
+        for process in processes:
+            process.start()
+
+        def terminate(*args):
+            for process in processes:
+                process.terminate()
+        signal.signal(signal.SIGTERM, terminate)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The children got the same Ctrl-C and release their leases
+            for process in processes:
+                process.join()
+
+    def run_shard(self, shard, options):
+        shards = options['shards']
+        label = f'shard {shard}/{shards}' if shards > 1 else 'reminders'
+        name = options['lease_name'] if shards == 1 else f"{options['lease_name']}:{shard}/{shards}"
+        lease = LeaderLease(name, ttl=options['lease_ttl'])
+        # Renew well inside the TTL so a live leader never loses the lease
+        interval = max(options['lease_ttl'] / 3, 1)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        self.stdout.write(f'Reminder worker {lease.holder} started for {label}.')
+
+        scheduler = stop_jobs = None
+        last_report = time.monotonic()
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    leader = lease.acquire()
+                except DatabaseError as e:
+                    self.stderr.write(f'[{label}] Could not renew the lease: {e}')
+                    leader = False
+
+                if leader and stop_jobs is None:
+                    scheduler, stop_jobs = start_background_jobs(shard, shards)
+                    self.stdout.write(self.style.SUCCESS(f'[{label}] Elected leader; reminder scheduler running.'))
+                elif not leader and stop_jobs is not None:
+                    stop_jobs()
+                    scheduler = stop_jobs = None
+                    self.stdout.write(self.style.WARNING(f'[{label}] Lost leadership; reminder scheduler stopped.'))
+
+                if scheduler is not None and time.monotonic() - last_report >= options['report_interval']:
+                    last_report = time.monotonic()
+                    self.stdout.write(f'[{label}] {scheduler.pending_count()} reminders queued, {scheduler.sent} sent.')
+                    for sink, stats in dispatcher_metrics().items():
+                        self.stdout.write(f'[{label}] {sink}: ' + ', '.join(f'{key}={value}' for key, value in stats.items()))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if stop_jobs is not None:
+                stop_jobs()
+            try:
+                lease.release()
+            except DatabaseError:
+                pass
+            self.stdout.write(f'[{label}] Reminder worker stopped.')
@@ -0,0 +1,101 @@
+"""
+Shared cache of the AI-written notification messages.
+Rows live in the NotificationMessageCache table, one per habit and day, so
+every worker process reads the same entries and they survive restarts.
+prewarm_messages() fills the next day's rows off-peak, many habits per Gemini
+call, so reminder ticks do not wait on Gemini. It also drops past days and
+bounds the table to settings.NOTIFICATION_MESSAGE_CACHE_SIZE rows, least
+recently used first; rows for today and tomorrow are never evicted, however
+many habits have reminders.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from .ai_cache import TOUCH_INTERVAL, delete_least_recent
+from .ai_utils import generate_notification_messages, generate_notification_messages_batch, notification_fallbacks
+from .models import Habit, NotificationMessageCache
+
+CACHE_SIZE = 10000
+
+
+def cache_size():
+    return getattr(settings, 'NOTIFICATION_MESSAGE_CACHE_SIZE', CACHE_SIZE)
+
+
+def store_messages(habit, day, messages, now=None):
+    """Insert or replace the messages of `habit` for `day`."""
+    if now is None:
+        now = timezone.now()
+    NotificationMessageCache.objects.update_or_create(
+        habit=habit, date=day, defaults={'habit_name': habit.name, 'messages': messages, 'last_used': now},
+    )
+
+
+def get_cached_messages(habit, day=None):
+    """
+    The habit's notification messages for `day` (default today), generating
+    and storing them on a miss. Entries written for an older name of the
+    habit count as misses.
+    """
+    now = timezone.now()
+    if day is None:
+        day = timezone.localdate(now)
+    entry = NotificationMessageCache.objects.filter(habit=habit, date=day).first()
+    if entry is not None and entry.habit_name == habit.name:
+        if now - entry.last_used > TOUCH_INTERVAL:
+            NotificationMessageCache.objects.filter(pk=entry.pk).update(last_used=now)
+        return entry.messages
+
+    messages = generate_notification_messages(habit.name)
+    if messages == notification_fallbacks(habit.name):
+        # Gemini failed; the next reminder tries again
+        return messages
+    try:
+        store_messages(habit, day, messages, now)
+    except IntegrityError:
+        # Another worker stored the same row first; either copy will do
+        pass
+    return messages
+
+
+def evict(limit=None):
+    """
+    Delete the least recently used rows beyond `limit`, sparing those for
+    today and tomorrow that reminders are sent from. Returns how many were
+    deleted.
+    """
+    if limit is None:
+        limit = cache_size()
+    today = timezone.localdate()
+    in_use = Q(date__range=(today, today + timedelta(days=1)))
+    spared = NotificationMessageCache.objects.filter(in_use).count()
+    return delete_least_recent(NotificationMessageCache.objects.exclude(in_use), max(limit - spared, 0))
+
+
+def prewarm_messages(day=None):
+    """
+    Generate the messages for `day` (default tomorrow) of every habit with
+    reminders enabled that is not cached yet, then drop rows of past days and
+    enforce the size bound. Fallback messages are not stored, so those habits
+    are generated again on their first reminder. Returns the number of habits
+    stored.
+    """
+    today = timezone.localdate()
+    if day is None:
+        day = today + timedelta(days=1)
+    cached = dict(NotificationMessageCache.objects.filter(date=day).values_list('habit_id', 'habit_name'))
+    habits = Habit.objects.filter(reminder_enabled=True, reminder_time__isnull=False, status='active').only('id', 'name')
+
+    pending = [habit for habit in habits.iterator(chunk_size=500) if cached.get(habit.id) != habit.name]
+    generated = generate_notification_messages_batch([habit.name for habit in pending])
+    stored = 0
+    for habit in pending:
+        if generated[habit.name] != notification_fallbacks(habit.name):
+            store_messages(habit, day, generated[habit.name])
+            stored += 1
+
+    NotificationMessageCache.objects.filter(date__lt=today).delete()
+    evict()
+    return stored
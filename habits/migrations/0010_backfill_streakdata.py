@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def backfill_streak_data(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    StreakData = apps.get_model('habits', 'StreakData')
+
+    missing = Habit.objects.filter(streak__isnull=True).values_list('id', flat=True)
+    StreakData.objects.bulk_create(
+        [StreakData(habit_id=habit_id) for habit_id in missing],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_alter_habit_options_habit_target_time_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_streak_data, migrations.RunPython.noop),
+    ]
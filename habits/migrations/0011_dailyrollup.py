@@ -0,0 +1,57 @@
+# Generated by Django 5.2.10 on 2026-10-18 09:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_rollups(apps, schema_editor):
+    HabitResponse = apps.get_model('habits', 'HabitResponse')
+    DailyRollup = apps.get_model('habits', 'DailyRollup')
+
+    rows = HabitResponse.objects.order_by().values('habit__user_id', 'date').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True)),
+        value_sum=Sum('value'),
+    )
+    DailyRollup.objects.bulk_create(
+        [
+            DailyRollup(
+                user_id=row['habit__user_id'],
+                date=row['date'],
+                total=row['total'],
+                completed=row['completed'],
+                value_sum=row['value_sum'] or 0,
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_backfill_streakdata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('value_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
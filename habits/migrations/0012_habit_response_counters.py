@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-10-18 09:55
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+
+    rows = Habit.objects.annotate(
+        response_count=Count('responses'),
+        completed_count=Count('responses', filter=Q(responses__completed=True)),
+    ).filter(response_count__gt=0).values_list('id', 'response_count', 'completed_count')
+    for habit_id, total, completed in rows:
+        Habit.objects.filter(pk=habit_id).update(total_responses=total, completed_responses=completed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0011_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='completed_responses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='total_responses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
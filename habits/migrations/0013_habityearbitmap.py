@@ -0,0 +1,48 @@
+# Generated by Django 5.2.10 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from datetime import date
+from django.db import migrations, models
+
+
+def build_bitmaps(apps, schema_editor):
+    HabitResponse = apps.get_model('habits', 'HabitResponse')
+    HabitYearBitmap = apps.get_model('habits', 'HabitYearBitmap')
+
+    years = {}
+    completed = HabitResponse.objects.filter(completed=True).values_list('habit_id', 'date')
+    for habit_id, day in completed.iterator():
+        key = (habit_id, day.year)
+        years[key] = years.get(key, 0) | 1 << (day - date(day.year, 1, 1)).days
+
+    HabitYearBitmap.objects.bulk_create(
+        [
+            HabitYearBitmap(habit_id=habit_id, year=year, bits=bits.to_bytes(46, 'little'))
+            for (habit_id, year), bits in years.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_habit_response_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitYearBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('bits', models.BinaryField(default=b'')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='year_bitmaps', to='habits.habit')),
+            ],
+            options={
+                'ordering': ['year'],
+                'unique_together': {('habit', 'year')},
+            },
+        ),
+        migrations.RunPython(build_bitmaps, migrations.RunPython.noop),
+    ]
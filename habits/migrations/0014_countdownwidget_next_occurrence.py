@@ -0,0 +1,67 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:01
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def get_next_occurrence(target_date, target_time, recurrence, selected_days, now):
+    # Frozen copy of habits.schedule.get_next_occurrence as of this migration
+    occurrence = datetime.combine(target_date, target_time)
+    if now.tzinfo is not None:
+        occurrence = occurrence.replace(tzinfo=now.tzinfo)
+    weekdays = {WEEKDAYS.index(day) for day in (selected_days or []) if day in WEEKDAYS}
+
+    if recurrence == 'none':
+        return occurrence
+
+    if weekdays:
+        step = timedelta(days=1)
+    elif recurrence == 'weekly':
+        step = timedelta(days=7)
+    else:
+        step = timedelta(days=1)
+
+    if occurrence < now:
+        behind = now - occurrence
+        occurrence += step * -(-behind // step)
+    while weekdays and occurrence.weekday() not in weekdays:
+        occurrence += timedelta(days=1)
+    return occurrence
+
+
+def backfill_next_occurrence(apps, schema_editor):
+    CountdownWidget = apps.get_model('habits', 'CountdownWidget')
+
+    now = timezone.localtime()
+    widgets = list(CountdownWidget.objects.all())
+    for widget in widgets:
+        widget.next_occurrence = get_next_occurrence(
+            widget.target_date, widget.target_time, widget.recurrence, widget.selected_days, now
+        )
+    CountdownWidget.objects.bulk_update(widgets, ['next_occurrence'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0013_habityearbitmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='countdownwidget',
+            name='next_occurrence',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='countdownwidget',
+            index=models.Index(fields=['user', 'next_occurrence'], name='habits_coun_user_id_3ebe01_idx'),
+        ),
+        migrations.RunPython(backfill_next_occurrence, migrations.RunPython.noop),
+    ]
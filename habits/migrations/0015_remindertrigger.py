@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_triggers(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    ReminderTrigger = apps.get_model('habits', 'ReminderTrigger')
+
+    rows = []
+    habits = Habit.objects.filter(status='active', reminder_enabled=True, reminder_time__isnull=False)
+    for habit in habits.iterator():
+        main = habit.reminder_time.hour * 60 + habit.reminder_time.minute
+        minutes = {}
+        for kind, minute in (('pre', main - habit.minutes_before), ('main', main), ('post', main + habit.minutes_after)):
+            minute %= 24 * 60
+            if minute not in minutes.values():
+                minutes[kind] = minute
+        rows.extend(ReminderTrigger(habit_id=habit.pk, kind=kind, minute=minute) for kind, minute in minutes.items())
+    ReminderTrigger.objects.bulk_create(rows, batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0014_countdownwidget_next_occurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderTrigger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('pre', 'Pre-reminder'), ('main', 'On time'), ('post', 'Overdue')], max_length=10)),
+                ('minute', models.PositiveSmallIntegerField(db_index=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_triggers', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'kind')},
+            },
+        ),
+        migrations.RunPython(build_triggers, migrations.RunPython.noop),
+    ]
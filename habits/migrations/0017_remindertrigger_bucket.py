@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+def fill_buckets(apps, schema_editor):
+    ReminderTrigger = apps.get_model('habits', 'ReminderTrigger')
+
+    triggers = list(ReminderTrigger.objects.all())
+    for trigger in triggers:
+        trigger.bucket = trigger.habit_id.int % 1024
+    ReminderTrigger.objects.bulk_update(triggers, ['bucket'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0016_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remindertrigger',
+            name='bucket',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0017_remindertrigger_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('pre', 'Pre-reminder'), ('main', 'On time'), ('post', 'Overdue')], max_length=10)),
+                ('token', models.UUIDField(db_index=True)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'date', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0019_inboxnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationMessageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('habit_name', models.CharField(max_length=200)),
+                ('messages', models.JSONField(default=dict)),
+                ('last_used', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_cache', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'date')},
+            },
+        ),
+    ]
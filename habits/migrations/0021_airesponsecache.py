@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0020_notificationmessagecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('kind', models.CharField(max_length=30)),
+                ('model', models.CharField(max_length=50)),
+                ('prompt', models.CharField(max_length=200)),
+                ('response', models.JSONField()),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('last_used', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
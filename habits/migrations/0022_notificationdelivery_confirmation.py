@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def confirm_existing(apps, schema_editor):
+    # Rows written before confirmation existed were sent; key them by their trigger's current minute
+    NotificationDelivery = apps.get_model('habits', 'NotificationDelivery')
+    ReminderTrigger = apps.get_model('habits', 'ReminderTrigger')
+
+    minutes = {(habit_id, kind): minute for habit_id, kind, minute in ReminderTrigger.objects.values_list('habit_id', 'kind', 'minute')}
+    deliveries = list(NotificationDelivery.objects.all())
+    for delivery in deliveries:
+        delivery.minute = minutes.get((delivery.habit_id, delivery.kind), 0)
+        delivery.delivered_at = delivery.claimed_at
+    NotificationDelivery.objects.bulk_update(deliveries, ['minute', 'delivered_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0021_airesponsecache'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='notificationdelivery',
+            old_name='sent_at',
+            new_name='claimed_at',
+        ),
+        migrations.AlterField(
+            model_name='notificationdelivery',
+            name='claimed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='notificationdelivery',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationdelivery',
+            name='minute',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(confirm_existing, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='notificationdelivery',
+            unique_together={('habit', 'date', 'kind', 'minute')},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:20
+
+from django.db import migrations
+
+
+def fill_user_buckets(apps, schema_editor):
+    ReminderTrigger = apps.get_model('habits', 'ReminderTrigger')
+
+    triggers = list(ReminderTrigger.objects.select_related('habit').only('id', 'habit__user_id'))
+    for trigger in triggers:
+        trigger.bucket = trigger.habit.user_id % 1024
+    ReminderTrigger.objects.bulk_update(triggers, ['bucket'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0022_notificationdelivery_confirmation'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_user_buckets, migrations.RunPython.noop),
+    ]
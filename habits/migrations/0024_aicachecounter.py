@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0023_remindertrigger_user_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICacheCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
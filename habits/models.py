@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Habit(models.Model):
@@ -35,6 +36,8 @@ class Habit(models.Model):
     ai_suggestions = models.JSONField(blank=True, null=True) # Stores tools and links
     ai_estimated_time = models.CharField(max_length=100, blank=True, null=True)
     duration = models.IntegerField(default=28)
+    total_responses = models.IntegerField(default=0)
+    completed_responses = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -45,6 +48,14 @@ class Habit(models.Model):
     selected_days = models.JSONField(default=list, blank=True) # e.g., ["Mon", "Wed", "Sun"]
     widget_type = models.CharField(max_length=20, choices=[('habit', 'Habit'), ('countdown', 'Countdown')], default='habit')
 
+    @property
+    def completion_rate(self):
+        # Share of the due periods that were completed; the counts are set for
+        # a whole list at once by statistics.attach_period_counts
+        if not self.due_count:
+            return 0
+        return round(self.satisfied_count / self.due_count * 100, 1)
+
 class CountdownWidget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='countdown_widgets')
     title = models.CharField(max_length=200)
@@ -54,6 +65,7 @@ class CountdownWidget(models.Model):
     selected_days = models.JSONField(default=list, blank=True)
     notes = models.TextField(blank=True)
     color = models.CharField(max_length=7, default='#6366f1')
+    next_occurrence = models.DateTimeField(null=True, blank=True, db_index=True) # Rolled forward by widget_utils.roll_forward_countdowns
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     color = models.CharField(max_length=7, default='#6366f1')
@@ -63,6 +75,7 @@ class CountdownWidget(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'next_occurrence'])]
     
     def __str__(self):
         return self.name
@@ -137,3 +150,131 @@ class StreakData(models.Model):
     
     def __str__(self):
         return f"{self.habit.name} - Current: {self.current_streak}, Best: {self.best_streak}"
+
+
+class DailyRollup(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    total = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    value_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.user} - {self.date}: {self.completed}/{self.total}"
+
+
+class HabitYearBitmap(models.Model):
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='year_bitmaps')
+    year = models.IntegerField()
+    bits = models.BinaryField(default=b'') # Bit N set = completed on day N of the year (0 = 1 Jan)
+
+    class Meta:
+        unique_together = ['habit', 'year']
+        ordering = ['year']
+
+    def __str__(self):
+        return f"{self.habit.name} - {self.year}"
+
+
+class ReminderTrigger(models.Model):
+    KIND_CHOICES = [
+        ('pre', 'Pre-reminder'),
+        ('main', 'On time'),
+        ('post', 'Overdue'),
+    ]
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='reminder_triggers')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    minute = models.PositiveSmallIntegerField(db_index=True) # Minute of the day, 0-1439
+    bucket = models.PositiveSmallIntegerField(default=0) # Hash of the habit's user id, used to shard workers
+
+    class Meta:
+        unique_together = ['habit', 'kind']
+
+    def __str__(self):
+        return f"{self.habit.name} - {self.kind} at {self.minute // 60:02d}:{self.minute % 60:02d}"
+
+
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=200, blank=True) # host:pid:token of the elected worker
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder or 'nobody'} until {self.expires_at}"
+
+
+class NotificationDelivery(models.Model):
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='deliveries')
+    date = models.DateField()
+    kind = models.CharField(max_length=10, choices=ReminderTrigger.KIND_CHOICES)
+    minute = models.PositiveSmallIntegerField(default=0) # Scheduled minute of the day, so a moved reminder is a new delivery
+    token = models.UUIDField(db_index=True) # Identifies the tick that claimed the delivery
+    claimed_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True) # Set once a sink confirms; unconfirmed claims expire and are retried
+
+    class Meta:
+        unique_together = ['habit', 'date', 'kind', 'minute']
+
+    def __str__(self):
+        return f"{self.habit.name} - {self.kind} on {self.date}"
+
+
+class InboxNotification(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, null=True, blank=True, related_name='inbox_notifications')
+    title = models.CharField(max_length=200)
+    message = models.TextField(blank=True)
+    url = models.CharField(max_length=200, blank=True)
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'read'])]
+
+    def __str__(self):
+        return f"{self.user} - {self.title}"
+
+
+class NotificationMessageCache(models.Model):
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='message_cache')
+    date = models.DateField()
+    habit_name = models.CharField(max_length=200) # Name the messages were written for
+    messages = models.JSONField(default=dict)
+    last_used = models.DateTimeField(db_index=True) # Least recently used rows are evicted first
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['habit', 'date']
+
+    def __str__(self):
+        return f"{self.habit_name} messages for {self.date}"
+
+
+class AIResponseCache(models.Model):
+    key = models.CharField(max_length=64, unique=True) # sha256 of kind, model and normalized habit name
+    kind = models.CharField(max_length=30)
+    model = models.CharField(max_length=50)
+    prompt = models.CharField(max_length=200) # Normalized habit name the key was built from
+    response = models.JSONField()
+    latency_ms = models.PositiveIntegerField(default=0) # How long the provider took to answer
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} ({self.model}) for '{self.prompt}'"
+
+
+class AICacheCounter(models.Model):
+    name = models.CharField(max_length=20, unique=True) # hits, misses or saved_ms
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -1,88 +1,234 @@
 from datetime import datetime, timedelta
-import subprocess
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
-from .models import Habit, HabitResponse
-from .ai_utils import generate_notification_messages
-from .reminder_utils import is_time_to_notify
-
-# Simple in-memory cache for the generated AI messages
-# Keys: habit_id, Value: {'messages': {...}, 'date': date}
-NOTIFICATION_CACHE = {}
-
-def send_notification(title, message):
-    try:
-        command = ["notify-send", title, message]
-        subprocess.run(command, check=False)
-    except FileNotFoundError:
-        print(f"[FlowMotion] notify-send not found. Notification: {title} - {message}")
-    except Exception as e:
-        print(f"[FlowMotion] Notification error: {e}")
-
-
-def get_cached_messages(habit):
-    """
-    Retrieves messages from cache if valid for today, otherwise generates new ones.
-    """
-    today = timezone.localdate()
-    cache_entry = NOTIFICATION_CACHE.get(str(habit.id))
-    
-    if cache_entry and cache_entry['date'] == today:
-        return cache_entry['messages']
-    
-    messages = generate_notification_messages(habit.name)
-    NOTIFICATION_CACHE[str(habit.id)] = {
-        'messages': messages,
-        'date': today
-    }
-    return messages
-
-
-def check_habits():
+from .api_cache import bump_after_commit
+from .models import Habit, HabitResponse, NotificationDelivery, ReminderTrigger
+from .dispatcher import get_dispatcher, make_notification
+from .message_cache import get_cached_messages
+from .schedule import get_due_today
+from .triggers import KINDS, due_triggers
+
+# Reminders missed by up to this long are still sent
+CATCH_UP_LIMIT = timedelta(minutes=30)
+# Claims no sink has confirmed after this long are sent again
+CLAIM_TIMEOUT = timedelta(minutes=2)
+# Last tick of check_habits in this process, per (shard, shards)
+_last_ticks = {}
+DIGEST_LABELS = {'pre': "Coming up", 'main': "Start now", 'post': "Don't forget"}
+
+def send_notification(title, message, user_id=None, habit_id=None, url='', deliveries=()):
+    """
+    Hand a notification to the dispatcher's sinks (see dispatcher.py); never
+    blocks. `deliveries` are the ledger rows it confirms once a sink has
+    delivered it.
+    """
+    get_dispatcher().submit(make_notification(title, message, user_id=user_id, habit_id=habit_id, url=url, deliveries=deliveries))
+
+
+def reset_acknowledgments():
+    """Midnight job: every habit starts the day unacknowledged."""
+    with transaction.atomic():
+        acknowledged = Habit.objects.filter(acknowledged=True)
+        owners = set(acknowledged.values_list('user_id', flat=True).distinct())
+        acknowledged.update(acknowledged=False)
+        bump_after_commit(owners)
+
+
+def minute_ranges(start, end):
+    """
+    Split the minutes from `start` to `end` (local datetimes, inclusive) into
+    (day, first_minute, last_minute) ranges that do not cross midnight.
+    """
+    ranges = []
+    start = start.replace(second=0, microsecond=0)
+    while start <= end:
+        day_end = start.replace(hour=23, minute=59)
+        last = min(day_end, end)
+        ranges.append((start.date(), start.hour * 60 + start.minute, last.hour * 60 + last.minute))
+        start = day_end + timedelta(minutes=1)
+    return ranges
+
+
+def check_habits(shard=0, shards=1):
+    """
+    Send the reminders due since the last tick of this process (at most
+    CATCH_UP_LIMIT ago), so a delayed or skipped tick does not drop them,
+    plus those of the catch-up window whose claims no sink confirmed in
+    time. Only the trigger rows for those minutes are read (see
+    triggers.py), and the delivery ledger makes re-running a window
+    harmless. `shard` / `shards` limit it to one slice of the habits.
+    """
     now = timezone.localtime()
-    current_time = now.time()
-    today = now.date()
+    start = now - CATCH_UP_LIMIT
+    last_tick = _last_ticks.get((shard, shards))
+    if last_tick is not None:
+        start = max(start, last_tick.replace(second=0, microsecond=0) + timedelta(minutes=1))
+    fresh = {day: (first, last) for day, first, last in minute_ranges(start, now)}
+
+    sent = 0
+    for day, first, last in minute_ranges(now - CATCH_UP_LIMIT, now):
+        triggers = {trigger.pk: trigger for trigger in unconfirmed_triggers(due_triggers(first, shard, shards, until=last), day, now)}
+        if day in fresh:
+            triggers.update((trigger.pk, trigger) for trigger in due_triggers(fresh[day][0], shard, shards, until=fresh[day][1]))
+        sent += dispatch_triggers(list(triggers.values()), now, day)
+    _last_ticks[(shard, shards)] = now
+    return sent
+
+
+def unconfirmed_triggers(queryset, day, now):
+    """
+    The ReminderTrigger rows of `queryset` whose delivery on `day` was
+    claimed over CLAIM_TIMEOUT before `now` but never confirmed by a sink
+    (a full queue, a failing sink or a worker that died). Claims superseded
+    by a later reminder of the habit that day, and claims for a reminder
+    time that has since moved, are left alone.
+    """
+    ledger = NotificationDelivery.objects.filter(habit_id=OuterRef('habit_id'), date=day)
+    expired = ledger.filter(kind=OuterRef('kind'), minute=OuterRef('minute'), delivered_at__isnull=True, claimed_at__lt=now - CLAIM_TIMEOUT)
+    return queryset.filter(Exists(expired)).exclude(Exists(ledger.filter(minute__gt=OuterRef('minute'))))
+
+
+def retry_unconfirmed(queryset=None, now=None):
+    """
+    Send again the reminders of the last CATCH_UP_LIMIT whose claims no
+    sink confirmed in time, limited to the ReminderTrigger rows of
+    `queryset` (default all). Returns the number of notifications sent.
+    """
+    now = timezone.localtime(now)
+    if queryset is None:
+        queryset = ReminderTrigger.objects.all()
+    sent = 0
+    for day, first, last in minute_ranges(now - CATCH_UP_LIMIT, now):
+        rows = queryset.filter(minute__range=(first, last)).select_related('habit')
+        sent += dispatch_triggers(list(unconfirmed_triggers(rows, day, now)), now, day)
+    return sent
+
 
-    habits = Habit.objects.filter(
-        reminder_enabled=True,
-        status="active",
-        reminder_time__isnull=False,
+def claim_deliveries(triggers, day, now=None):
+    """
+    Claim the deliveries of `triggers` on `day` in the ledger, keyed by
+    habit, kind and scheduled minute. Claims left unconfirmed for
+    CLAIM_TIMEOUT are taken over; the rest are inserted with one bulk insert
+    and rows another worker holds are skipped by the unique constraint.
+    A claim only counts as delivered once a sink confirms it (see
+    dispatcher.confirm_deliveries), so a lost notification is sent again.
+    Returns {(habit_id, kind): ledger row id} for the rows this call claimed.
+    """
+    if now is None:
+        now = timezone.now()
+    token = uuid.uuid4()
+    by_minute = {}
+    for trigger in triggers:
+        by_minute.setdefault((trigger.kind, trigger.minute), []).append(trigger.habit_id)
+    if not by_minute:
+        return {}
+    expired = Q()
+    for (kind, minute), habit_ids in by_minute.items():
+        expired |= Q(kind=kind, minute=minute, habit_id__in=habit_ids)
+    NotificationDelivery.objects.filter(
+        expired, date=day, delivered_at__isnull=True, claimed_at__lt=now - CLAIM_TIMEOUT,
+    ).update(token=token, claimed_at=now)
+    NotificationDelivery.objects.bulk_create(
+        [
+            NotificationDelivery(habit_id=trigger.habit_id, date=day, kind=trigger.kind, minute=trigger.minute, token=token, claimed_at=now)
+            for trigger in triggers
+        ],
+        ignore_conflicts=True,
     )
+    rows = NotificationDelivery.objects.filter(token=token).values_list('id', 'habit_id', 'kind')
+    return {(habit_id, kind): pk for pk, habit_id, kind in rows}
+
+
+def dispatch_triggers(triggers, now, day=None):
+    """
+    Send the notifications for ReminderTrigger rows (with their habits
+    loaded) that fired on `day` (default: today) up to `now`. Skips habits
+    not due that day, deliveries already in the ledger, and post-reminders
+    for habits completed or acknowledged. When a catch-up window holds
+    several kinds for one habit only the latest is sent.
+    Returns the number of notifications sent.
+    """
+    if not triggers:
+        return 0
+    now = timezone.localtime(now)
+    if day is None:
+        day = now.date()
+    due_today = get_due_today([trigger.habit for trigger in triggers], day)
+
+    latest = {}
+    for trigger in triggers:
+        if trigger.habit_id not in due_today:
+            continue
+        current = latest.get(trigger.habit_id)
+        if current is None or KINDS.index(trigger.kind) > KINDS.index(current.kind):
+            latest[trigger.habit_id] = trigger
+
+    # Post-reminders are skipped for habits already completed that day
+    post_ids = [trigger.habit_id for trigger in latest.values() if trigger.kind == 'post']
+    completed_ids = set(
+        HabitResponse.objects.filter(habit_id__in=post_ids, date=day, completed=True).values_list('habit_id', flat=True)
+    ) if post_ids else set()
+    pending = [
+        trigger for trigger in latest.values()
+        if trigger.kind != 'post' or not (trigger.habit.acknowledged or trigger.habit_id in completed_ids)
+    ]
+    if not pending:
+        return 0
 
-    for habit in habits:
-        notification_type = is_time_to_notify(habit, current_time)
-        
-        if notification_type:
-            # Check if we already sent a notification in this same minute to prevent duplicates
-            if habit.last_notification_time and \
-               habit.last_notification_time.date() == today and \
-               habit.last_notification_time.hour == current_time.hour and \
-               habit.last_notification_time.minute == current_time.minute:
-                continue
-
-            messages = get_cached_messages(habit)
-            title = "FlowMotion"
-            
-            if notification_type == 'pre':
-                msg = messages.get('pre_reminder', f"Upcoming: {habit.name}")
-                send_notification(f"{title}: Prep Time", msg)
-            elif notification_type == 'main':
-                msg = messages.get('on_time', habit.question)
-                send_notification(f"{title}: Start Now", msg)
-            elif notification_type == 'post':
-                # Double check completion status for post-reminder safety
-                completed = HabitResponse.objects.filter(
-                    habit=habit, 
-                    date=today, 
-                    completed=True
-                ).exists()
-                
-                if not completed:
-                    msg = messages.get('overdue', f"Don't forget: {habit.name}")
-                    send_notification(f"{title}: Don't Forget", msg)
-                else:
-                    # If completed, we don't send post-reminder
-                    continue
-
-            # Update last notification time
-            habit.last_notification_time = now
-            habit.save()
+    claimed = claim_deliveries(pending, day, now)
+    by_user = {}
+    for trigger in pending:
+        if (trigger.habit_id, trigger.kind) in claimed:
+            by_user.setdefault(trigger.habit.user_id, []).append(trigger)
+
+    threshold = getattr(settings, 'NOTIFICATION_DIGEST_THRESHOLD', 3)
+    sent_ids = []
+    for user_id, group in by_user.items():
+        if threshold and len(group) >= threshold:
+            send_digest(user_id, group, [claimed[(trigger.habit_id, trigger.kind)] for trigger in group])
+        else:
+            for trigger in group:
+                send_reminder(trigger, [claimed[(trigger.habit_id, trigger.kind)]])
+        sent_ids.extend(trigger.habit_id for trigger in group)
+
+    Habit.objects.filter(pk__in=sent_ids).update(last_notification_time=now)
+    bump_after_commit(by_user)
+    return len(sent_ids)
+
+
+def send_reminder(trigger, deliveries=()):
+    """One notification for one trigger, worded by the habit's AI messages."""
+    habit = trigger.habit
+    notification_type = trigger.kind
+    messages = get_cached_messages(habit)
+    title = "FlowMotion"
+    target = {'user_id': habit.user_id, 'habit_id': habit.id, 'url': f'/habits/{habit.id}/', 'deliveries': deliveries}
+
+    if notification_type == 'pre':
+        msg = messages.get('pre_reminder', f"Upcoming: {habit.name}")
+        send_notification(f"{title}: Prep Time", msg, **target)
+    elif notification_type == 'main':
+        msg = messages.get('on_time', habit.question)
+        send_notification(f"{title}: Start Now", msg, **target)
+    elif notification_type == 'post':
+        msg = messages.get('overdue', f"Don't forget: {habit.name}")
+        send_notification(f"{title}: Don't Forget", msg, **target)
+
+
+def send_digest(user_id, triggers, deliveries=()):
+    """
+    One notification covering several of a user's triggers that fired
+    together. Lists the habits by kind and skips the per-habit AI messages.
+    """
+    lines = []
+    for kind in KINDS:
+        names = sorted(trigger.habit.name for trigger in triggers if trigger.kind == kind)
+        if names:
+            lines.append(f"{DIGEST_LABELS[kind]}: {', '.join(names)}")
+    send_notification(
+        f"FlowMotion: {len(triggers)} habits", "\n".join(lines), user_id=user_id, url='/dashboard/',
+        deliveries=deliveries,
+    )
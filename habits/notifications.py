@@ -1,5 +1,4 @@
-import subprocess
-import os
+from .dispatcher import get_dispatcher, make_notification
 
 def send_linux_notification(habit_name, question, emotional_state='happy', habit_id=None):
     """
@@ -21,15 +20,5 @@ def send_linux_notification(habit_name, question, emotional_state='happy', habit
         url = f"http://localhost:5000/habits/{habit_id}/"
         message += f"\nClick to respond: {url}"
 
-    try:
-        # notify-send [options] <summary> [body]
-        subprocess.run([
-            'notify-send',
-            '-a', 'FlowMotion',
-            '-i', 'appointment-new', # Standard icon
-            title,
-            message
-        ], check=False)
-    except Exception as e:
-        # Silently fail if notify-send is not available (e.g., in Replit environment)
-        print(f"Notification failed: {e}")
+    # Queued for the dispatcher's sinks so a hung desktop bus cannot block the caller
+    get_dispatcher().submit(make_notification(title, message, habit_id=habit_id, icon='appointment-new'))
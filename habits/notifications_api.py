@@ -1,56 +1,42 @@
+from datetime import timedelta
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from .models import Habit, HabitResponse
+from django.views.decorators.http import condition
+from .api_cache import make_etag
+from .reminder_utils import LOOKAHEAD, get_reminder_schedule, upcoming_reminders
+
+# The response window moves in steps of this many seconds, so polls inside one
+# step get identical bodies and can be answered with a 304.
+WINDOW_STEP = 15 * 60
+
+
+def _window_start():
+    now = timezone.now()
+    return now - timedelta(seconds=now.timestamp() % WINDOW_STEP)
+
+
+def reminders_etag(request):
+    schedule = get_reminder_schedule(request.user.pk)
+    return make_etag(request.user.pk, schedule['built'], _window_start().timestamp())
 
 
 @login_required
+@condition(etag_func=reminders_etag)
 def habit_reminders_api(request):
     """
     Returns upcoming habit reminders for the current user.
     Used by the browser notification system to schedule notifications.
+    Covers the next 24 hours from the user's precomputed daily schedule
+    (see reminder_utils.get_reminder_schedule); reminders missed within the
+    last hour are included so the browser can fire them immediately.
     """
-    now = timezone.now()
-    today = now.date()
-    current_time = now.time()
-
-    habits = Habit.objects.filter(
-        user=request.user,
-        status='active',
-        reminder_enabled=True,
-        reminder_time__isnull=False,
-    )
-
-    reminders = []
-    for habit in habits:
-        # Skip if already completed today
-        completed_today = HabitResponse.objects.filter(
-            habit=habit,
-            date=today,
-            completed=True,
-        ).exists()
-
-        if completed_today:
-            continue
-
-        # Calculate delay in milliseconds until reminder time
-        from datetime import datetime, timedelta
-        reminder_dt = datetime.combine(today, habit.reminder_time)
-        reminder_dt = timezone.make_aware(reminder_dt)
-
-        delay_seconds = (reminder_dt - now).total_seconds()
-
-        # Include reminders that are coming up (within the next 24 hours)
-        # Also include past reminders (negative delay) so the browser can fire them immediately
-        if delay_seconds > -3600:  # Within the last hour or upcoming
-            reminders.append({
-                'id': str(habit.id),
-                'name': habit.name,
-                'question': habit.question,
-                'reminder_time': habit.reminder_time.strftime('%H:%M'),
-                'delay_ms': max(0, int(delay_seconds * 1000)),  # 0 = fire immediately
-                'url': f'/habits/{habit.id}/',
-                'color': habit.color,
-            })
-
-    return JsonResponse({'reminders': reminders})
+    window_start = _window_start()
+    reminders = [
+        dict(entry, fire_at=entry['fire_at'].isoformat())
+        for entry in upcoming_reminders(get_reminder_schedule(request.user.pk), window_start)
+    ]
+    return JsonResponse({
+        'reminders': reminders,
+        'lookahead_hours': int(LOOKAHEAD.total_seconds() // 3600),
+    })
@@ -0,0 +1,232 @@
+"""
+Event-driven reminder scheduler.
+Keeps the next firing time of every ReminderTrigger in a heap and sleeps
+until the earliest one, so reminders go out on time and idle periods cost
+nothing. Trigger rows are recreated whenever a habit's reminder settings
+change (see triggers.py), so new rows are picked up incrementally by id and
+rows that no longer exist are simply dropped when their entry comes due.
+Reminders no sink confirmed are retried when the claims this scheduler made
+expire (see notification_service.retry_unconfirmed), not on every wake-up.
+
+notify_scheduler() only reaches a scheduler in the same process (runserver).
+Under run_reminder_worker habits are edited in the web processes, so the
+worker instead looks for new trigger rows every RELOAD_INTERVAL seconds: one
+indexed id > last-seen query per wake-up, traded for picking up edits within
+that interval without a cross-process channel. Pass reload_interval=None
+where the signal covers every edit.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .message_cache import prewarm_messages
+from .models import ReminderTrigger
+from .notification_service import CATCH_UP_LIMIT, CLAIM_TIMEOUT, dispatch_triggers, reset_acknowledgments, retry_unconfirmed
+from .triggers import shard_triggers
+from .widget_utils import roll_forward_countdowns
+
+logger = logging.getLogger(__name__)
+
+# How often to look for triggers created by other processes; None disables it
+RELOAD_INTERVAL = 30
+# Longest single sleep, so clock changes are noticed
+MAX_SLEEP = 300
+
+
+def next_fire_time(minute, now):
+    """First time at or after the start of `now`'s minute that falls on `minute` of the day."""
+    local = timezone.localtime(now)
+    fire_at = timezone.make_aware(datetime.combine(local.date(), time(minute // 60, minute % 60)))
+    if fire_at < local.replace(second=0, microsecond=0):
+        fire_at = timezone.make_aware(datetime.combine(local.date() + timedelta(days=1), time(minute // 60, minute % 60)))
+    return fire_at
+
+
+def claim_expiry(claimed_at):
+    """When a claim made at `claimed_at` can first be retried (claims expire strictly after CLAIM_TIMEOUT)."""
+    return claimed_at + CLAIM_TIMEOUT + timedelta(seconds=1)
+
+
+class ReminderScheduler:
+    def __init__(self, reload_interval=RELOAD_INTERVAL, queryset=None):
+        self.reload_interval = reload_interval
+        # Restricts the triggers this scheduler owns (e.g. one shard)
+        self.queryset = queryset if queryset is not None else ReminderTrigger.objects.all()
+        self._heap = []  # (fire_at, trigger_id, minute)
+        self._expiries = []  # When claims made by this scheduler may need a retry
+        self._max_id = 0
+        self._day = None
+        self._changed = False
+        self._stopped = False
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self.sent = 0
+
+    def load(self, now=None):
+        """Push every trigger row created since the last load. Returns how many were added."""
+        if now is None:
+            now = timezone.now()
+        local_day = timezone.localdate(now)
+        if local_day != self._day:
+            # Start each day from a fresh heap so stale entries do not accumulate
+            self._heap, self._max_id, self._day = [], 0, local_day
+
+        # A fresh heap also queues what fired within CATCH_UP_LIMIT, so a
+        # restart does not drop reminders; the delivery ledger skips any
+        # that were already sent.
+        since = now - CATCH_UP_LIMIT if self._max_id == 0 else now
+        rows = self.queryset.filter(id__gt=self._max_id).order_by('id').values_list('id', 'minute')
+        added = 0
+        for trigger_id, minute in rows.iterator(chunk_size=5000):
+            heapq.heappush(self._heap, (next_fire_time(minute, since), trigger_id, minute))
+            self._max_id = trigger_id
+            added += 1
+        return added
+
+    def run_pending(self, now=None):
+        """Dispatch every entry due at or before `now`. Returns the number of notifications sent."""
+        if now is None:
+            now = timezone.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        if not due:
+            return 0
+
+        triggers = {
+            trigger.id: trigger
+            for trigger in ReminderTrigger.objects.filter(id__in=[entry[1] for entry in due]).select_related('habit')
+        }
+        sent = 0
+        for fire_at in sorted({entry[0] for entry in due}):
+            batch = [triggers[entry[1]] for entry in due if entry[0] == fire_at and entry[1] in triggers]
+            if batch and now - fire_at > CATCH_UP_LIMIT:
+                logger.warning(f"Skipping {len(batch)} reminders due at {fire_at}, {now - fire_at} late")
+                continue
+            sent += dispatch_triggers(batch, now, timezone.localdate(fire_at))
+        if sent:
+            heapq.heappush(self._expiries, claim_expiry(now))
+        for fire_at, trigger_id, minute in due:
+            if trigger_id in triggers:
+                heapq.heappush(self._heap, (fire_at + timedelta(days=1), trigger_id, minute))
+        self.sent += sent
+        return sent
+
+    def retry_unconfirmed(self, now=None):
+        """Send again the recent reminders of this scheduler's triggers that no sink confirmed. Returns how many were sent."""
+        if now is None:
+            now = timezone.now()
+        sent = retry_unconfirmed(self.queryset, now)
+        if sent:
+            heapq.heappush(self._expiries, claim_expiry(now))
+        self.sent += sent
+        return sent
+
+    def run_retries(self, now=None):
+        """Retry unconfirmed reminders once a claim made by this scheduler has expired. Returns how many were sent."""
+        if now is None:
+            now = timezone.now()
+        if not self._expiries or self._expiries[0] > now:
+            return 0
+        sent = self.retry_unconfirmed(now)
+        # Only once the retry went through, so a failed one is tried again on the next wake-up
+        while self._expiries and self._expiries[0] <= now:
+            heapq.heappop(self._expiries)
+        return sent
+
+    def seconds_until_next(self, now=None):
+        if now is None:
+            now = timezone.now()
+        delay = MAX_SLEEP
+        if self._heap:
+            delay = min(delay, (self._heap[0][0] - now).total_seconds())
+        if self._expiries:
+            delay = min(delay, (self._expiries[0] - now).total_seconds())
+        if self.reload_interval:
+            delay = min(delay, self.reload_interval)
+        return max(delay, 0)
+
+    def pending_count(self):
+        """Number of queued entries, including ones whose trigger has since been replaced."""
+        return len(self._heap)
+
+    def notify_changed(self):
+        """Wake the scheduler to load triggers created in this process."""
+        with self._wakeup:
+            self._changed = True
+            self._wakeup.notify()
+
+    def run_forever(self):
+        self._changed = True  # Load immediately on start
+        # Pick up claims a previous leader left unconfirmed, including ones not yet expired
+        now = timezone.now()
+        self._expiries = [now, claim_expiry(now)]
+        while True:
+            with self._wakeup:
+                if not self._changed and not self._stopped:
+                    self._wakeup.wait(self.seconds_until_next())
+                if self._stopped:
+                    return
+                self._changed = False
+            try:
+                close_old_connections()
+                self.load()
+                self.run_pending()
+                self.run_retries()
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {e}")
+
+    def start(self):
+        global active_scheduler
+        self._thread = threading.Thread(target=self.run_forever, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+        active_scheduler = self
+        return self
+
+    def stop(self):
+        global active_scheduler
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+        if active_scheduler is self:
+            active_scheduler = None
+
+
+# The scheduler running in this process, if any
+active_scheduler = None
+
+
+def notify_scheduler():
+    if active_scheduler is not None:
+        active_scheduler.notify_changed()
+
+
+def start_background_jobs(shard=0, shards=1, reload_interval=RELOAD_INTERVAL):
+    """
+    Start the reminder scheduler thread for one shard of the habits, plus
+    the housekeeping jobs (midnight acknowledgment reset, countdown
+    roll-forward, overnight notification message prewarm) on shard 0. Returns (scheduler, stop) where stop() shuts
+    everything down again. `reload_interval` is passed to the scheduler.
+    """
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    jobs = None
+    if shard == 0:
+        jobs = BackgroundScheduler()
+        jobs.add_job(reset_acknowledgments, 'cron', hour=0, minute=0, id='reset_acks_job', replace_existing=True)
+        jobs.add_job(roll_forward_countdowns, 'interval', minutes=5, id='roll_countdowns_job', replace_existing=True)
+        jobs.add_job(prewarm_messages, 'cron', hour=getattr(settings, 'NOTIFICATION_PREWARM_HOUR', 3), minute=0,
+                     id='prewarm_messages_job', replace_existing=True)
+        jobs.start()
+    reminders = ReminderScheduler(
+        reload_interval=reload_interval, queryset=shard_triggers(ReminderTrigger.objects.all(), shard, shards),
+    ).start()
+
+    def stop():
+        reminders.stop()
+        if jobs is not None:
+            jobs.shutdown(wait=False)
+    return reminders, stop
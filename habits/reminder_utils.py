@@ -1,5 +1,10 @@
 from datetime import datetime, timedelta, time
+from time import time_ns
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
+from .models import Habit, HabitResponse
+from .schedule import get_due_today
 
 def get_reminder_times(reminder_time, minutes_before=5, minutes_after=5, reference_date=None):
     """
@@ -47,3 +52,72 @@ def is_time_to_notify(habit, current_time=None):
         return 'post'
         
     return None
+
+
+SCHEDULE_KEY = 'flowmotion:reminder-schedule:{user_id}:{day}'
+SCHEDULE_TIMEOUT = 60 * 60 * 26
+LOOKAHEAD = timedelta(hours=24)
+GRACE = timedelta(hours=1)
+# Habit fields that affect a user's reminder schedule
+SCHEDULE_FIELDS = {
+    'name', 'question', 'color', 'status', 'reminder_enabled', 'reminder_time',
+    'recurrence', 'frequency', 'selected_days', 'target_date',
+}
+
+
+def build_reminder_schedule(user_id, today):
+    """
+    Reminders for `today` and the following day, each with an aware `fire_at`.
+    Today's completions are joined in the same query, and habits already
+    completed today are left out of today's entries.
+    """
+    habits = list(
+        Habit.objects.filter(
+            user_id=user_id,
+            status='active',
+            reminder_enabled=True,
+            reminder_time__isnull=False,
+        ).annotate(
+            completed_today=Exists(HabitResponse.objects.filter(habit=OuterRef('pk'), date=today, completed=True))
+        ).order_by('reminder_time')
+    )
+
+    entries = []
+    for day in (today, today + timedelta(days=1)):
+        due = get_due_today(habits, day)
+        for habit in habits:
+            if habit.id not in due or (day == today and habit.completed_today):
+                continue
+            entries.append({
+                'id': str(habit.id),
+                'name': habit.name,
+                'question': habit.question,
+                'reminder_time': habit.reminder_time.strftime('%H:%M'),
+                'fire_at': timezone.make_aware(datetime.combine(day, habit.reminder_time)),
+                'url': f'/habits/{habit.id}/',
+                'color': habit.color,
+            })
+    entries.sort(key=lambda entry: entry['fire_at'])
+    return {'built': time_ns(), 'entries': entries}
+
+
+def get_reminder_schedule(user_id, today=None):
+    """The user's precomputed schedule for `today`, built on first use."""
+    if today is None:
+        today = timezone.localdate()
+    key = SCHEDULE_KEY.format(user_id=user_id, day=today.isoformat())
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = build_reminder_schedule(user_id, today)
+        cache.set(key, schedule, SCHEDULE_TIMEOUT)
+    return schedule
+
+
+def invalidate_reminder_schedule(user_id):
+    """Drop today's schedule so the next request rebuilds it."""
+    cache.delete(SCHEDULE_KEY.format(user_id=user_id, day=timezone.localdate().isoformat()))
+
+
+def upcoming_reminders(schedule, now):
+    """Entries due within the lookahead window, plus those missed by less than GRACE."""
+    return [entry for entry in schedule['entries'] if now - GRACE < entry['fire_at'] <= now + LOOKAHEAD]
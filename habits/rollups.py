@@ -0,0 +1,144 @@
+"""
+Incrementally maintained rollups: per-user daily rows and per-habit
+completion counters.
+The check-in path applies the difference between a response's state before
+and after a write, so statistics can read one small row per day (or a column
+on Habit) instead of rescanning HabitResponse.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from .api_cache import bump_after_commit
+from .bitmaps import set_day
+from .models import DailyRollup, Habit, HabitResponse
+
+
+def response_state(response):
+    """Snapshot of the fields a rollup depends on: (completed, value)."""
+    value = Decimal(str(response.value)) if response.value is not None else Decimal('0')
+    return (bool(response.completed), value)
+
+
+def apply_response_change(habit_id, user_id, day, before, after):
+    """
+    Apply the change from `before` to `after` (each a response_state() tuple,
+    or None when the response did not / no longer exists) to the habit's
+    counters, its completion bitmap and the user's rollup row for `day` using
+    atomic F-expression updates.
+    """
+    before_total, before_completed, before_value = (1, int(before[0]), before[1]) if before else (0, 0, Decimal('0'))
+    after_total, after_completed, after_value = (1, int(after[0]), after[1]) if after else (0, 0, Decimal('0'))
+
+    total_delta = after_total - before_total
+    completed_delta = after_completed - before_completed
+    value_delta = after_value - before_value
+    if not (total_delta or completed_delta or value_delta):
+        return
+
+    with transaction.atomic():
+        if total_delta or completed_delta:
+            Habit.objects.filter(pk=habit_id).update(
+                total_responses=F('total_responses') + total_delta,
+                completed_responses=F('completed_responses') + completed_delta,
+            )
+        if completed_delta:
+            set_day(habit_id, day, completed_delta > 0)
+        # Only create the row when a response is being added; removals may run
+        # while the user is being deleted and must not resurrect rows.
+        if total_delta > 0:
+            DailyRollup.objects.get_or_create(user_id=user_id, date=day)
+        DailyRollup.objects.filter(user_id=user_id, date=day).update(
+            total=F('total') + total_delta,
+            completed=F('completed') + completed_delta,
+            value_sum=F('value_sum') + value_delta,
+        )
+        bump_after_commit([user_id])
+
+
+def remove_habit_from_rollups(habit_id, user_id):
+    """
+    Subtract all of a habit's responses from the owner's rollup rows in one
+    pass, for a habit that is about to be deleted. Returns the number of
+    rollup rows changed.
+    """
+    rows = HabitResponse.objects.filter(habit_id=habit_id).order_by().values('date').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True)),
+        value_sum=Sum('value'),
+    )
+    removed = {row['date']: row for row in rows}
+    if not removed:
+        return 0
+
+    with transaction.atomic():
+        rollups = list(DailyRollup.objects.select_for_update().filter(user_id=user_id, date__in=list(removed)))
+        for rollup in rollups:
+            row = removed[rollup.date]
+            rollup.total -= row['total']
+            rollup.completed -= row['completed']
+            rollup.value_sum -= row['value_sum'] or 0
+        DailyRollup.objects.bulk_update(rollups, ['total', 'completed', 'value_sum'], batch_size=1000)
+        bump_after_commit([user_id])
+    return len(rollups)
+
+
+def rebuild_rollups(user_ids=None):
+    """
+    Recompute rollup rows from HabitResponse. Rebuilds every user when
+    `user_ids` is None. Returns the number of rows written.
+    """
+    responses = HabitResponse.objects.all()
+    rollups = DailyRollup.objects.all()
+    if user_ids is not None:
+        responses = responses.filter(habit__user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    rows = responses.order_by().values('habit__user_id', 'date').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True)),
+        value_sum=Sum('value'),
+    )
+
+    with transaction.atomic():
+        affected = set(rollups.values_list('user_id', flat=True).distinct())
+        rollups.delete()
+        created = DailyRollup.objects.bulk_create(
+            [
+                DailyRollup(
+                    user_id=row['habit__user_id'],
+                    date=row['date'],
+                    total=row['total'],
+                    completed=row['completed'],
+                    value_sum=row['value_sum'] or 0,
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+        bump_after_commit(affected | {rollup.user_id for rollup in created})
+    return len(created)
+
+
+def reconcile_habit_counters(fix=True):
+    """
+    Compare Habit.total_responses / completed_responses with the actual
+    response counts. Returns a list of (habit_id, stored, actual) tuples for
+    every habit that drifted, repairing them when `fix` is True.
+    """
+    rows = Habit.objects.annotate(
+        response_count=Count('responses'),
+        completed_count=Count('responses', filter=Q(responses__completed=True)),
+    ).values_list('id', 'user_id', 'total_responses', 'completed_responses', 'response_count', 'completed_count')
+
+    drifted, owners = [], set()
+    for habit_id, user_id, stored_total, stored_completed, total, completed in rows:
+        if (stored_total, stored_completed) != (total, completed):
+            drifted.append((habit_id, (stored_total, stored_completed), (total, completed)))
+            owners.add(user_id)
+
+    if fix:
+        with transaction.atomic():
+            for habit_id, _, (total, completed) in drifted:
+                Habit.objects.filter(pk=habit_id).update(total_responses=total, completed_responses=completed)
+            bump_after_commit(owners)
+    return drifted
@@ -0,0 +1,177 @@
+"""
+Schedule utilities for FlowMotion habits.
+Turns a habit's recurrence / frequency / selected_days into the periods in
+which it has to be completed once, and expands those schedules for many
+habits over a date range at a time.
+"""
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def get_schedule(habit):
+    """
+    Returns (kind, weekdays) for a habit:
+    - 'once': a single day (target_date, or the creation day)
+    - 'days': every day whose weekday index is in `weekdays`
+    - 'weekly': once per Monday-to-Sunday week
+    - 'daily': every day
+    """
+    weekdays = frozenset(WEEKDAYS.index(day) for day in (habit.selected_days or []) if day in WEEKDAYS)
+    if habit.recurrence == 'none':
+        return 'once', weekdays
+    if weekdays:
+        return 'days', weekdays
+    if habit.recurrence == 'weekly' or habit.frequency == 'weekly':
+        return 'weekly', weekdays
+    return 'daily', weekdays
+
+
+def get_start_date(habit):
+    return habit.created_at.date() if habit.created_at else None
+
+
+def get_periods(habit, start, end):
+    """
+    Returns the (first_day, last_day) periods of the habit that begin on or
+    before `end`, in chronological order. A period is satisfied by one
+    completion on any day inside it; the first period is clipped to `start`.
+    """
+    kind, weekdays = get_schedule(habit)
+    if kind == 'once':
+        day = habit.target_date or get_start_date(habit) or start
+        return [(day, day)] if start <= day <= end else []
+    return _expand(kind, weekdays, start, end)
+
+
+def _expand(kind, weekdays, start, end):
+    if kind == 'weekly':
+        periods = []
+        week_start = start - timedelta(days=start.weekday())
+        while week_start <= end:
+            periods.append((max(week_start, start), week_start + timedelta(days=6)))
+            week_start += timedelta(days=7)
+        return periods
+
+    days = []
+    day = start
+    while day <= end:
+        if kind == 'daily' or day.weekday() in weekdays:
+            days.append((day, day))
+        day += timedelta(days=1)
+    return days
+
+
+def _habit_periods(habit, start, end, cache):
+    """
+    Returns (periods, first_index, habit_start): the shared expansion of the
+    habit's schedule over start..end, and the index of its first period on or
+    after the habit's own start date.
+    """
+    kind, weekdays = get_schedule(habit)
+    habit_start = max(start, get_start_date(habit) or start)
+    if kind == 'once':
+        return get_periods(habit, start, end), 0, start
+    if (kind, weekdays) not in cache:
+        periods = _expand(kind, weekdays, start, end)
+        cache[(kind, weekdays)] = (periods, [last for _, last in periods])
+    periods, lasts = cache[(kind, weekdays)]
+    if habit_start > end:
+        return periods, len(periods), habit_start
+    return periods, bisect_left(lasts, habit_start), habit_start
+
+
+def expand_periods(habits, start, end):
+    """
+    Returns {habit.id: [(first_day, last_day), ...]} for many habits at once.
+    Habits sharing a schedule reuse one expansion of the range; each habit's
+    list is clipped to its start date.
+    """
+    cache = {}
+    result = {}
+    for habit in habits:
+        periods, index, habit_start = _habit_periods(habit, start, end, cache)
+        habit_periods = periods[index:]
+        if habit_periods and habit_periods[0][0] < habit_start:
+            habit_periods[0] = (habit_start, habit_periods[0][1])
+        result[habit.id] = habit_periods
+    return result
+
+
+def count_due(habits, start, end):
+    """Returns {habit.id: number of periods due between start and end} without building the lists."""
+    cache = {}
+    counts = {}
+    for habit in habits:
+        periods, index, _ = _habit_periods(habit, start, end, cache)
+        counts[habit.id] = len(periods) - index
+    return counts
+
+
+def expand_due_dates(habits, start, end):
+    """
+    Returns {habit.id: [date, ...]}: every day on which each habit can be
+    completed. For weekly habits that is every day of each week.
+    """
+    due = {}
+    for habit_id, periods in expand_periods(habits, start, end).items():
+        days = []
+        for first, last in periods:
+            day = first
+            while day <= min(last, end):
+                days.append(day)
+                day += timedelta(days=1)
+        due[habit_id] = days
+    return due
+
+
+def get_due_today(habits, today=None):
+    """Returns the ids of the habits that have a period covering `today`."""
+    if today is None:
+        today = date.today()
+    return {habit_id for habit_id, periods in expand_periods(habits, today, today).items() if periods}
+
+
+def filter_due(habits, today=None):
+    """Returns the habits from `habits` that are due today, preserving order."""
+    habits = list(habits)
+    due_today = get_due_today(habits, today)
+    return [habit for habit in habits if habit.id in due_today]
+
+
+def completion_rate(completed, due):
+    """Completion percentage against the number of due periods, capped at 100."""
+    if not due:
+        return 0
+    return round(min(completed / due, 1) * 100, 1)
+
+
+def get_next_occurrence(target_date, target_time, recurrence, selected_days, now):
+    """
+    Returns the first occurrence of a countdown at or after `now`.
+    `now` may be naive or aware; the result uses the same tzinfo. Non-repeating
+    countdowns keep their target even once it has passed.
+    """
+    occurrence = datetime.combine(target_date, target_time)
+    if now.tzinfo is not None:
+        occurrence = occurrence.replace(tzinfo=now.tzinfo)
+    weekdays = {WEEKDAYS.index(day) for day in (selected_days or []) if day in WEEKDAYS}
+
+    if recurrence == 'none':
+        return occurrence
+
+    if weekdays:
+        step = timedelta(days=1)
+    elif recurrence == 'weekly':
+        step = timedelta(days=7)
+    else:
+        step = timedelta(days=1)
+
+    if occurrence < now:
+        # Jump forward in whole steps rather than looping one step at a time
+        behind = now - occurrence
+        occurrence += step * -(-behind // step)
+    while weekdays and occurrence.weekday() not in weekdays:
+        occurrence += timedelta(days=1)
+    return occurrence
@@ -0,0 +1,126 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .api_cache import bump_after_commit
+from .events import broker
+from .models import Habit, HabitResponse, StreakData
+from .reminder_utils import SCHEDULE_FIELDS, invalidate_reminder_schedule
+from .rollups import apply_response_change, remove_habit_from_rollups, response_state
+from .reminder_scheduler import notify_scheduler
+from .triggers import TRIGGER_FIELDS, sync_triggers
+
+
+def _owner_id(instance):
+    """User id owning a Habit, HabitResponse or StreakData instance."""
+    if isinstance(instance, Habit):
+        return instance.user_id
+    habit = instance._state.fields_cache.get('habit')
+    if habit is not None:
+        return habit.user_id
+    return Habit.objects.filter(pk=instance.habit_id).values_list('user_id', flat=True).first()
+
+
+def _cascaded(instance, origin):
+    """
+    Whether `instance` is only being deleted because the habit or user it
+    belongs to is; the handlers for that deletion cover it in bulk.
+    """
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if isinstance(instance, Habit):
+        return issubclass(model, User)
+    return not isinstance(instance, model)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def data_changed(sender, instance, origin=None, **kwargs):
+    """Invalidate the owner's cached API responses on any habit data write."""
+    if not isinstance(instance, (Habit, HabitResponse, StreakData)) or _cascaded(instance, origin):
+        return
+    bump_after_commit([_owner_id(instance)])
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def reminder_schedule_changed(sender, instance, update_fields=None, origin=None, **kwargs):
+    """
+    Drop the owner's precomputed reminder schedule when a reminder setting
+    changes or a response (completion) is written.
+    """
+    if _cascaded(instance, origin):
+        return
+    if isinstance(instance, Habit):
+        relevant = SCHEDULE_FIELDS
+    elif isinstance(instance, HabitResponse):
+        relevant = {'completed'}
+    else:
+        return
+    if update_fields is not None and not relevant & set(update_fields):
+        return
+    user_id = _owner_id(instance)
+    if user_id is not None:
+        invalidate_reminder_schedule(user_id)
+        broker.publish(user_id, 'reminders', {})
+
+
+@receiver(post_save)
+def reminder_settings_saved(sender, instance, update_fields=None, **kwargs):
+    """Keep a habit's minute-of-day trigger rows in step with its reminder settings."""
+    if not isinstance(instance, Habit):
+        return
+    if update_fields is not None and not TRIGGER_FIELDS & set(update_fields):
+        return
+    sync_triggers(instance)
+    transaction.on_commit(notify_scheduler)
+
+
+@receiver(post_save, sender=HabitResponse)
+@receiver(post_save, sender=StreakData)
+def push_change(sender, instance, update_fields=None, **kwargs):
+    """Push completions and streak changes to the owner's open event streams."""
+    if not broker.has_subscribers():
+        return
+    if sender is HabitResponse:
+        if update_fields is not None and 'completed' not in update_fields:
+            return
+        event, data = 'completion', {
+            'habit_id': str(instance.habit_id),
+            'date': instance.date.isoformat(),
+            'completed': bool(instance.completed),
+        }
+    else:
+        event, data = 'streak', {
+            'habit_id': str(instance.habit_id),
+            'current_streak': instance.current_streak,
+            'best_streak': instance.best_streak,
+        }
+    user_id = _owner_id(instance)
+    if user_id is not None:
+        broker.publish(user_id, event, data)
+
+
+@receiver(pre_delete, sender=Habit)
+def habit_deleting(sender, instance, origin=None, **kwargs):
+    """
+    Take a habit's responses out of the owner's rollups in one pass before
+    they are cascade-deleted (response_deleted skips them). Nothing to do
+    when the user goes too, since the rollups are deleted with them.
+    """
+    if _cascaded(instance, origin):
+        return
+    remove_habit_from_rollups(instance.pk, instance.user_id)
+
+
+@receiver(post_delete, sender=HabitResponse)
+def response_deleted(sender, instance, origin=None, **kwargs):
+    """Remove a deleted response from the habit's counters and the owner's daily rollup."""
+    if _cascaded(instance, origin):
+        return
+    user_id = Habit.objects.filter(pk=instance.habit_id).values_list('user_id', flat=True).first()
+    if user_id is None:
+        return
+    apply_response_change(instance.habit_id, user_id, instance.date, response_state(instance), None)
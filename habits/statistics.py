@@ -3,7 +3,10 @@ Statistics and analytics utilities for FlowMotion habits.
 Calculates completion rates, streaks, and weekly data for charts.
 """
 from datetime import date, timedelta
-from .models import Habit, HabitResponse, StreakData
+from django.db.models import Prefetch
+from .bitmaps import load_bitmap, load_bitmaps
+from .models import Habit, HabitResponse, StreakData, DailyRollup
+from .schedule import completion_rate, count_due, expand_periods, get_due_today, get_start_date
 
 
 def get_week_dates():
@@ -14,6 +17,64 @@ def get_week_dates():
     return [start + timedelta(days=i) for i in range(7)]
 
 
+def get_dashboard_data(user, today=None):
+    """
+    Loads the active habits for the dashboard together with today's response
+    and streak row in two queries, regardless of how many habits the user has.
+    Only habits that are due today according to their schedule are returned.
+    Habits without a StreakData row get an unsaved placeholder instead of an
+    INSERT during the request.
+    """
+    if today is None:
+        today = date.today()
+
+    habits = Habit.objects.filter(user=user, status='active').select_related('streak').prefetch_related(
+        Prefetch(
+            'responses',
+            queryset=HabitResponse.objects.filter(date=today),
+            to_attr='today_responses',
+        )
+    )
+
+    habits = list(habits)
+    due_today = get_due_today(habits, today)
+
+    habits_data = []
+    for habit in habits:
+        if habit.id not in due_today:
+            continue
+        response = habit.today_responses[0] if habit.today_responses else None
+        try:
+            streak = habit.streak
+        except StreakData.DoesNotExist:
+            streak = StreakData(habit=habit)
+
+        habits_data.append({
+            'habit': habit,
+            'response': response,
+            'streak': streak,
+            'completed_today': response.completed if response else False,
+        })
+    return habits_data
+
+
+def get_daily_counts(user, start_date=None, end_date=None):
+    """
+    Returns {date: (total, completed)} for the user's responses, read from the
+    incrementally maintained DailyRollup table (one row per active day).
+    """
+    rollups = DailyRollup.objects.filter(user=user)
+    if start_date is not None:
+        rollups = rollups.filter(date__gte=start_date)
+    if end_date is not None:
+        rollups = rollups.filter(date__lte=end_date)
+
+    return {
+        day: (total, completed)
+        for day, total, completed in rollups.values_list('date', 'total', 'completed')
+    }
+
+
 def get_weekly_data(user):
     """
     Returns weekly completion data for all user habits.
@@ -22,19 +83,9 @@ def get_weekly_data(user):
     week_dates = get_week_dates()
     labels = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
     
-    daily_completed = []
-    daily_total = []
-    
-    for day_date in week_dates:
-        responses = HabitResponse.objects.filter(
-            habit__user=user,
-            date=day_date
-        )
-        completed_count = responses.filter(completed=True).count()
-        total_count = responses.count()
-        
-        daily_completed.append(completed_count)
-        daily_total.append(total_count)
+    counts = get_daily_counts(user, week_dates[0], week_dates[-1])
+    daily_total = [counts.get(day_date, (0, 0))[0] for day_date in week_dates]
+    daily_completed = [counts.get(day_date, (0, 0))[1] for day_date in week_dates]
     
     return {
         'labels': labels,
@@ -51,14 +102,7 @@ def get_habit_weekly_data(habit):
     week_dates = get_week_dates()
     labels = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
     
-    daily_data = []
-    for day_date in week_dates:
-        response = HabitResponse.objects.filter(
-            habit=habit,
-            date=day_date
-        ).first()
-        completed = 1 if response and response.completed else 0
-        daily_data.append(completed)
+    daily_data = load_bitmap(habit).heatmap(week_dates[0], week_dates[-1])
     
     return {
         'labels': labels,
@@ -67,64 +111,140 @@ def get_habit_weekly_data(habit):
     }
 
 
+def get_bulk_habit_statistics(habits):
+    """
+    Get statistics for many habits at once.
+    Streaks and the denormalized response counters come from a single query
+    joining the streak row, keyed by habit id; the completion rate counts the
+    due periods satisfied in the habits' bitmaps (one more query).
+    """
+    habit_ids = [habit.id for habit in habits]
+    if not habit_ids:
+        return {}
+
+    rows = Habit.objects.filter(id__in=habit_ids).values(
+        'id', 'total_responses', 'completed_responses',
+        'streak__current_streak', 'streak__best_streak',
+    )
+    habits = attach_period_counts(habits)
+    periods = {habit.id: (habit.satisfied_count, habit.due_count) for habit in habits}
+
+    stats = {}
+    for row in rows:
+        satisfied, due = periods[row['id']]
+        stats[row['id']] = {
+            'current_streak': row['streak__current_streak'] or 0,
+            'best_streak': row['streak__best_streak'] or 0,
+            'total_completions': row['completed_responses'],
+            'total_responses': row['total_responses'],
+            'due_count': due,
+            'completion_rate': completion_rate(satisfied, due),
+        }
+    return stats
+
+
 def get_habit_statistics(habit):
     """
     Get comprehensive statistics for a habit.
     """
-    streak, _ = StreakData.objects.get_or_create(habit=habit)
-    
-    total_responses = HabitResponse.objects.filter(habit=habit).count()
-    completed_responses = HabitResponse.objects.filter(
-        habit=habit, 
-        completed=True
-    ).count()
-    completion_rate = (completed_responses / total_responses * 100) if total_responses > 0 else 0
-    
-    return {
-        'current_streak': streak.current_streak,
-        'best_streak': streak.best_streak,
-        'total_completions': completed_responses,
-        'total_responses': total_responses,
-        'completion_rate': round(completion_rate, 1),
-    }
+    return get_bulk_habit_statistics([habit])[habit.id]
+
+
+def attach_period_counts(habits, today=None):
+    """
+    Set `due_count` (periods due since the habit started) and
+    `satisfied_count` (those with a completion) on every habit in `habits`,
+    with one shared schedule expansion and one bitmap query, for
+    Habit.completion_rate.
+    """
+    if today is None:
+        today = date.today()
+    habits = list(habits)
+    start = min((get_start_date(habit) or today for habit in habits), default=today)
+    due = count_due(habits, start, today)
+    satisfied = satisfied_periods(habits, load_bitmaps([habit.id for habit in habits]), start, today)
+    for habit in habits:
+        habit.due_count = due.get(habit.id, 0)
+        habit.satisfied_count = satisfied.get(habit.id, 0)
+    return habits
+
+
+def satisfied_periods(habits, bitmaps, start, end):
+    """
+    Returns {habit.id: number of its periods between start and end with at
+    least one completion}. Completions on days the habit was not due, or
+    before it started, satisfy nothing.
+    """
+    satisfied = {}
+    for habit_id, periods in expand_periods(habits, start, end).items():
+        bitmap = bitmaps.get(habit_id)
+        satisfied[habit_id] = sum(1 for first, last in periods if bitmap.count(first, last)) if bitmap is not None else 0
+    return satisfied
+
+
+def count_satisfied(habits, bitmaps, start, end):
+    """Number of the habits' periods between start and end with at least one completion."""
+    return sum(satisfied_periods(habits, bitmaps, start, end).values())
 
 
 def get_user_statistics(user):
     """
     Get comprehensive statistics for all user habits.
+    Rates count the schedule periods of the active habits that were
+    completed, against the periods they were due, over the last 7 days and
+    since each habit started.
     """
-    habits = Habit.objects.filter(user=user, status='active')
+    habits = list(Habit.objects.filter(user=user, status='active'))
     
     today = date.today()
-    week_ago = today - timedelta(days=7)
+    week_start = today - timedelta(days=6)
     
-    total_habits = habits.count()
+    total_habits = len(habits)
+    bitmaps = load_bitmaps([habit.id for habit in habits])
     
-    # Week statistics
-    total_responses_week = HabitResponse.objects.filter(
-        habit__user=user,
-        date__range=[week_ago, today]
-    ).count()
-    completed_responses_week = HabitResponse.objects.filter(
-        habit__user=user,
-        date__range=[week_ago, today],
-        completed=True
-    ).count()
-    
-    # All time statistics
-    total_responses_all = HabitResponse.objects.filter(habit__user=user).count()
-    completed_responses_all = HabitResponse.objects.filter(
-        habit__user=user,
-        completed=True
-    ).count()
-    
-    weekly_rate = (completed_responses_week / total_responses_week * 100) if total_responses_week > 0 else 0
-    overall_rate = (completed_responses_all / total_responses_all * 100) if total_responses_all > 0 else 0
+    start = min((get_start_date(habit) or today for habit in habits), default=today)
+    due_all = sum(count_due(habits, start, today).values())
+    due_week = sum(count_due(habits, week_start, today).values())
+    satisfied_all = count_satisfied(habits, bitmaps, start, today)
+    satisfied_week = count_satisfied(habits, bitmaps, week_start, today)
     
     return {
         'total_habits': total_habits,
-        'weekly_completion_rate': round(weekly_rate, 1),
-        'overall_completion_rate': round(overall_rate, 1),
-        'total_completions': completed_responses_all,
-        'total_responses': total_responses_all,
+        'weekly_completion_rate': completion_rate(satisfied_week, due_week),
+        'overall_completion_rate': completion_rate(satisfied_all, due_all),
+        'total_completions': sum(habit.completed_responses for habit in habits),
+        'total_responses': sum(habit.total_responses for habit in habits),
+    }
+
+
+HISTORY_COMPLETED = '2'
+HISTORY_MISSED = '1'
+HISTORY_NO_DATA = '0'
+
+
+def get_history_rows(habits, start_date, end_date):
+    """
+    Returns {habit_id: cells} where cells is a string with one character per
+    day from start_date to end_date: '2' completed, '1' missed, '0' no data.
+    Completions come from the habits' bitmaps; only the (rare) responses
+    marked as not completed are read from HabitResponse. Two queries total.
+    """
+    habit_ids = [habit.id for habit in habits]
+    if not habit_ids:
+        return {}
+
+    bitmaps = load_bitmaps(habit_ids)
+    rows = {
+        habit_id: bytearray(bitmap.to_string(start_date, end_date).replace('1', HISTORY_COMPLETED), 'ascii')
+        for habit_id, bitmap in bitmaps.items()
     }
+
+    missed = HabitResponse.objects.filter(
+        habit_id__in=habit_ids,
+        date__range=[start_date, end_date],
+        completed=False,
+    ).values_list('habit_id', 'date')
+    for habit_id, day in missed:
+        rows[habit_id][(day - start_date).days] = ord(HISTORY_MISSED)
+
+    return {habit_id: cells.decode('ascii') for habit_id, cells in rows.items()}
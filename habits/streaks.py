@@ -0,0 +1,113 @@
+"""
+Recurrence-aware streak engine.
+A streak is the number of consecutive schedule periods (see schedule.py)
+with at least one completion, so weekly and selected-day habits are not
+reset on days they are not due. Streaks are derived from the response
+history rather than incremented on check-in, so edits to old days are
+reflected too.
+"""
+from bisect import bisect_left
+from datetime import date
+from itertools import groupby
+from django.db import transaction
+from .api_cache import bump_after_commit
+from .models import Habit, HabitResponse, StreakData
+from .schedule import get_periods, get_start_date
+
+
+def compute_streaks(periods, completed_dates, today):
+    """
+    Run-length computation over a sorted list of completion dates.
+    Returns (current_streak, best_streak). An unsatisfied period that is
+    still open (ends today or later) does not break the current streak.
+    """
+    flags = []
+    for first, last in periods:
+        index = bisect_left(completed_dates, first)
+        flags.append(index < len(completed_dates) and completed_dates[index] <= last)
+
+    if flags and not flags[-1] and periods[-1][1] >= today:
+        flags.pop()
+
+    runs = [(done, len(list(group))) for done, group in groupby(flags)]
+    best = max((length for done, length in runs if done), default=0)
+    current = runs[-1][1] if runs and runs[-1][0] else 0
+    return current, best
+
+
+def compute_habit_streak(habit, completed_dates, today=None):
+    """Returns (current_streak, best_streak, last_completed) for sorted completion dates."""
+    if today is None:
+        today = date.today()
+    start = get_start_date(habit) or today
+    if completed_dates:
+        start = min(start, completed_dates[0])
+    current, best = compute_streaks(get_periods(habit, start, today), completed_dates, today)
+    last_completed = completed_dates[-1] if completed_dates else None
+    return current, best, last_completed
+
+
+def recompute_streak(habit, today=None, completed_dates=None):
+    """
+    Recompute and store the StreakData row for one habit from its history,
+    or from `completed_dates` (sorted) when the caller already has them.
+    """
+    if completed_dates is None:
+        completed_dates = list(
+            HabitResponse.objects.filter(habit=habit, completed=True).order_by('date').values_list('date', flat=True)
+        )
+    current, best, last_completed = compute_habit_streak(habit, completed_dates, today)
+    streak, _ = StreakData.objects.update_or_create(
+        habit=habit,
+        defaults={'current_streak': current, 'best_streak': best, 'last_completed': last_completed},
+    )
+    return streak
+
+
+def recompute_streaks(habit_ids=None, batch_size=500, today=None, progress=None):
+    """
+    Recompute StreakData for many habits, `batch_size` habits at a time,
+    streaming their completion dates in one query per batch. Returns the
+    number of habits processed.
+    """
+    if today is None:
+        today = date.today()
+    habits = Habit.objects.order_by('pk')
+    if habit_ids is not None:
+        habits = habits.filter(pk__in=habit_ids)
+    all_ids = list(habits.values_list('pk', flat=True))
+
+    processed = 0
+    for offset in range(0, len(all_ids), batch_size):
+        chunk = all_ids[offset:offset + batch_size]
+        batch = Habit.objects.filter(pk__in=chunk).only(
+            'user_id', 'recurrence', 'frequency', 'selected_days', 'created_at', 'target_date'
+        )
+
+        completed = {habit_id: [] for habit_id in chunk}
+        rows = HabitResponse.objects.filter(habit_id__in=chunk, completed=True).order_by('habit_id', 'date')
+        for habit_id, day in rows.values_list('habit_id', 'date').iterator(chunk_size=5000):
+            completed[habit_id].append(day)
+
+        results, owners = {}, set()
+        for habit in batch:
+            results[habit.pk] = compute_habit_streak(habit, completed[habit.pk], today)
+            owners.add(habit.user_id)
+
+        with transaction.atomic():
+            existing = {s.habit_id: s for s in StreakData.objects.filter(habit_id__in=chunk)}
+            to_update, to_create = [], []
+            for habit_id, (current, best, last_completed) in results.items():
+                streak = existing.get(habit_id) or StreakData(habit_id=habit_id)
+                streak.current_streak = current
+                streak.best_streak = best
+                streak.last_completed = last_completed
+                (to_update if streak.pk else to_create).append(streak)
+            StreakData.objects.bulk_update(to_update, ['current_streak', 'best_streak', 'last_completed'], batch_size=1000)
+            StreakData.objects.bulk_create(to_create, batch_size=1000)
+            bump_after_commit(owners)
+
+        processed += len(chunk)
+        if progress:
+            progress(processed, len(all_ids))
+    return processed
@@ -1,9 +1,78 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import requests
+import subprocess
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from unittest.mock import patch
-from habits.ai_utils import generate_notification_messages
+from habits.ai_utils import generate_notification_messages, generate_notification_messages_batch, get_habit_suggestions
+from habits.ai_cache import ai_cache_stats, normalize_prompt, reset_ai_cache_stats
+from habits.models import AIResponseCache
+from services.ai_recommendation import get_ai_tool_recommendations
+from habits.models import Habit, YesNoHabit, HabitResponse, StreakData, DailyRollup
+from services import ai_client
+from services.ai_client import AIUnavailable, deadline, post_json, reset_breakers
+from habits.bitmaps import CompletionBitmap, load_bitmap, rebuild_bitmaps
+from habits.api_cache import get_data_version
+from habits.rollups import apply_response_change, rebuild_rollups, reconcile_habit_counters, response_state
+from habits.models import CountdownWidget, NotificationDelivery, ReminderTrigger
+from habits.schedule import WEEKDAYS, count_due, expand_due_dates, get_next_occurrence
+from habits.widget_utils import roll_forward_countdowns
+from habits.events import broker, event_stream
+from habits import notification_service
+from habits.notification_service import CLAIM_TIMEOUT, check_habits, claim_deliveries, reset_acknowledgments
+from habits.triggers import rebuild_triggers, shard_triggers
+from habits.reminder_scheduler import ReminderScheduler
+from habits.leader import LeaderLease
+from habits.dispatcher import Dispatcher, InboxSink, LogFileSink, NotifySendSink, Sink, WebhookSink, confirm_deliveries, make_notification
+from habits.models import InboxNotification, NotificationMessageCache
+from habits.message_cache import evict, get_cached_messages, prewarm_messages
+from habits.reminder_utils import build_reminder_schedule, get_reminder_schedule, upcoming_reminders
+from habits.streaks import compute_habit_streak, recompute_streaks
+from habits.statistics import (
+    attach_period_counts, get_bulk_habit_statistics, get_habit_statistics, get_weekly_data, get_user_statistics, get_week_dates,
+)
+
+# The tests clear and fill the caches; keep them off the file caches running servers share
+local_caches = override_settings(CACHES={
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+    for alias in ('default', 'api')
+})
+
+
+def setUpModule():
+    local_caches.enable()
+
+
+def tearDownModule():
+    local_caches.disable()
+
+
+def backdate(habit, day):
+    """Move a habit's creation date to `day` so its schedule starts there."""
+    type(habit).objects.filter(pk=habit.pk).update(
+        created_at=timezone.make_aware(datetime.combine(day, time(9, 0)))
+    )
+    habit.refresh_from_db()
+    return habit
+
 
 class NotificationAITest(TestCase):
-    @patch('requests.post')
+    def setUp(self):
+        reset_breakers()
+
+    @patch('services.ai_client.session.post')
     def test_generate_notification_messages(self, mock_post):
         # Mocking the Gemini API response
         mock_response = mock_post.return_value
@@ -28,8 +97,1301 @@ class NotificationAITest(TestCase):
         self.assertEqual(messages['on_time'], "Time to Water Plants now.")
         self.assertEqual(messages['overdue'], "Don't forget to Water Plants.")
 
+    def test_batch_splits_failed_requests_and_falls_back_per_habit(self):
+        requested = []
+
+        class GeminiStub(BaseHTTPRequestHandler):
+            def do_POST(self):
+                prompt = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['contents'][0]['parts'][0]['text']
+                listed = prompt.partition('Habits:')[2].partition('Return ONLY')[0]
+                names = re.findall(r'^\s*\d+\. (.+)$', listed, re.MULTILINE)
+                if not names:
+                    # Single-habit prompt
+                    name = re.search(r'for the habit "(.+?)"', prompt).group(1)
+                    requested.append([name])
+                    text = f"PreReminder: Soon {name}\nOnTime: Now {name}\nOverdue: Still {name}"
+                elif len(names) > 2:
+                    requested.append(names)
+                    text = "Sorry, that is too many habits."
+                else:
+                    requested.append(names)
+                    text = json.dumps({
+                        str(number): {"PreReminder": f"Soon {name}", "OnTime": f"Now {name}", "Overdue": f"Still {name}"}
+                        for number, name in enumerate(names, start=1) if name != "Yoga"
+                    })
+                body = json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), GeminiStub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with patch('habits.ai_utils.GEMINI_API_BASE', f'http://127.0.0.1:{server.server_port}'), \
+                 patch('habits.ai_utils.GOOGLE_API_KEY', 'test-key'):
+                messages = generate_notification_messages_batch(["Walk", "Read", "Run", "Swim", "Yoga", "Walk"])
+        finally:
+            server.shutdown()
+
+        # The oversized batch is halved until the parts are answered
+        self.assertEqual(requested, [["Walk", "Read", "Run", "Swim", "Yoga"], ["Walk", "Read"], ["Run", "Swim", "Yoga"], ["Run"], ["Swim", "Yoga"]])
+        self.assertEqual(list(messages), ["Walk", "Read", "Run", "Swim", "Yoga"])
+        self.assertEqual(messages["Run"]["on_time"], "Now Run")
+        self.assertEqual(messages["Swim"], {"pre_reminder": "Soon Swim", "on_time": "Now Swim", "overdue": "Still Swim"})
+        # Missing from an otherwise valid reply
+        self.assertEqual(messages["Yoga"]["on_time"], "It is time for Yoga. Let us get started!")
+
+    @patch('habits.ai_utils.GOOGLE_API_KEY', 'test-key')
+    @patch('habits.ai_utils.generate_notification_messages')
+    @patch('habits.ai_utils._request_notification_batch', side_effect=AIUnavailable("gemini-batch circuit open"))
+    def test_batch_falls_back_at_once_while_unavailable(self, mock_request, mock_single):
+        messages = generate_notification_messages_batch(["Walk", "Read", "Run"])
+        # No halving and nothing sent to the interactive endpoint
+        self.assertEqual(mock_request.call_count, 1)
+        mock_single.assert_not_called()
+        self.assertEqual(messages["Run"]["on_time"], "It is time for Run. Let us get started!")
+
     def test_fallback_messages(self):
         # Test fallback with no API key or failed call
         with patch('habits.ai_utils.GOOGLE_API_KEY', None):
             messages = generate_notification_messages("Exercise")
             self.assertEqual(messages['pre_reminder'], "Ready for Exercise? It starts in five minutes.")
+
+
+class AIClientTest(TestCase):
+    def setUp(self):
+        reset_breakers()
+
+    @patch('services.ai_client.session.post', side_effect=requests.ConnectionError("down"))
+    def test_breaker_opens_then_lets_one_trial_through(self, mock_post):
+        with self.settings(AI_FAILURE_THRESHOLD=2, AI_RESET_TIMEOUT=30):
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    post_json('gemini', 'https://example.invalid', {})
+            # Open: fails fast without touching the network
+            with self.assertRaises(AIUnavailable):
+                post_json('gemini', 'https://example.invalid', {})
+            self.assertEqual(mock_post.call_count, 2)
+            # Other endpoints are unaffected
+            with self.assertRaises(requests.ConnectionError):
+                post_json('groq', 'https://example.invalid', {})
+
+            breaker = ai_client.get_breaker('gemini')
+            breaker.opened_at -= 30
+            mock_post.side_effect = None
+            mock_post.return_value.json.return_value = {'ok': True}
+            self.assertEqual(post_json('gemini', 'https://example.invalid', {}), {'ok': True})
+            self.assertEqual(breaker.state, 'closed')
+
+    @patch('services.ai_client.session.post')
+    def test_deadline_caps_timeouts_and_skips_spent_calls(self, mock_post):
+        mock_post.return_value.json.return_value = {}
+        with deadline(2):
+            post_json('gemini', 'https://example.invalid', {}, timeout=10)
+            self.assertLessEqual(mock_post.call_args.kwargs['timeout'], 2)
+            with deadline(0):
+                with self.assertRaises(AIUnavailable):
+                    post_json('gemini', 'https://example.invalid', {})
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIsNone(ai_client.remaining_budget())
+
+    @patch('services.ai_client.session.post')
+    def test_slow_calls_are_measured_against_their_timeout(self, mock_post):
+        clock = [0.0]
+
+        def five_seconds(*args, **kwargs):
+            clock[0] += 5
+            return mock_post.return_value
+
+        mock_post.side_effect = five_seconds
+        mock_post.return_value.json.return_value = {}
+        with self.settings(AI_FAILURE_THRESHOLD=1), patch('services.ai_client.time.monotonic', side_effect=lambda: clock[0]):
+            post_json('gemini-batch', 'https://example.invalid', {}, timeout=60)
+            self.assertEqual(ai_client.get_breaker('gemini-batch').state, 'closed')
+            post_json('gemini', 'https://example.invalid', {}, timeout=5)
+            self.assertEqual(ai_client.get_breaker('gemini').state, 'open')
+
+    def test_deadline_middleware_serves_sync_and_async_requests(self):
+        async def async_view(request):
+            return ai_client.remaining_budget()
+
+        with self.settings(AI_REQUEST_BUDGET=3):
+            middleware = ai_client.ai_deadline_middleware(async_view)
+            self.assertTrue(asyncio.iscoroutinefunction(middleware))
+            self.assertTrue(0 < asyncio.run(middleware(None)) <= 3)
+
+            middleware = ai_client.ai_deadline_middleware(lambda request: ai_client.remaining_budget())
+            self.assertFalse(asyncio.iscoroutinefunction(middleware))
+            self.assertTrue(0 < middleware(None) <= 3)
+        self.assertTrue(ai_client.ai_deadline_middleware.sync_capable and ai_client.ai_deadline_middleware.async_capable)
+
+
+@patch('habits.ai_utils.GOOGLE_API_KEY', 'test-key')
+@patch('services.ai_client.session.post')
+class AIResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_ai_cache_stats()
+        reset_breakers()
+
+    def reply(self, mock_post, text):
+        mock_post.return_value.json.return_value = {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+
+    def test_similar_habit_names_share_one_response(self, mock_post):
+        self.assertEqual(normalize_prompt("  Drinking Water! "), normalize_prompt("drink waters"))
+        self.reply(mock_post, '{"category": "Health", "suggested_tools": [], "estimated_time": "1 minute"}')
+
+        first = get_habit_suggestions("Drink water", "Did you drink 8 glasses?")
+        second = get_habit_suggestions("drinking  WATER", "")
+        self.assertEqual(first, second)
+        self.assertEqual(first['category'], "Health")
+        self.assertEqual(mock_post.call_count, 1)
+
+        stats = ai_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate'], stats['entries']), (1, 1, 0.5, 1))
+
+    def test_hits_are_written_with_the_throttled_touch(self, mock_post):
+        self.reply(mock_post, '{"category": "Health"}')
+        get_habit_suggestions("Drink water", habit_description="")
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(3):
+                self.assertEqual(get_habit_suggestions("Drink water", habit_description="")['category'], "Health")
+        self.assertFalse([query for query in ctx.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(AIResponseCache.objects.get().hits, 0)
+
+        AIResponseCache.objects.update(last_used=timezone.now() - timedelta(hours=1))
+        get_habit_suggestions("Drink water", "")
+        self.assertEqual(AIResponseCache.objects.get().hits, 4)
+        self.assertEqual(ai_cache_stats()['hits'], 4)
+
+    def test_fallbacks_are_not_cached(self, mock_post):
+        mock_post.side_effect = requests.ConnectionError("down")
+        self.assertEqual(get_habit_suggestions("Gym", "")['category'], "General")
+        with patch.dict(os.environ, {'GROQ_API_KEY': 'test-key'}):
+            self.assertEqual(get_ai_tool_recommendations("Gym")[0]['name'], "ChatGPT")
+        self.assertFalse(AIResponseCache.objects.exists())
+
+    def test_expired_and_least_recent_entries_are_dropped(self, mock_post):
+        self.reply(mock_post, '{"category": "Reading"}')
+        with self.settings(AI_CACHE_SIZE=2):
+            for name in ["Read", "Write", "Walk"]:
+                get_habit_suggestions(name, "")
+        self.assertEqual(set(AIResponseCache.objects.values_list('prompt', flat=True)), {"write", "walk"})
+
+        AIResponseCache.objects.update(expires_at=timezone.now())
+        get_habit_suggestions("Walk", "")
+        self.assertEqual(mock_post.call_count, 4)
+        self.assertEqual(list(AIResponseCache.objects.values_list('prompt', flat=True)), ["walk"])
+
+
+class DashboardQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dash', password='pw')
+        self.client.force_login(self.user)
+
+    def _create_habits(self, count):
+        for i in range(count):
+            habit = YesNoHabit.objects.create(user=self.user, name=f"Habit {i}", question="Done?")
+            if i % 2 == 0:
+                StreakData.objects.create(habit=habit, current_streak=i)
+                HabitResponse.objects.create(habit=habit, date=date.today(), completed=True)
+
+    def _count_dashboard_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self._create_habits(2)
+        small = self._count_dashboard_queries()
+        self._create_habits(30)
+        large = self._count_dashboard_queries()
+        self.assertEqual(small, large)
+
+    def test_dashboard_does_not_write_streak_rows(self):
+        self._create_habits(4)
+        before = StreakData.objects.count()
+        response = self.client.get('/dashboard/')
+        self.assertEqual(StreakData.objects.count(), before)
+        self.assertEqual(len(response.context['habits_data']), 4)
+        self.assertEqual(sum(item['completed_today'] for item in response.context['habits_data']), 2)
+
+
+class BulkHabitStatisticsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('stats', password='pw')
+        self.client.force_login(self.user)
+
+    def test_bulk_statistics_match_responses(self):
+        habit = YesNoHabit.objects.create(user=self.user, name="Read", question="Read?")
+        empty = YesNoHabit.objects.create(user=self.user, name="Run", question="Run?")
+        backdate(habit, date.today() - timedelta(days=3))
+        StreakData.objects.create(habit=habit, current_streak=2, best_streak=5)
+        for offset, completed in enumerate([True, True, False, True]):
+            HabitResponse.objects.create(habit=habit, date=date.today() - timedelta(days=offset), completed=completed)
+        reconcile_habit_counters()
+        rebuild_bitmaps()
+
+        with self.assertNumQueries(2):
+            stats = get_bulk_habit_statistics([habit, empty])
+
+        self.assertEqual(stats[habit.id]['total_completions'], 3)
+        self.assertEqual(stats[habit.id]['total_responses'], 4)
+        self.assertEqual(stats[habit.id]['completion_rate'], 75.0)
+        self.assertEqual(stats[habit.id]['best_streak'], 5)
+        self.assertEqual(stats[empty.id]['current_streak'], 0)
+        self.assertEqual(stats[empty.id]['completion_rate'], 0)
+
+    def test_habit_list_api_query_count_is_constant(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/habits/')
+            return len(ctx.captured_queries)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            YesNoHabit.objects.create(user=self.user, name="Habit 0", question="?")
+        small = count_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(1, 25):
+                YesNoHabit.objects.create(user=self.user, name=f"Habit {i}", question="?")
+        self.assertEqual(count_queries(), small)
+
+
+class UserStatisticsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('weekly', password='pw')
+        self.habit = YesNoHabit.objects.create(user=self.user, name="Walk", question="Walk?")
+        self.other = YesNoHabit.objects.create(user=self.user, name="Stretch", question="Stretch?")
+        self.weekly = YesNoHabit.objects.create(user=self.user, name="Hike", question="Hike?", recurrence='weekly')
+        self.paused = YesNoHabit.objects.create(user=self.user, name="Swim", question="Swim?", status='paused')
+        today = date.today()
+        for habit in (self.habit, self.other, self.weekly, self.paused):
+            backdate(habit, today - timedelta(days=6))
+        week = get_week_dates()
+        HabitResponse.objects.create(habit=self.habit, date=week[0], completed=True)
+        HabitResponse.objects.create(habit=self.other, date=week[0], completed=False)
+        HabitResponse.objects.create(habit=self.habit, date=week[0] - timedelta(days=30), completed=True)
+        for offset in range(7):
+            # Completed daily although due once a week; paused habits do not count at all
+            HabitResponse.objects.create(habit=self.weekly, date=today - timedelta(days=offset), completed=True)
+            HabitResponse.objects.create(habit=self.paused, date=today - timedelta(days=offset), completed=True)
+        rebuild_rollups()
+        rebuild_bitmaps()
+        reconcile_habit_counters()
+
+    def test_weekly_data_single_query(self):
+        with self.assertNumQueries(1):
+            weekly = get_weekly_data(self.user)
+        self.assertEqual(weekly['labels'][0], 'Mon')
+        # Rollups count every response on Monday, including the paused habit's
+        self.assertEqual((weekly['total'][0], weekly['completed'][0]), (4, 3))
+        self.assertEqual(len(weekly['dates']), 7)
+
+    def test_user_statistics(self):
+        with self.assertNumQueries(2):
+            stats = get_user_statistics(self.user)
+        self.assertEqual(stats['total_habits'], 3)
+        self.assertEqual(stats['total_responses'], 10)
+        self.assertEqual(stats['total_completions'], 9)
+
+        # 7 days for each daily habit plus the weeks touched by the window for
+        # the weekly one, all of which it completed
+        today = date.today()
+        weeks = len({day - timedelta(days=day.weekday()) for day in (today - timedelta(days=n) for n in range(7))})
+        expected = round((1 + weeks) / (14 + weeks) * 100, 1)
+        self.assertEqual(stats['weekly_completion_rate'], expected)
+        self.assertEqual(stats['overall_completion_rate'], expected)
+
+    def test_habit_list_rates_count_satisfied_periods(self):
+        # Completed only on the days it is not due
+        alternate = YesNoHabit.objects.create(user=self.user, name="Lift", question="Lift?", selected_days=["Mon", "Wed", "Fri"])
+        today = date.today()
+        backdate(alternate, today - timedelta(days=13))
+        for offset in range(14):
+            day = today - timedelta(days=offset)
+            if day.weekday() not in (0, 2, 4):
+                HabitResponse.objects.create(habit=alternate, date=day, completed=True)
+        rebuild_bitmaps()
+
+        with self.assertNumQueries(2):
+            habits = attach_period_counts(Habit.objects.filter(user=self.user).order_by('name'))
+        rates = {habit.name: habit.completion_rate for habit in habits}
+        # One of the 7 days it has been due; the completion from before it existed does not count
+        self.assertEqual(rates["Walk"], round(1 / 7 * 100, 1))
+        self.assertEqual(rates["Hike"], 100.0)
+        self.assertEqual(rates["Stretch"], 0)
+        self.assertEqual(rates["Lift"], 0)
+        self.assertEqual(get_bulk_habit_statistics(habits)[alternate.id]['completion_rate'], 0)
+        self.assertEqual(get_habit_statistics(self.habit)['completion_rate'], rates["Walk"])
+
+
+@patch('habits.views.send_notification')
+@patch('habits.views.get_emotional_feedback', return_value="Nice!")
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollup', password='pw')
+        self.client.force_login(self.user)
+        self.habit = YesNoHabit.objects.create(user=self.user, name="Journal", question="Journal?")
+
+    def _respond(self, completed):
+        return self.client.post(f'/habits/{self.habit.id}/respond/', {'completed': completed})
+
+    def _rollup(self):
+        return DailyRollup.objects.get(user=self.user, date=date.today())
+
+    def _counters(self):
+        self.habit.refresh_from_db()
+        return (self.habit.total_responses, self.habit.completed_responses)
+
+    def test_check_in_updates_rollup(self, *mocks):
+        self._respond('yes')
+        self.assertEqual((self._rollup().total, self._rollup().completed), (1, 1))
+        self.assertEqual(self._counters(), (1, 1))
+
+        self._respond('no')
+        self.assertEqual((self._rollup().total, self._rollup().completed), (1, 0))
+        self.assertEqual(self._counters(), (1, 0))
+
+        self._respond('yes')
+        self.assertEqual((self._rollup().total, self._rollup().completed), (1, 1))
+        self.assertEqual(self._counters(), (1, 1))
+        self.assertEqual(get_habit_statistics(self.habit)['completion_rate'], 100.0)
+        self.assertTrue(load_bitmap(self.habit).is_completed(date.today()))
+
+    def test_delete_and_rebuild(self, *mocks):
+        self._respond('yes')
+        HabitResponse.objects.create(habit=self.habit, date=date.today() - timedelta(days=1), completed=False)
+        rebuild_rollups([self.user.id])
+        self.assertEqual(DailyRollup.objects.filter(user=self.user).count(), 2)
+        self.assertEqual((self._rollup().total, self._rollup().completed), (1, 1))
+
+        HabitResponse.objects.filter(habit=self.habit, date=date.today()).delete()
+        self.assertEqual((self._rollup().total, self._rollup().completed), (0, 0))
+        self.assertEqual(self._counters(), (0, 0))
+
+        self.user.delete()
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_habit_delete_updates_rollups_in_bulk(self, *mocks):
+        other = YesNoHabit.objects.create(user=self.user, name="Walk", question="Walk?")
+        today = date.today()
+        for habit, days in ((self.habit, 40), (other, 2)):
+            for offset in range(days):
+                HabitResponse.objects.create(habit=habit, date=today - timedelta(days=offset), completed=True)
+        rebuild_rollups([self.user.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.habit.delete()
+        # Independent of the 40 responses being cascaded
+        self.assertLess(len(queries), 25)
+        rollups = dict(DailyRollup.objects.filter(user=self.user).values_list('date', 'total'))
+        self.assertEqual(rollups[today], 1)
+        self.assertEqual(rollups[today - timedelta(days=1)], 1)
+        self.assertEqual(rollups[today - timedelta(days=5)], 0)
+
+    def test_check_in_saves_response_once(self, *mocks):
+        with CaptureQueriesContext(connection) as queries:
+            self._respond('yes')
+        writes = [q['sql'] for q in queries.captured_queries if 'habits_habitresponse' in q['sql'].split(' WHERE')[0]
+                  and q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+        response = HabitResponse.objects.get(habit=self.habit)
+        self.assertTrue(response.feedback_text)
+
+    def test_concurrent_first_check_in_updates_the_other_row(self, *mocks):
+        def other_request(*args):
+            # The other request inserts today's row while this one is still building its own
+            row = HabitResponse.objects.create(habit=self.habit, date=date.today(), completed=False)
+            apply_response_change(self.habit.id, self.user.id, date.today(), None, response_state(row))
+            return "Nice!"
+
+        with patch('habits.views.get_emotional_feedback', side_effect=other_request):
+            response = self._respond('yes')
+        self.assertTrue(response.json()['success'])
+        self.assertTrue(HabitResponse.objects.get(habit=self.habit).completed)
+        self.assertEqual((self._rollup().total, self._rollup().completed), (1, 1))
+        self.assertEqual(self._counters(), (1, 1))
+
+    def test_reconcile_repairs_drift(self, *mocks):
+        HabitResponse.objects.create(habit=self.habit, date=date.today(), completed=True)
+        self.assertEqual(self._counters(), (0, 0))
+
+        drifted = reconcile_habit_counters(fix=False)
+        self.assertEqual(drifted, [(self.habit.id, (0, 0), (1, 1))])
+        self.assertEqual(self._counters(), (0, 0))
+
+        reconcile_habit_counters()
+        self.assertEqual(self._counters(), (1, 1))
+        self.assertEqual(reconcile_habit_counters(fix=False), [])
+
+
+class CompletionBitmapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bitmap', password='pw')
+        self.habit = YesNoHabit.objects.create(user=self.user, name="Code", question="Code?")
+
+    def test_streaks_rates_and_heatmap_across_years(self):
+        completed_days = [date(2024, 12, 28), date(2024, 12, 30), date(2024, 12, 31),
+                          date(2025, 1, 1), date(2025, 1, 2)]
+        for day in completed_days:
+            HabitResponse.objects.create(habit=self.habit, date=day, completed=True)
+        HabitResponse.objects.create(habit=self.habit, date=date(2024, 12, 29), completed=False)
+        self.assertEqual(rebuild_bitmaps([self.habit.id]), 2)
+
+        with self.assertNumQueries(1):
+            bitmap = load_bitmap(self.habit)
+        self.assertEqual(bitmap.best_streak(), 4)
+        self.assertEqual(bitmap.current_streak(today=date(2025, 1, 2)), 4)
+        self.assertEqual(bitmap.current_streak(today=date(2025, 1, 3)), 4)
+        self.assertEqual(bitmap.current_streak(today=date(2025, 1, 4)), 0)
+        self.assertEqual(bitmap.count(date(2024, 12, 28), date(2025, 1, 3)), 5)
+        self.assertEqual(bitmap.completion_rate(date(2024, 12, 30), date(2025, 1, 2)), 100.0)
+        self.assertEqual(bitmap.heatmap(date(2024, 12, 27), date(2024, 12, 31)), [0, 1, 0, 1, 1])
+
+    def test_empty_bitmap(self):
+        bitmap = CompletionBitmap(date(2025, 1, 1))
+        self.assertEqual(bitmap.best_streak(), 0)
+        self.assertEqual(bitmap.current_streak(today=date(2025, 3, 1)), 0)
+        self.assertEqual(bitmap.heatmap(date(2024, 12, 31), date(2025, 1, 1)), [0, 0])
+
+
+class StreakEngineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('streaks', password='pw')
+        # 2025-03-03 is a Monday
+        self.monday = date(2025, 3, 3)
+
+    def _habit(self, **fields):
+        habit = YesNoHabit.objects.create(user=self.user, name="Habit", question="?", **fields)
+        return backdate(habit, self.monday - timedelta(days=28))
+
+    def _days(self, *offsets):
+        return sorted(self.monday + timedelta(days=offset) for offset in offsets)
+
+    def test_daily_streak_and_open_today(self):
+        habit = self._habit()
+        completed = self._days(-4, -3, -2, -1, -10, -11, -12, -13, -14, -15)
+        self.assertEqual(compute_habit_streak(habit, completed, today=self.monday)[:2], (4, 6))
+        self.assertEqual(compute_habit_streak(habit, completed, today=self.monday + timedelta(days=1))[:2], (0, 6))
+
+    def test_selected_days_skip_off_days(self):
+        habit = self._habit(selected_days=['Mon', 'Wed', 'Fri'])
+        # Previous Mon, Wed, Fri and this Monday; nothing on the days in between.
+        completed = self._days(-7, -5, -3, 0)
+        self.assertEqual(compute_habit_streak(habit, completed, today=self.monday + timedelta(days=1))[:2], (4, 4))
+
+    def test_weekly_counts_any_day_in_week(self):
+        habit = self._habit(recurrence='weekly')
+        completed = self._days(-20, -12, -2)
+        # This week is still open, so the three previous weeks stay in the streak.
+        self.assertEqual(compute_habit_streak(habit, completed, today=self.monday + timedelta(days=3))[:2], (3, 3))
+
+    def test_recompute_fixes_edited_history(self):
+        habit = self._habit()
+        today = date.today()
+        for offset in range(3):
+            HabitResponse.objects.create(habit=habit, date=today - timedelta(days=offset), completed=True)
+        StreakData.objects.create(habit=habit, current_streak=1, best_streak=1)
+
+        self.assertEqual(recompute_streaks(batch_size=1, today=today), 1)
+        streak = StreakData.objects.get(habit=habit)
+        self.assertEqual((streak.current_streak, streak.best_streak, streak.last_completed), (3, 3, today))
+
+
+class DueScheduleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('schedule', password='pw')
+        self.client.force_login(self.user)
+        self.today = date.today()
+
+    def _habit(self, name, **fields):
+        habit = YesNoHabit.objects.create(user=self.user, name=name, question="?", **fields)
+        return backdate(habit, self.today - timedelta(days=13))
+
+    def test_expand_many_habits(self):
+        daily = self._habit("Daily")
+        weekdays = self._habit("Weekdays", selected_days=['Mon', 'Tue', 'Wed', 'Thu', 'Fri'])
+        weekly = self._habit("Weekly", recurrence='weekly')
+        once = self._habit("Once", recurrence='none', target_date=self.today + timedelta(days=2))
+        start, end = self.today - timedelta(days=13), self.today
+
+        due = expand_due_dates([daily, weekdays, weekly, once], start, end)
+        self.assertEqual(len(due[daily.id]), 14)
+        self.assertEqual(len(due[weekdays.id]), 10)
+        self.assertTrue(all(day.weekday() < 5 for day in due[weekdays.id]))
+        self.assertEqual(len(due[weekly.id]), 14)
+        self.assertEqual(due[once.id], [])
+
+        counts = count_due([daily, weekdays, weekly], start, end)
+        self.assertEqual(counts[daily.id], 14)
+        self.assertEqual(counts[weekdays.id], 10)
+        self.assertIn(counts[weekly.id], (2, 3))
+
+    def test_dashboard_shows_only_habits_due_today(self):
+        today_name = WEEKDAYS[self.today.weekday()]
+        other_day = WEEKDAYS[(self.today.weekday() + 1) % 7]
+        self._habit("Due", selected_days=[today_name])
+        self._habit("Not due", selected_days=[other_day])
+        response = self.client.get('/dashboard/')
+        self.assertEqual([item['habit'].name for item in response.context['habits_data']], ["Due"])
+
+
+class CountdownOccurrenceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('countdown', password='pw')
+        self.client.force_login(self.user)
+        # 2025-03-05 10:00 is a Wednesday
+        self.now = timezone.make_aware(datetime(2025, 3, 5, 10, 0))
+
+    def test_next_occurrence(self):
+        start, at = date(2025, 3, 1), time(9, 30)
+        self.assertEqual(get_next_occurrence(start, at, 'none', [], self.now).date(), date(2025, 3, 1))
+        self.assertEqual(get_next_occurrence(start, at, 'daily', [], self.now).date(), date(2025, 3, 6))
+        self.assertEqual(get_next_occurrence(start, time(11, 0), 'daily', [], self.now).date(), date(2025, 3, 5))
+        self.assertEqual(get_next_occurrence(start, at, 'weekly', [], self.now).date(), date(2025, 3, 8))
+        self.assertEqual(get_next_occurrence(start, at, 'weekly', ['Mon'], self.now).date(), date(2025, 3, 10))
+
+    def test_roll_forward_in_bulk(self):
+        passed = timezone.make_aware(datetime(2025, 3, 4, 9, 30))
+        for i in range(3):
+            CountdownWidget.objects.create(
+                user=self.user, title=f"Standup {i}", target_date=date(2025, 3, 1),
+                target_time=time(9, 30), recurrence='daily', next_occurrence=passed,
+            )
+        one_off = CountdownWidget.objects.create(
+            user=self.user, title="Exam", target_date=date(2025, 3, 1),
+            target_time=time(9, 30), recurrence='none', next_occurrence=passed,
+        )
+
+        with self.assertNumQueries(2):
+            self.assertEqual(roll_forward_countdowns(now=self.now), 3)
+        upcoming = CountdownWidget.objects.filter(next_occurrence__gte=self.now)
+        self.assertEqual(upcoming.count(), 3)
+        self.assertNotIn(one_off, upcoming)
+        self.assertEqual(roll_forward_countdowns(now=self.now), 0)
+
+    def test_create_sets_next_occurrence(self):
+        self.client.post('/widgets/create/countdown/', {
+            'title': "Gym", 'target_date': '2025-01-01', 'target_time': '07:00', 'recurrence': 'daily',
+        })
+        widget = CountdownWidget.objects.get(title="Gym")
+        self.assertGreaterEqual(widget.next_occurrence, timezone.now())
+
+
+class HistoryApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('history', password='pw')
+        self.client.force_login(self.user)
+
+    def _get(self, **params):
+        response = self.client.get('/api/history/', params)
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_grid_cells_and_paging(self):
+        today = date.today()
+        habits = [YesNoHabit.objects.create(user=self.user, name=f"Habit {i}", question="?") for i in range(3)]
+        HabitResponse.objects.create(habit=habits[0], date=today, completed=True)
+        HabitResponse.objects.create(habit=habits[0], date=today - timedelta(days=2), completed=False)
+        HabitResponse.objects.create(habit=habits[0], date=today - timedelta(days=400), completed=True)
+        rebuild_bitmaps()
+
+        _, data = self._get(days=3, page_size=2)
+        self.assertEqual(data['days'], 3)
+        self.assertTrue(data['has_next'])
+        self.assertEqual([row['name'] for row in data['habits']], ["Habit 0", "Habit 1"])
+        self.assertEqual(data['habits'][0]['cells'], '102')
+        self.assertEqual(data['habits'][1]['cells'], '000')
+
+        _, data = self._get(days=3, page_size=2, page=2)
+        self.assertFalse(data['has_next'])
+        self.assertEqual(len(data['habits']), 1)
+
+        _, data = self._get(days=730)
+        self.assertEqual(len(data['habits'][0]['cells']), 730)
+        self.assertEqual(data['habits'][0]['cells'].count('2'), 2)
+
+    def test_rejects_bad_ranges(self):
+        self.assertEqual(self.client.get('/api/history/', {'days': 5000}).status_code, 400)
+        self.assertEqual(self.client.get('/api/history/', {'days': 'abc'}).status_code, 400)
+
+    def test_query_count_is_constant(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response, _ = self._get(days=365)
+            return len(ctx.captured_queries)
+
+        YesNoHabit.objects.create(user=self.user, name="First", question="?")
+        small = count_queries()
+        for i in range(20):
+            YesNoHabit.objects.create(user=self.user, name=f"Habit {i}", question="?")
+        self.assertEqual(count_queries(), small)
+
+
+@patch('habits.views.send_notification')
+@patch('habits.views.get_emotional_feedback', return_value="Nice!")
+class ApiCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cache', password='pw')
+        self.client.force_login(self.user)
+        self.habit = YesNoHabit.objects.create(user=self.user, name="Floss", question="Floss?")
+        # Warm the session so only the authenticated user lookup remains
+        self.client.get('/api/stats/')
+
+    def _app_queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        queries = [q['sql'] for q in ctx.captured_queries if 'auth_user' not in q['sql']]
+        return response, queries
+
+    def test_repeated_loads_are_served_without_sql(self, *mocks):
+        for path in ('/api/stats/', '/api/habits/', f'/api/habits/{self.habit.id}/'):
+            first, _ = self._app_queries(path)
+            second, queries = self._app_queries(path)
+            self.assertEqual(queries, [])
+            self.assertEqual(first.content, second.content)
+
+    def test_check_in_invalidates(self, *mocks):
+        before, _ = self._app_queries(f'/api/habits/{self.habit.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/habits/{self.habit.id}/respond/', {'completed': 'yes'})
+        after, queries = self._app_queries(f'/api/habits/{self.habit.id}/')
+        self.assertNotEqual(queries, [])
+        self.assertEqual(json.loads(before.content)['total_completions'], 0)
+        self.assertEqual(json.loads(after.content)['total_completions'], 1)
+
+    def test_acknowledge_and_create_invalidate(self, *mocks):
+        self._app_queries('/api/habits/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/habits/{self.habit.id}/acknowledge/')
+        _, queries = self._app_queries('/api/habits/')
+        self.assertNotEqual(queries, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            YesNoHabit.objects.create(user=self.user, name="Nap", question="Nap?")
+        response, _ = self._app_queries('/api/habits/')
+        self.assertEqual(len(json.loads(response.content)['habits']), 2)
+
+    def test_bulk_writes_invalidate_after_commit(self, *mocks):
+        # Leave something for each bulk write to change
+        HabitResponse.objects.create(habit=self.habit, date=date.today(), completed=True)
+        Habit.objects.filter(pk=self.habit.pk).update(acknowledged=True)
+        for write in (lambda: recompute_streaks([self.habit.id]), reset_acknowledgments, reconcile_habit_counters):
+            version = get_data_version(self.user.id)
+            with self.captureOnCommitCallbacks() as callbacks:
+                write()
+            # Cached responses stay valid until the writes are committed
+            self.assertEqual(get_data_version(self.user.id), version)
+            for callback in callbacks:
+                callback()
+            self.assertNotEqual(get_data_version(self.user.id), version)
+
+
+@patch('habits.views.send_notification')
+@patch('habits.views.get_emotional_feedback', return_value="Nice!")
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('etag', password='pw')
+        self.client.force_login(self.user)
+        self.habit = YesNoHabit.objects.create(
+            user=self.user, name="Read", question="Read?", reminder_enabled=True, reminder_time=time(23, 59)
+        )
+
+    def test_unchanged_poll_returns_304_without_queries(self, *mocks):
+        for path in ('/api/stats/', '/api/reminders/', '/widget/'):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(first.has_header('ETag'))
+            with CaptureQueriesContext(connection) as ctx:
+                second = self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second.content, b'')
+            self.assertEqual([q for q in ctx.captured_queries if 'auth_user' not in q['sql'] and 'session' not in q['sql']], [])
+
+    def test_last_modified(self, *mocks):
+        first = self.client.get('/api/stats/')
+        response = self.client.get('/api/stats/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # Time-bucketed endpoints cannot be validated by date alone
+        self.assertFalse(self.client.get('/api/reminders/').has_header('Last-Modified'))
+
+    def test_check_in_changes_etag(self, *mocks):
+        first = self.client.get('/api/stats/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/habits/{self.habit.id}/respond/', {'completed': 'yes'})
+        response = self.client.get('/api/stats/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_pending_messages_skip_page_etag(self, *mocks):
+        first = self.client.get('/widget/')
+        self.client.post(f'/habits/{self.habit.id}/snooze/')
+        response = self.client.get('/widget/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'snoozed')
+
+    def test_countdown_widget_etag(self, *mocks):
+        widget = CountdownWidget.objects.create(
+            user=self.user, title="Trip", target_date=date.today() + timedelta(days=3), target_time=time(9, 0),
+            next_occurrence=timezone.now() + timedelta(days=3),
+        )
+        path = f'/widgets/view/{widget.id}/'
+        first = self.client.get(path)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        CountdownWidget.objects.filter(pk=widget.pk).update(next_occurrence=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_passed_one_off_countdown_is_not_rewritten(self, *mocks):
+        target = timezone.localtime() - timedelta(days=1)
+        widget = CountdownWidget.objects.create(
+            user=self.user, title="Exam", target_date=target.date(), target_time=time(9, 0), recurrence='none',
+        )
+        path = f'/widgets/view/{widget.id}/'
+        # The first view stores the (already passed) occurrence
+        self.client.get(path)
+        widget.refresh_from_db()
+        stored = widget.updated_at
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(path)
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "habits_countdownwidget"')])
+        widget.refresh_from_db()
+        self.assertEqual(widget.updated_at, stored)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=second['ETag']).status_code, 304)
+
+
+class ReminderScheduleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('remind', password='pw')
+        self.today = timezone.localdate()
+        self.walk = backdate(YesNoHabit.objects.create(
+            user=self.user, name="Walk", question="Walk?", reminder_enabled=True, reminder_time=time(7, 0)
+        ), self.today - timedelta(days=7))
+        self.stretch = backdate(YesNoHabit.objects.create(
+            user=self.user, name="Stretch", question="Stretch?", reminder_enabled=True, reminder_time=time(21, 0)
+        ), self.today - timedelta(days=7))
+
+    def test_build_joins_completions_in_one_query(self):
+        HabitResponse.objects.create(habit=self.walk, date=self.today, completed=True)
+        with self.assertNumQueries(1):
+            schedule = build_reminder_schedule(self.user.pk, self.today)
+        days = [(entry['name'], entry['fire_at'].date()) for entry in schedule['entries']]
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(days, [("Stretch", self.today), ("Walk", tomorrow), ("Stretch", tomorrow)])
+
+    def test_lookahead_window(self):
+        schedule = build_reminder_schedule(self.user.pk, self.today)
+        now = timezone.make_aware(datetime.combine(self.today, time(7, 30)))
+        names = [entry['name'] for entry in upcoming_reminders(schedule, now)]
+        # The missed 07:00 reminder, tonight's stretch and tomorrow's 07:00 walk
+        self.assertEqual(names, ["Walk", "Stretch", "Walk"])
+
+    def test_invalidated_by_completion_and_settings_only(self):
+        built = get_reminder_schedule(self.user.pk)['built']
+        with self.assertNumQueries(0):
+            self.assertEqual(get_reminder_schedule(self.user.pk)['built'], built)
+
+        self.walk.acknowledged = True
+        self.walk.save(update_fields=['acknowledged', 'updated_at'])
+        self.assertEqual(get_reminder_schedule(self.user.pk)['built'], built)
+
+        self.walk.reminder_time = time(8, 0)
+        self.walk.save(update_fields=['reminder_time'])
+        built_after_edit = get_reminder_schedule(self.user.pk)['built']
+        self.assertNotEqual(built_after_edit, built)
+
+        HabitResponse.objects.create(habit=self.walk, date=self.today, completed=True)
+        self.assertNotEqual(get_reminder_schedule(self.user.pk)['built'], built_after_edit)
+
+
+class EventStreamTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('events', password='pw')
+        self.habit = YesNoHabit.objects.create(user=self.user, name="Run", question="Run?")
+
+    def test_wsgi_request_is_declined(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/events/').status_code, 204)
+
+    async def test_asgi_request_streams(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertTrue((await asyncio.wait_for(anext(chunks), 1)).startswith(b'retry:'))
+        await chunks.aclose()
+
+    async def test_stream_delivers_events_published_from_other_threads(self):
+        stream = event_stream(self.user.pk, lifetime=5)
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+        self.assertIn('event: ready', await anext(stream))
+
+        await asyncio.to_thread(broker.publish, self.user.pk, 'reminders', {})
+        self.assertEqual(await asyncio.wait_for(anext(stream), 1), 'event: reminders\ndata: {}\n\n')
+
+        await stream.aclose()
+        self.assertEqual(broker.connection_count(), 0)
+
+    async def test_check_in_pushes_completion_and_streak(self):
+        queue = broker.subscribe(self.user.pk)
+        try:
+            await sync_to_async(HabitResponse.objects.create)(habit=self.habit, date=date.today(), completed=True)
+            await sync_to_async(StreakData.objects.update_or_create)(habit=self.habit, defaults={'current_streak': 1})
+            events = []
+            while not queue.empty() or len(events) < 3:
+                events.append((await asyncio.wait_for(queue.get(), 1)).split('\n')[0])
+        finally:
+            broker.unsubscribe(self.user.pk, queue)
+        self.assertIn('event: completion', events)
+        self.assertIn('event: streak', events)
+        self.assertIn('event: reminders', events)
+
+
+@patch('habits.notification_service.get_cached_messages', return_value={})
+@patch('habits.notification_service.send_notification')
+class ReminderTriggerTest(TestCase):
+    def setUp(self):
+        notification_service._last_ticks.clear()
+        self.user = User.objects.create_user('trigger', password='pw')
+        self.habit = YesNoHabit.objects.create(
+            user=self.user, name="Meditate", question="Meditate?",
+            reminder_enabled=True, reminder_time=time(23, 58), minutes_before=5, minutes_after=5,
+        )
+
+    def _triggers(self):
+        return dict(ReminderTrigger.objects.filter(habit=self.habit).values_list('kind', 'minute'))
+
+    def test_triggers_follow_reminder_settings(self, *mocks):
+        # The post-reminder wraps past midnight
+        self.assertEqual(self._triggers(), {'pre': 23 * 60 + 53, 'main': 23 * 60 + 58, 'post': 3})
+
+        self.habit.minutes_before = 0
+        self.habit.save(update_fields=['minutes_before'])
+        self.assertEqual(self._triggers(), {'pre': 23 * 60 + 58, 'post': 3})
+
+        self.habit.status = 'paused'
+        self.habit.save()
+        self.assertEqual(self._triggers(), {})
+
+        self.habit.status = 'active'
+        self.habit.save()
+        ReminderTrigger.objects.all().delete()
+        self.assertEqual(rebuild_triggers(), 2)
+
+    def test_tick_reads_only_the_due_minutes(self, send, messages):
+        now = timezone.localtime().replace(hour=23, minute=58)
+        with patch('habits.notification_service.timezone.localtime', return_value=now):
+            with CaptureQueriesContext(connection) as first:
+                self.assertEqual(check_habits(), 1)
+            self.assertEqual(send.call_args[0][0], "FlowMotion: Start Now")
+
+            for i in range(20):
+                YesNoHabit.objects.create(user=self.user, name=f"Quiet {i}", question="?", reminder_enabled=True, reminder_time=time(9, 0))
+            NotificationDelivery.objects.all().delete()
+            notification_service._last_ticks.clear()
+            with self.assertNumQueries(len(first.captured_queries)):
+                check_habits()
+
+    def test_missed_ticks_are_caught_up_once(self, send, messages):
+        start = timezone.localtime().replace(hour=23, minute=50)
+        with patch('habits.notification_service.timezone.localtime', return_value=start):
+            check_habits()
+        send.assert_not_called()
+
+        # The next tick comes 10 minutes late: the 23:53 pre-reminder was
+        # missed and the 23:58 reminder supersedes it
+        with patch('habits.notification_service.timezone.localtime', return_value=start + timedelta(minutes=10)):
+            self.assertEqual(check_habits(), 1)
+            notification_service._last_ticks.clear()
+            self.assertEqual(check_habits(), 0)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Start Now")
+        self.assertEqual(list(NotificationDelivery.objects.values_list('kind', flat=True)), ['main'])
+
+    def test_peak_minute_is_coalesced_per_user(self, send, messages):
+        other = User.objects.create_user('other', password='pw')
+        for i in range(9):
+            YesNoHabit.objects.create(user=self.user, name=f"Morning {i}", question="?", reminder_enabled=True, reminder_time=time(7, 0))
+        for i in range(2):
+            YesNoHabit.objects.create(user=other, name=f"Other {i}", question="?", reminder_enabled=True, reminder_time=time(7, 0))
+
+        now = timezone.localtime().replace(hour=7, minute=0)
+        with patch('habits.notification_service.timezone.localtime', return_value=now):
+            self.assertEqual(check_habits(), 11)
+        # One digest for the first user, two single reminders below the threshold for the other
+        self.assertEqual(send.call_count, 3)
+        digest = [call for call in send.call_args_list if call[0][0] == "FlowMotion: 9 habits"]
+        self.assertEqual(len(digest), 1)
+        self.assertTrue(digest[0][0][1].startswith("Start now: Morning 0, "))
+        self.assertEqual(messages.call_count, 2)
+
+        with self.settings(NOTIFICATION_DIGEST_THRESHOLD=0):
+            NotificationDelivery.objects.all().delete()
+            notification_service._last_ticks.clear()
+            send.reset_mock()
+            with patch('habits.notification_service.timezone.localtime', return_value=now):
+                check_habits()
+            self.assertEqual(send.call_count, 11)
+
+    def test_ledger_claims_each_delivery_once(self, *mocks):
+        trigger = ReminderTrigger.objects.get(habit=self.habit, kind='main')
+        day = timezone.localdate()
+        now = timezone.now()
+        claimed = claim_deliveries([trigger], day, now)
+        self.assertEqual(set(claimed), {(self.habit.id, 'main')})
+        self.assertEqual(claim_deliveries([trigger], day, now), {})
+
+        # An unconfirmed claim is taken over once it expires, a confirmed one never
+        later = now + CLAIM_TIMEOUT + timedelta(seconds=1)
+        self.assertEqual(claim_deliveries([trigger], day, later), claimed)
+        self.assertEqual(confirm_deliveries([make_notification("t", "", deliveries=claimed.values())]), 1)
+        self.assertEqual(claim_deliveries([trigger], day, later + 2 * CLAIM_TIMEOUT), {})
+
+    def test_unconfirmed_reminders_are_retried(self, send, messages):
+        start = timezone.localtime().replace(hour=23, minute=53)
+        with patch('habits.notification_service.timezone.localtime', return_value=start):
+            self.assertEqual(check_habits(), 1)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Prep Time")
+
+        # No sink confirmed it, so it goes out again once the claim expires
+        with patch('habits.notification_service.timezone.localtime', return_value=start + timedelta(minutes=1)):
+            self.assertEqual(check_habits(), 0)
+        with patch('habits.notification_service.timezone.localtime', return_value=start + timedelta(minutes=3)):
+            self.assertEqual(check_habits(), 1)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Prep Time")
+
+        # The on-time reminder supersedes the unconfirmed pre-reminder
+        with patch('habits.notification_service.timezone.localtime', return_value=start + timedelta(minutes=5)):
+            self.assertEqual(check_habits(), 1)
+        with patch('habits.notification_service.timezone.localtime', return_value=start + timedelta(minutes=6)):
+            self.assertEqual(check_habits(), 0)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Start Now")
+
+    def test_moved_reminder_is_sent_again(self, send, messages):
+        now = timezone.localtime().replace(hour=23, minute=58)
+        with patch('habits.notification_service.timezone.localtime', return_value=now):
+            self.assertEqual(check_habits(), 1)
+        self.habit.reminder_time = time(23, 59)
+        self.habit.save()
+        with patch('habits.notification_service.timezone.localtime', return_value=now + timedelta(minutes=1)):
+            self.assertEqual(check_habits(), 1)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Start Now")
+
+    def test_post_reminder_skipped_once_completed(self, send, messages):
+        now = timezone.localtime().replace(hour=0, minute=3)
+        HabitResponse.objects.create(habit=self.habit, date=now.date(), completed=True)
+        with patch('habits.notification_service.timezone.localtime', return_value=now):
+            check_habits()
+        send.assert_not_called()
+
+
+@patch('habits.notification_service.get_cached_messages', return_value={})
+@patch('habits.notification_service.send_notification')
+class ReminderSchedulerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('heap', password='pw')
+        self.habit = YesNoHabit.objects.create(
+            user=self.user, name="Journal", question="Journal?",
+            reminder_enabled=True, reminder_time=time(21, 0), minutes_before=10, minutes_after=10,
+        )
+        self.today = timezone.localdate()
+
+    def at(self, hour, minute, second=0):
+        return timezone.make_aware(datetime.combine(self.today, time(hour, minute, second)))
+
+    def test_sleeps_until_next_trigger_and_fires_on_time(self, send, messages):
+        scheduler = ReminderScheduler(reload_interval=None)
+        self.assertEqual(scheduler.load(self.at(20, 49, 30)), 3)
+        self.assertEqual(scheduler.seconds_until_next(self.at(20, 49, 30)), 30)
+
+        self.assertEqual(scheduler.run_pending(self.at(20, 49, 59)), 0)
+        self.assertEqual(scheduler.run_pending(self.at(20, 50)), 1)
+        self.assertEqual(send.call_args[0][0], "FlowMotion: Prep Time")
+        confirm_deliveries([make_notification("", "", deliveries=send.call_args.kwargs['deliveries'])])
+        scheduler.run_retries(self.at(20, 59, 30))
+        self.assertEqual(scheduler.seconds_until_next(self.at(20, 59, 30)), 30)
+
+    def test_changed_settings_are_loaded_incrementally(self, send, messages):
+        scheduler = ReminderScheduler(reload_interval=None)
+        scheduler.load(self.at(12, 55))
+        self.habit.reminder_time = time(13, 0)
+        self.habit.save(update_fields=['reminder_time'])
+        self.assertEqual(scheduler.load(self.at(12, 55)), 3)
+        self.assertEqual(scheduler.run_pending(self.at(13, 0)), 1)
+        self.assertEqual(scheduler.run_pending(self.at(13, 10)), 1)
+
+        # Entries of the replaced 21:00 triggers are dropped when they come due
+        self.assertEqual(scheduler.run_pending(self.at(21, 0)), 0)
+        self.assertEqual(send.call_count, 2)
+
+    def test_shards_partition_the_triggers_by_user(self, send, messages):
+        users = [User.objects.create_user(f'shard{n}', password='pw') for n in range(6)]
+        for user in users:
+            for i in range(5):
+                YesNoHabit.objects.create(
+                    user=user, name=f"Habit {i}", question="?", reminder_enabled=True, reminder_time=time(8, 0), minutes_before=0,
+                )
+        everything = set(ReminderTrigger.objects.values_list('id', flat=True))
+
+        slices = [set(shard_triggers(ReminderTrigger.objects.all(), shard, 3).values_list('id', flat=True)) for shard in range(3)]
+        self.assertEqual(set().union(*slices), everything)
+        self.assertEqual(sum(len(ids) for ids in slices), len(everything))
+        self.assertTrue(all(slices))
+        for user in users:
+            owned = set(ReminderTrigger.objects.filter(habit__user=user).values_list('id', flat=True))
+            self.assertEqual(sum(1 for ids in slices if owned & ids), 1)
+
+        # Every user's habits are in one shard, so each still gets a single digest
+        sent = 0
+        for shard in range(3):
+            scheduler = ReminderScheduler(reload_interval=None, queryset=shard_triggers(ReminderTrigger.objects.all(), shard, 3))
+            self.assertEqual(scheduler.load(self.at(7, 0)), len(slices[shard]))
+            sent += scheduler.run_pending(self.at(8, 0))
+        self.assertEqual(sent, 30)
+        self.assertEqual(send.call_count, len(users))
+
+    def test_late_entries_are_caught_up_within_the_limit(self, send, messages):
+        scheduler = ReminderScheduler(reload_interval=None)
+        scheduler.load(self.at(20, 0))
+        self.assertEqual(scheduler.run_pending(self.at(20, 55)), 1)
+        with self.assertLogs('habits.reminder_scheduler', 'WARNING'):
+            self.assertEqual(scheduler.run_pending(self.at(21, 45)), 0)
+        self.assertEqual(send.call_count, 1)
+
+    def test_restart_catches_up_without_resending(self, send, messages):
+        first = ReminderScheduler(reload_interval=None)
+        first.load(self.at(20, 45))
+        self.assertEqual(first.run_pending(self.at(20, 50)), 1)
+        confirm_deliveries([make_notification("", "", deliveries=send.call_args.kwargs['deliveries'])])
+
+        # A restarted scheduler queues the recent 20:50 entry again, but the ledger skips it
+        second = ReminderScheduler(reload_interval=None)
+        second.load(self.at(21, 5))
+        self.assertEqual(second.run_pending(self.at(21, 5)), 1)
+        self.assertEqual([call[0][0] for call in send.call_args_list], ["FlowMotion: Prep Time", "FlowMotion: Start Now"])
+
+    def test_unconfirmed_reminders_are_retried(self, send, messages):
+        scheduler = ReminderScheduler(reload_interval=None)
+        scheduler.load(self.at(20, 45))
+        self.assertEqual(scheduler.run_pending(self.at(20, 50)), 1)
+        self.assertEqual(scheduler.retry_unconfirmed(self.at(20, 51)), 0)
+        self.assertEqual(scheduler.retry_unconfirmed(self.at(20, 53)), 1)
+        confirm_deliveries([make_notification("", "", deliveries=send.call_args.kwargs['deliveries'])])
+        self.assertEqual(scheduler.retry_unconfirmed(self.at(20, 56)), 0)
+        self.assertEqual([call[0][0] for call in send.call_args_list], ["FlowMotion: Prep Time"] * 2)
+
+    def test_retries_wait_for_claims_to_expire(self, send, messages):
+        scheduler = ReminderScheduler(reload_interval=None)
+        scheduler.load(self.at(20, 45))
+        self.assertEqual(scheduler.run_pending(self.at(20, 50)), 1)
+        # Sleeps until the claim expires rather than until the 21:00 trigger
+        self.assertEqual(scheduler.seconds_until_next(self.at(20, 51)), 61)
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.run_retries(self.at(20, 51)), 0)
+        self.assertEqual(scheduler.run_retries(self.at(20, 52, 1)), 1)
+        confirm_deliveries([make_notification("", "", deliveries=send.call_args.kwargs['deliveries'])])
+        self.assertEqual(scheduler.run_retries(self.at(20, 55)), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.run_retries(self.at(20, 57)), 0)
+        self.assertEqual(scheduler.seconds_until_next(self.at(20, 57)), 180)
+
+
+class LeaderLeaseTest(TestCase):
+    def test_single_leader_with_failover(self):
+        now = timezone.now()
+        first = LeaderLease('reminders', ttl=15, holder='host-a')
+        second = LeaderLease('reminders', ttl=15, holder='host-b')
+
+        self.assertTrue(first.acquire(now))
+        self.assertFalse(second.acquire(now + timedelta(seconds=5)))
+        self.assertTrue(first.acquire(now + timedelta(seconds=5)))
+
+        # The leader stopped renewing: a standby takes over once the lease expires
+        self.assertFalse(second.acquire(now + timedelta(seconds=19)))
+        self.assertTrue(second.acquire(now + timedelta(seconds=21)))
+        self.assertFalse(first.acquire(now + timedelta(seconds=22)))
+
+    def test_release_hands_over_immediately(self):
+        first = LeaderLease('reminders', holder='host-a')
+        second = LeaderLease('reminders', holder='host-b')
+        self.assertTrue(first.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+
+
+class RecordingSink(Sink):
+    def __init__(self, name, delay=0, **options):
+        super().__init__(**options)
+        self.name = name
+        self.delay = delay
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def send_batch(self, notifications):
+        self.started.set()
+        if self.delay:
+            self.release.wait(self.delay)
+        self.batches.append([n['title'] for n in notifications])
+
+
+class DispatcherTest(TestCase):
+    def test_hung_sink_does_not_block_others(self):
+        hung = RecordingSink('hung', delay=10, queue_size=2)
+        fast = RecordingSink('fast', batch_size=50)
+        dispatcher = Dispatcher([hung, fast])
+        try:
+            dispatcher.submit(make_notification("n0", ""))
+            self.assertTrue(hung.started.wait(2))
+            for i in range(1, 5):
+                dispatcher.submit(make_notification(f"n{i}", ""))
+            dispatcher.queues['fast'].join()
+            self.assertEqual(sum(len(batch) for batch in fast.batches), 5)
+
+            # One taken by the hung worker and two queued; the rest were dropped, not waited on
+            metrics = dispatcher.metrics()
+            self.assertEqual(metrics['hung']['dropped'], 2)
+            self.assertEqual(metrics['fast']['sent'], 5)
+        finally:
+            hung.release.set()
+            dispatcher.close(timeout=2)
+        self.assertEqual(dispatcher.metrics()['hung']['sent'], 3)
+
+    def test_failures_are_counted(self):
+        class Broken(Sink):
+            name = 'broken'
+
+            def send_batch(self, notifications):
+                raise OSError("bus unavailable")
+
+        dispatcher = Dispatcher([Broken()])
+        with self.assertLogs('habits.dispatcher', 'ERROR'):
+            dispatcher.submit(make_notification("t", "m"))
+            self.assertTrue(dispatcher.flush(timeout=2))
+        dispatcher.close()
+        self.assertEqual(dispatcher.metrics()['broken']['failed'], 1)
+
+    def test_notify_send_failures_are_counted_per_notification(self):
+        outcomes = [None, subprocess.TimeoutExpired('notify-send', 5), OSError("no display")]
+        dispatcher = Dispatcher([NotifySendSink(batch_size=3)])
+        with patch('habits.dispatcher.subprocess.run', side_effect=outcomes), self.assertLogs('habits.dispatcher', 'WARNING'):
+            for i in range(3):
+                dispatcher.submit(make_notification(f"n{i}", ""))
+            self.assertTrue(dispatcher.flush(timeout=2))
+        dispatcher.close()
+        metrics = dispatcher.metrics()['notify-send']
+        self.assertEqual((metrics['sent'], metrics['failed']), (1, 2))
+
+    def test_log_and_inbox_sinks(self):
+        user = User.objects.create_user('inbox', password='pw')
+        notifications = [make_notification("Walk", "Time to walk", user_id=user.pk), make_notification("System", "no user")]
+
+        InboxSink().send_batch(notifications[:1])
+        self.assertEqual(list(InboxNotification.objects.values_list('title', flat=True)), ["Walk"])
+
+        # Notifications without a user are skipped by the inbox, not counted as sent
+        class RecordingInbox(InboxSink):
+            def send_batch(self, notifications):
+                pass
+
+        dispatcher = Dispatcher([RecordingInbox()])
+        for notification in notifications:
+            dispatcher.submit(notification)
+        self.assertTrue(dispatcher.flush(timeout=2))
+        dispatcher.close()
+        self.assertEqual(dispatcher.metrics()['inbox']['sent'], 1)
+        self.assertEqual(dispatcher.metrics()['inbox']['skipped'], 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notifications.log')
+            LogFileSink(path=path).send_batch(notifications)
+            with open(path) as f:
+                self.assertEqual([json.loads(line)['title'] for line in f], ["Walk", "System"])
+
+    def test_webhook_sink_posts_batches(self):
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            sink = WebhookSink(url=f'http://127.0.0.1:{server.server_port}/notify', timeout=2)
+            sink.send_batch([make_notification("a", ""), make_notification("b", "")])
+        finally:
+            server.shutdown()
+        self.assertEqual([[n['title'] for n in batch] for batch in received], [["a", "b"]])
+
+
+@patch('habits.message_cache.generate_notification_messages', side_effect=lambda name: {'on_time': f"Time for {name}"})
+class NotificationMessageCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cacheuser', password='password')
+        self.habits = [
+            YesNoHabit.objects.create(user=self.user, name=f"Habit {i}", question="?", reminder_enabled=True, reminder_time=time(8, 0))
+            for i in range(3)
+        ]
+
+    def test_messages_are_shared_and_regenerated_on_rename(self, mock_generate):
+        habit = self.habits[0]
+        self.assertEqual(get_cached_messages(habit), {'on_time': "Time for Habit 0"})
+        self.assertEqual(get_cached_messages(habit), {'on_time': "Time for Habit 0"})
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(NotificationMessageCache.objects.count(), 1)
+
+        habit.name = "Renamed"
+        self.assertEqual(get_cached_messages(habit), {'on_time': "Time for Renamed"})
+        self.assertEqual(mock_generate.call_count, 2)
+        self.assertEqual(NotificationMessageCache.objects.count(), 1)
+
+    def test_eviction_spares_today_and_tomorrow(self, mock_generate):
+        today = timezone.localdate()
+        with self.settings(NOTIFICATION_MESSAGE_CACHE_SIZE=3):
+            for offset, habit in enumerate(self.habits):
+                get_cached_messages(habit, today + timedelta(days=offset))
+            get_cached_messages(self.habits[0], today + timedelta(days=3))
+            # Misses no longer evict; the prewarm job enforces the bound
+            self.assertEqual(NotificationMessageCache.objects.count(), 4)
+
+            # Touching the third habit makes the day-3 row the least recently used
+            NotificationMessageCache.objects.filter(habit=self.habits[2]).update(last_used=timezone.now() + timedelta(minutes=1))
+            self.assertEqual(evict(), 1)
+        self.assertEqual(evict(limit=0), 1)
+        self.assertEqual(evict(limit=0), 0)
+        self.assertEqual(set(NotificationMessageCache.objects.values_list('date', flat=True)), {today, today + timedelta(days=1)})
+
+    def test_prewarm_fills_tomorrow_once(self, mock_generate):
+        self.habits[2].reminder_enabled = False
+        self.habits[2].save(update_fields=['reminder_enabled'])
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        NotificationMessageCache.objects.create(
+            habit=self.habits[0], date=timezone.localdate() - timedelta(days=1), habit_name="Habit 0", last_used=timezone.now(),
+        )
+
+        with patch('habits.message_cache.generate_notification_messages_batch',
+                   side_effect=lambda names: {name: {'on_time': name} for name in names}) as mock_batch:
+            self.assertEqual(prewarm_messages(), 2)
+            self.assertEqual(prewarm_messages(), 0)
+        self.assertEqual(mock_batch.call_args_list[0].args[0], ["Habit 0", "Habit 1"])
+        self.assertEqual(set(NotificationMessageCache.objects.values_list('date', flat=True)), {tomorrow})
+
+        self.assertEqual(get_cached_messages(self.habits[1], tomorrow), {'on_time': "Habit 1"})
+        mock_generate.assert_not_called()
@@ -0,0 +1,84 @@
+"""
+Minute-of-day reminder triggers.
+Every active, reminder-enabled habit has one ReminderTrigger row per
+notification kind (pre / main / post), kept in sync by signals.py, so a
+scheduler tick reads the rows for the current minute through an index
+instead of scanning every habit.
+"""
+from django.db import transaction
+from django.db.models.functions import Mod
+from .models import Habit, ReminderTrigger
+
+KINDS = ('pre', 'main', 'post')
+MINUTES_PER_DAY = 24 * 60
+# Triggers hash into this many buckets by the habit's owner, so all of a
+# user's reminders land in one shard and can be merged into one digest; a
+# worker shard owns every bucket congruent to its index modulo the shard count
+BUCKETS = 1024
+# Habit fields the trigger rows are derived from
+TRIGGER_FIELDS = {'status', 'reminder_enabled', 'reminder_time', 'minutes_before', 'minutes_after'}
+
+
+def trigger_minutes(habit):
+    """
+    Returns {kind: minute_of_day} for a habit, or {} when it has no
+    reminders. When two kinds fall on the same minute only the first is
+    kept, matching the precedence of reminder_utils.is_time_to_notify.
+    """
+    if habit.status != 'active' or not habit.reminder_enabled or not habit.reminder_time:
+        return {}
+    main = habit.reminder_time.hour * 60 + habit.reminder_time.minute
+    minutes = {}
+    for kind, minute in (
+        ('pre', main - habit.minutes_before),
+        ('main', main),
+        ('post', main + habit.minutes_after),
+    ):
+        minute %= MINUTES_PER_DAY
+        if minute not in minutes.values():
+            minutes[kind] = minute
+    return minutes
+
+
+def user_bucket(user_id):
+    """Stable bucket of a user id; ids are sequential, so users spread evenly."""
+    return user_id % BUCKETS
+
+
+def sync_triggers(habit):
+    """Replace the trigger rows of one habit."""
+    with transaction.atomic():
+        ReminderTrigger.objects.filter(habit_id=habit.pk).delete()
+        ReminderTrigger.objects.bulk_create(
+            ReminderTrigger(habit_id=habit.pk, kind=kind, minute=minute, bucket=user_bucket(habit.user_id))
+            for kind, minute in trigger_minutes(habit).items()
+        )
+
+
+def rebuild_triggers(batch_size=1000):
+    """Recreate every trigger row from the habits. Returns the number of rows written."""
+    habits = Habit.objects.filter(status='active', reminder_enabled=True, reminder_time__isnull=False).only(
+        'user_id', 'status', 'reminder_enabled', 'reminder_time', 'minutes_before', 'minutes_after'
+    )
+    with transaction.atomic():
+        ReminderTrigger.objects.all().delete()
+        rows = [
+            ReminderTrigger(habit_id=habit.pk, kind=kind, minute=minute, bucket=user_bucket(habit.user_id))
+            for habit in habits.iterator(chunk_size=batch_size)
+            for kind, minute in trigger_minutes(habit).items()
+        ]
+        ReminderTrigger.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def shard_triggers(queryset, shard=0, shards=1):
+    """Restrict a ReminderTrigger queryset to the users (and so habits) owned by one shard."""
+    if shards <= 1:
+        return queryset
+    return queryset.annotate(shard=Mod('bucket', shards)).filter(shard=shard)
+
+
+def due_triggers(minute, shard=0, shards=1, until=None):
+    """Trigger rows of a shard firing at `minute` (through `until`), with their habits loaded."""
+    rows = ReminderTrigger.objects.filter(minute__range=(minute, until if until is not None else minute))
+    return shard_triggers(rows, shard, shards).select_related('habit')
@@ -3,13 +3,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
-from datetime import date, timedelta
+from django.utils.dateparse import parse_date, parse_time
+from django.db import IntegrityError, transaction
+from django.views.decorators.http import condition
+from datetime import date
 from .models import Habit, YesNoHabit, MeasurableHabit, HabitResponse, StreakData, AIRecommendation, CountdownWidget
 
 @login_required
 def widgets_list(request):
     habits = Habit.objects.filter(user=request.user, widget_enabled=True)
-    countdown_widgets = CountdownWidget.objects.filter(user=request.user)
+    roll_forward_countdowns(CountdownWidget.objects.filter(user=request.user))
+    countdown_widgets = CountdownWidget.objects.filter(user=request.user).order_by('next_occurrence')
     return render(request, 'habits/widgets_list.html', {
         'habits': habits,
         'countdown_widgets': countdown_widgets
@@ -27,42 +31,60 @@ def create_habit_widget(request):
 @login_required
 def create_countdown_widget(request):
     if request.method == 'POST':
-        widget = CountdownWidget.objects.create(
+        widget = CountdownWidget(
             user=request.user,
             title=request.POST.get('title'),
-            target_date=request.POST.get('target_date'),
-            target_time=request.POST.get('target_time'),
+            target_date=parse_date(request.POST.get('target_date', '')),
+            target_time=parse_time(request.POST.get('target_time', '')),
             recurrence=request.POST.get('recurrence'),
-            notes=request.POST.get('notes')
+            notes=request.POST.get('notes', '')
         )
+        widget.next_occurrence = compute_next_occurrence(widget)
+        widget.save()
         return redirect('widgets_list')
     return render(request, 'habits/create_countdown_widget.html')
 
+def countdown_widget_etag(request, widget_id):
+    """
+    ETag from the widget row itself. A repeating countdown whose occurrence
+    has passed is re-rendered so it rolls forward; a passed one-off
+    countdown never changes again and keeps its ETag.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    row = CountdownWidget.objects.filter(id=widget_id, user=request.user).values_list(
+        'updated_at', 'next_occurrence', 'recurrence'
+    ).first()
+    if row is None:
+        return None
+    updated_at, next_occurrence, recurrence = row
+    if next_occurrence is None or (next_occurrence < timezone.now() and recurrence != 'none'):
+        return None
+    return make_etag(widget_id, updated_at.isoformat(), next_occurrence.isoformat(), request.META.get('CSRF_COOKIE', ''))
+
 @login_required
+@condition(etag_func=countdown_widget_etag)
 def view_countdown_widget(request, widget_id):
     widget = get_object_or_404(CountdownWidget, id=widget_id, user=request.user)
+    if widget.next_occurrence is None or widget.next_occurrence < timezone.now():
+        next_occurrence = compute_next_occurrence(widget)
+        if next_occurrence != widget.next_occurrence:
+            widget.next_occurrence = next_occurrence
+            widget.save(update_fields=['next_occurrence'])
     return render(request, 'habits/view_countdown_widget.html', {'widget': widget})
 from .ai_utils import get_habit_suggestions, get_emotional_feedback
 from services.ai_recommendation import get_ai_tool_recommendations
 from .notification_service import send_notification
-from .widget_utils import create_habit_widget_shortcut, check_widget_exists
+from .widget_utils import create_habit_widget_shortcut, check_widget_exists, compute_next_occurrence, roll_forward_countdowns
+from .statistics import attach_period_counts, get_dashboard_data, get_bulk_habit_statistics
+from .rollups import apply_response_change, response_state
+from .streaks import compute_habit_streak, recompute_streak
+from .api_cache import conditional_user_data, make_etag
 
 @login_required
 def dashboard(request):
-    habits = Habit.objects.filter(user=request.user, status='active')
     today = date.today()
-    
-    habits_data = []
-    for habit in habits:
-        response = HabitResponse.objects.filter(habit=habit, date=today).first()
-        streak, _ = StreakData.objects.get_or_create(habit=habit)
-        
-        habits_data.append({
-            'habit': habit,
-            'response': response,
-            'streak': streak,
-            'completed_today': response.completed if response else False,
-        })
+    habits_data = get_dashboard_data(request.user, today)
     
     context = {
         'habits_data': habits_data,
@@ -72,7 +94,7 @@ def dashboard(request):
 
 @login_required
 def habit_list(request):
-    habits = Habit.objects.filter(user=request.user)
+    habits = attach_period_counts(Habit.objects.filter(user=request.user))
     return render(request, 'habits/habit_list.html', {'habits': habits})
 
 @login_required
@@ -156,6 +178,7 @@ def habit_create(request):
     return render(request, 'habits/habit_create.html')
 
 @login_required
+@conditional_user_data(bucket=60, page=True)
 def habit_detail(request, habit_id):
     habit = get_object_or_404(Habit, id=habit_id, user=request.user)
     today = date.today()
@@ -177,7 +200,7 @@ def habit_detail(request, habit_id):
             print(f"Failed to auto-generate recommendations in detail view: {e}")
 
     responses = HabitResponse.objects.filter(habit=habit).order_by('-date')[:30]
-    streak, _ = StreakData.objects.get_or_create(habit=habit)
+    stats = get_bulk_habit_statistics([habit])[habit.id]
     today_response = HabitResponse.objects.filter(habit=habit, date=today).first()
     
     is_measurable = hasattr(habit, 'measurablehabit')
@@ -185,19 +208,15 @@ def habit_detail(request, habit_id):
     
     ai_recommendations = habit.ai_recommendations.all()
     
-    total_responses = HabitResponse.objects.filter(habit=habit).count()
-    completed_responses = HabitResponse.objects.filter(habit=habit, completed=True).count()
-    completion_rate = (completed_responses / total_responses * 100) if total_responses > 0 else 0
-    
     context = {
         'habit': habit,
         'responses': responses,
-        'streak': streak,
+        'streak': stats,
         'today_response': today_response,
         'is_measurable': is_measurable,
         'measurable_data': measurable_data,
         'ai_recommendations': ai_recommendations,
-        'completion_rate': round(completion_rate, 1),
+        'completion_rate': stats['completion_rate'],
         'is_widget_mode': is_widget_mode,
         'widget_exists': widget_exists,
         'start_date': habit.created_at.date().isoformat(),
@@ -216,7 +235,7 @@ def create_widget(request, habit_id):
     success, result = create_habit_widget_shortcut(habit, request)
     if success:
         habit.widget_enabled = True
-        habit.save()
+        habit.save(update_fields=['widget_enabled', 'updated_at'])
         messages.success(request, f"📌 Widget created for this habit!")
     else:
         messages.error(request, f"Could not create widget: {result}")
@@ -262,9 +281,9 @@ def habit_respond(request, habit_id):
         try:
             habit = get_object_or_404(Habit, id=habit_id, user=request.user)
             today = date.today()
-            response, created = HabitResponse.objects.get_or_create(
-                habit=habit, date=today, defaults={'completed': False}
-            )
+            response = HabitResponse.objects.filter(habit=habit, date=today).first()
+            if response is None:
+                response = HabitResponse(habit=habit, date=today, completed=False)
             
             if hasattr(habit, 'measurablehabit'):
                 value = request.POST.get('value', 0)
@@ -283,44 +302,57 @@ def habit_respond(request, habit_id):
             else:
                 response.completed = request.POST.get('completed') == 'yes'
             
-            streak, _ = StreakData.objects.get_or_create(habit=habit)
+            response.emotional_state = 'happy' if response.completed else 'neutral'
+
+            # The streak as it will be once this response is saved, so the
+            # feedback can be written with the response in a single save
+            completed_dates = list(
+                HabitResponse.objects.filter(habit=habit, completed=True).exclude(date=today)
+                .order_by('date').values_list('date', flat=True)
+            )
             if response.completed:
-                if streak.last_completed == today - timedelta(days=1):
-                    streak.current_streak += 1
-                elif streak.last_completed != today:
-                    streak.current_streak = 1
-                streak.last_completed = today
-                if streak.current_streak > streak.best_streak:
-                    streak.best_streak = streak.current_streak
-            else:
-                streak.current_streak = 0
-            streak.save()
+                completed_dates.append(today)
+                completed_dates.sort()
+            current_streak = compute_habit_streak(habit, completed_dates, today)[0]
 
             # Generate genuine emotional feedback via AI
             try:
-                feedback = get_emotional_feedback(habit.name, response.completed, streak.current_streak)
+                feedback = get_emotional_feedback(habit.name, response.completed, current_streak)
             except Exception:
                 feedback = "Great job!" if response.completed else "Keep going!"
-                
             response.feedback_message = feedback
+
+            with transaction.atomic():
+                # Lock today's row; a concurrent first check-in may have inserted it since the read above
+                current = HabitResponse.objects.select_for_update().filter(habit=habit, date=today).first()
+                if current is None:
+                    try:
+                        with transaction.atomic():
+                            response.save(force_insert=True)
+                    except IntegrityError:
+                        current = HabitResponse.objects.select_for_update().get(habit=habit, date=today)
+                previous_state = response_state(current) if current else None
+                if current is not None:
+                    for field in ('value', 'completed', 'emotional_state', 'feedback_text'):
+                        setattr(current, field, getattr(response, field))
+                    current.save()
+                    response = current
+                apply_response_change(habit.id, habit.user_id, today, previous_state, response_state(response))
+                streak = recompute_streak(habit, today, completed_dates)
             
             if response.completed:
-                response.emotional_state = 'happy'
                 # Reset acknowledgment when habit is completed
                 habit.acknowledged = True
-                habit.save()
+                habit.save(update_fields=['acknowledged', 'updated_at'])
                 # Send Linux desktop notification
                 try:
-                    send_notification("FlowMotion Reminder", feedback)
+                    send_notification("FlowMotion Reminder", feedback, user_id=request.user.id, habit_id=habit.id)
                 except Exception:
                     pass
                 messages.success(request, feedback)
             else:
-                response.emotional_state = 'neutral'
                 messages.info(request, feedback)
             
-            response.save()
-            
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.accepts('application/json'):
                 return JsonResponse({
                     'success': True, 
@@ -342,28 +374,16 @@ def habit_respond(request, habit_id):
 
 @login_required
 def history(request):
-    habits = Habit.objects.filter(user=request.user)
-    end_date = date.today()
-    start_date = end_date - timedelta(days=30)
-    responses = HabitResponse.objects.filter(habit__user=request.user, date__range=[start_date, end_date]).select_related('habit')
-    dates = []
-    current = start_date
-    while current <= end_date:
-        dates.append(current)
-        current += timedelta(days=1)
-    history_data = {}
-    for habit in habits:
-        history_data[habit.id] = {'habit': habit, 'dates': {d: None for d in dates}}
-    for response in responses:
-        if response.habit.id in history_data:
-            history_data[response.habit.id]['dates'][response.date] = response
-    return render(request, 'habits/history.html', {'history_data': history_data, 'dates': dates})
+    # The grid itself is fetched from /api/history/ and rendered client-side
+    has_habits = Habit.objects.filter(user=request.user).exists()
+    return render(request, 'habits/history.html', {'has_habits': has_habits})
 
 @login_required
 def settings_view(request):
     return render(request, 'habits/settings.html')
 
 @login_required
+@conditional_user_data(bucket=60, page=True)
 def widget_dashboard(request):
     now = timezone.now()
     next_habit = Habit.objects.filter(user=request.user, status='active', reminder_enabled=True, reminder_time__gte=now.time()).order_by('reminder_time').first()
@@ -387,7 +407,7 @@ def snooze_habit(request, habit_id):
 def acknowledge_habit(request, habit_id):
     habit = get_object_or_404(Habit, id=habit_id, user=request.user)
     habit.acknowledged = True
-    habit.save()
+    habit.save(update_fields=['acknowledged', 'updated_at'])
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
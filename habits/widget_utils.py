@@ -2,7 +2,11 @@ import os
 import re
 import platform
 from django.conf import settings
+from django.db.models import Q
 from django.urls import reverse
+from django.utils import timezone
+from .models import CountdownWidget
+from .schedule import get_next_occurrence
 
 
 def slugify_name(name):
@@ -83,6 +87,8 @@ def _create_linux_shortcut(desktop_path, slug, obj, widget_url):
         start_date = obj.created_at.date()
         days_passed = (today - start_date).days
         days_left = max(0, obj.duration - days_passed)
+    elif getattr(obj, 'next_occurrence', None):
+        days_left = (timezone.localtime(obj.next_occurrence).date() - timezone.localdate()).days
     elif hasattr(obj, 'target_date'):
         from datetime import date
         today = date.today()
@@ -131,3 +137,32 @@ def check_widget_exists(habit):
         file_name = f"flowmotion-{slug}.desktop"
 
     return os.path.exists(os.path.join(desktop_path, file_name))
+
+
+def compute_next_occurrence(widget, now=None):
+    """Next occurrence of a CountdownWidget as an aware datetime in the current timezone."""
+    if now is None:
+        now = timezone.localtime()
+    return get_next_occurrence(widget.target_date, widget.target_time, widget.recurrence, widget.selected_days, now)
+
+
+def roll_forward_countdowns(widgets=None, now=None):
+    """
+    Moves every repeating countdown whose next_occurrence has passed (or was
+    never computed) to its next occurrence, with one indexed query and one
+    bulk update. Returns the number of widgets updated.
+    """
+    if now is None:
+        now = timezone.localtime()
+    if widgets is None:
+        widgets = CountdownWidget.objects.all()
+
+    stale = list(
+        widgets.filter(Q(next_occurrence__lt=now) | Q(next_occurrence__isnull=True))
+        .exclude(recurrence='none', next_occurrence__isnull=False)
+        .only('target_date', 'target_time', 'recurrence', 'selected_days', 'next_occurrence')
+    )
+    for widget in stale:
+        widget.next_occurrence = compute_next_occurrence(widget, now)
+    CountdownWidget.objects.bulk_update(stale, ['next_occurrence'], batch_size=500)
+    return len(stale)
@@ -0,0 +1,190 @@
+"""
+Shared HTTP client for the AI providers (Gemini, Groq).
+All calls go through one keep-alive requests.Session, so repeated calls reuse
+TLS connections, and through a process-wide semaphore that caps how many AI
+calls run at once. Each endpoint has a circuit breaker: after a run of
+failed or slow calls (slow relative to the call's own timeout) it opens and further calls raise AIUnavailable at once,
+so callers drop to their fallbacks instead of waiting on a struggling
+provider. A web request gets a total time budget for all of its AI calls
+(see ai_deadline_middleware, which works under WSGI and ASGI); every call's
+timeout is cut to what is left.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5
+MAX_CONCURRENCY = 8
+# Total seconds of AI calls allowed while serving one web request
+REQUEST_BUDGET = 8
+# Consecutive failures that open a breaker, and how long it stays open
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30
+# Successful calls taking longer than this share of their timeout still
+# count as failures, so long batch calls with long timeouts are not "slow"
+SLOW_CALL_FRACTION = 0.8
+
+
+class AIUnavailable(Exception):
+    """Raised instead of calling the provider; callers use their fallbacks."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead; once the breaker has been open long enough one trial call is let through."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning(f"AI endpoint {self.name} unavailable; using fallbacks for {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCY))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCY))
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_semaphore = None
+_deadline = contextvars.ContextVar('ai_deadline', default=None)
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                failure_threshold=getattr(settings, 'AI_FAILURE_THRESHOLD', FAILURE_THRESHOLD),
+                reset_timeout=getattr(settings, 'AI_RESET_TIMEOUT', RESET_TIMEOUT),
+            )
+        return _breakers[endpoint]
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _get_semaphore():
+    global _semaphore
+    with _breakers_lock:
+        if _semaphore is None:
+            _semaphore = threading.BoundedSemaphore(getattr(settings, 'AI_MAX_CONCURRENCY', MAX_CONCURRENCY))
+        return _semaphore
+
+
+def remaining_budget():
+    """Seconds left in the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds):
+    """Limit the AI calls made inside the block to `seconds` in total. Nested deadlines never extend an outer one."""
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(end if outer is None else min(outer, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@sync_and_async_middleware
+def ai_deadline_middleware(get_response):
+    """Gives every web request settings.AI_REQUEST_BUDGET seconds of AI calls."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with deadline(getattr(settings, 'AI_REQUEST_BUDGET', REQUEST_BUDGET)):
+                return await get_response(request)
+    else:
+        def middleware(request):
+            with deadline(getattr(settings, 'AI_REQUEST_BUDGET', REQUEST_BUDGET)):
+                return get_response(request)
+    return middleware
+
+
+def post_json(endpoint, url, payload, headers=None, timeout=DEFAULT_TIMEOUT, retries=0):
+    """
+    POST `payload` as JSON and return the decoded reply. `endpoint` names the
+    circuit breaker (e.g. 'gemini'). Raises AIUnavailable when the breaker is
+    open or the deadline is spent, and the underlying error once `retries`
+    extra attempts have failed.
+    """
+    breaker = get_breaker(endpoint)
+    slow_call = timeout * getattr(settings, 'AI_SLOW_CALL_FRACTION', SLOW_CALL_FRACTION)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise AIUnavailable(f"{endpoint} circuit open")
+        call_timeout = timeout
+        remaining = remaining_budget()
+        if remaining is not None:
+            if remaining <= 0:
+                raise AIUnavailable(f"{endpoint} call skipped, request deadline spent")
+            call_timeout = min(timeout, remaining)
+
+        semaphore = _get_semaphore()
+        if not semaphore.acquire(timeout=call_timeout):
+            raise AIUnavailable(f"{endpoint} call skipped, too many AI calls in flight")
+        started = time.monotonic()
+        try:
+            response = session.post(url, json=payload, headers=headers, timeout=call_timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            attempt += 1
+            continue
+        finally:
+            semaphore.release()
+
+        if time.monotonic() - started > slow_call:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return data
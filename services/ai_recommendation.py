@@ -1,10 +1,12 @@
 import os
 import json
 import logging
-import requests
+from habits.ai_cache import cached_ai_response
+from .ai_client import post_json
 
 logger = logging.getLogger(__name__)
 
+@cached_ai_response('tool-recommendations', 'llama3-70b-8192', fallback=lambda task_name: get_fallback_tools())
 def get_ai_tool_recommendations(task_name):
     """
     Generate 3 AI tool recommendations for a given task using Groq API via REST.
@@ -52,9 +54,7 @@ Format:
 
     try:
         logger.info(f"Calling Groq API (REST) for task: {task_name}")
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = post_json('groq', url, payload, headers=headers)
 
         response_content = data['choices'][0]['message']['content'].strip()
         logger.info(f"Groq Raw Response: {response_content}")